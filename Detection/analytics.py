@@ -0,0 +1,222 @@
+"""
+Term-level attendance analytics
+Each day is reduced once to a rollup (student x session status codes and present seconds, stamped with
+the day's data version) and kept as a small .npz. A term is then a dense student x session matrix
+concatenated from its days' rollups, and every percentage is a vectorized reduction over it.
+"""
+
+import json
+import os
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+from storage import STATUSES, ALL_SESSIONS
+from report_cache import data_version
+
+PRESENT = STATUSES.index('Present')
+NOT_HELD = -1  # student not on that day's roster, or session not run
+
+
+class RollupStore:
+    """Per-day rollups as <directory>/<collection>.npz, rebuilt only when the day's data version changes"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, cn):
+        return os.path.join(self.directory, f"{cn}.npz")
+
+    def load(self, cn):
+        path = self._path(cn)
+        if not os.path.exists(path):
+            return None
+        return _load(path, os.path.getmtime(path))
+
+    def build(self, db, cn, version=None):
+        """Reduce day cn to its rollup and store it; returns the rollup, or None if the day is gone"""
+        doc = db.get_day_document(cn)
+        if not doc:
+            return None
+        sessions = [s for s in ALL_SESSIONS if s in doc['sessions']]
+        index, prns, names, rolls = {}, [], [], []
+        per_session = []
+        for sn in sessions:
+            stus = db.get_session_attendance(cn, sn)
+            for s in stus:
+                if s.get('prn_no', '') not in index:
+                    index[s.get('prn_no', '')] = len(prns)
+                    prns.append(s.get('prn_no', ''))
+                    names.append(s.get('name', ''))
+                    rolls.append(s.get('roll_no', ''))
+            per_session.append(stus)
+        status = np.full((len(prns), len(sessions)), NOT_HELD, dtype=np.int8)
+        seconds = np.zeros((len(prns), len(sessions)), dtype=np.int32)
+        for j, stus in enumerate(per_session):
+            if not stus:
+                continue
+            rows = np.fromiter((index[s.get('prn_no', '')] for s in stus), dtype=np.int64, count=len(stus))
+            status[rows, j] = [STATUSES.index(s['status']) if s.get('status') in STATUSES else STATUSES.index('Absent')
+                               for s in stus]
+            seconds[rows, j] = [(s.get('durations') or {}).get('total_present_seconds', 0) for s in stus]
+        if version is None:
+            version = data_version(db.get_day_versions(cn) or {})
+        meta = {'collection_name': cn, 'date': doc['date'], 'department': doc.get('department'),
+                'year': doc.get('year'), 'year_code': doc.get('year_code'), 'classroom': doc.get('classroom'),
+                'sessions': sessions, 'version': version, 'built_at': datetime.now().isoformat()}
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(cn)
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, meta=np.array(json.dumps(meta)), prn=np.array(prns, dtype=str),
+                            name=np.array(names, dtype=str), roll_no=np.array(rolls, dtype=str),
+                            status=status, seconds=seconds)
+        os.replace(tmp, path)
+        return self.load(cn)
+
+    def get(self, db, cn):
+        """The stored rollup of day cn, built on first use"""
+        r = self.load(cn)
+        return r if r is not None else self.build(db, cn)
+
+    def invalidate(self, cn):
+        """Drop day cn's rollup after a write; the next read or nightly refresh rebuilds it"""
+        try:
+            os.unlink(self._path(cn))
+        except FileNotFoundError:
+            pass
+
+    def refresh(self, db, days, on_rebuilt=None):
+        """
+        Incremental refresh over lecture_metadata rows days: only days that are new or whose data version
+        moved (including writes made by other processes) are rebuilt, and handed to on_rebuilt if given
+        """
+        rebuilt = 0
+        for d in days:
+            versions = db.get_day_versions(d['collection_name'])
+            if versions is None:
+                continue
+            version = data_version(versions)
+            r = self.load(d['collection_name'])
+            if r is None or r['meta']['version'] != version:
+                r = self.build(db, d['collection_name'], version)
+                rebuilt += 1
+                if on_rebuilt and r is not None:
+                    on_rebuilt(r)
+        return {'checked': len(days), 'rebuilt': rebuilt}
+
+
+@lru_cache(maxsize=512)
+def _load(path, mtime):
+    with np.load(path, allow_pickle=False) as z:
+        r = {k: z[k] for k in z.files}
+    r['meta'] = json.loads(r['meta'].item())
+    return r
+
+
+class TermMatrix:
+    """
+    Dense student x session matrix over a set of days.
+    status[i, j] is the STATUSES index of student i in session column j (NOT_HELD if it was not held
+    for them); seconds holds present seconds. columns[j] is (date, session, collection_name).
+    """
+
+    def __init__(self, rollups):
+        rollups = sorted(rollups, key=lambda r: (r['meta']['date'], r['meta']['collection_name']))
+        index, prns, names, rolls = {}, [], [], []
+        for r in rollups:
+            for p, n, ro in zip(r['prn'].tolist(), r['name'].tolist(), r['roll_no'].tolist()):
+                if p not in index:
+                    index[p] = len(prns)
+                    prns.append(p)
+                    names.append(n)
+                    rolls.append(ro)
+        width = sum(r['status'].shape[1] for r in rollups)
+        self.status = np.full((len(prns), width), NOT_HELD, dtype=np.int8)
+        self.seconds = np.zeros((len(prns), width), dtype=np.int32)
+        self.columns, self.days = [], []
+        col = 0
+        for r in rollups:
+            k = r['status'].shape[1]
+            if k and len(r['prn']):
+                rows = np.fromiter((index[p] for p in r['prn'].tolist()), dtype=np.int64, count=len(r['prn']))
+                self.status[rows, col:col + k] = r['status']
+                self.seconds[rows, col:col + k] = r['seconds']
+            m = r['meta']
+            self.columns += [(m['date'], sn, m['collection_name']) for sn in m['sessions']]
+            self.days.append(m)
+            col += k
+        self.prns = np.array(prns, dtype=str)
+        self.names, self.rolls = names, rolls
+        self.dates = np.array([c[0] for c in self.columns], dtype=str)
+        self.slots = np.array([c[1] for c in self.columns], dtype=str)
+
+    @property
+    def held(self):
+        return self.status != NOT_HELD
+
+    @property
+    def present(self):
+        return self.status == PRESENT
+
+    @staticmethod
+    def _pct(present, held):
+        return np.round(np.divide(present * 100.0, held, out=np.zeros(len(held)), where=held > 0), 2)
+
+    def _grouped(self, labels):
+        """(keys, present, held) over the column groups given by labels"""
+        keys, inverse = np.unique(labels, return_inverse=True)
+        present = np.bincount(inverse, weights=self.present.sum(axis=0), minlength=len(keys)).astype(np.int64)
+        held = np.bincount(inverse, weights=self.held.sum(axis=0), minlength=len(keys)).astype(np.int64)
+        return keys, present, held
+
+    def per_student(self):
+        present, held = self.present.sum(axis=1), self.held.sum(axis=1)
+        pct = self._pct(present, held)
+        return [{'prn_no': p, 'roll_no': r, 'name': n, 'present': int(a), 'held': int(h), 'percentage': float(x),
+                 'present_seconds': int(s)}
+                for p, r, n, a, h, x, s in zip(self.prns.tolist(), self.rolls, self.names, present.tolist(),
+                                               held.tolist(), pct.tolist(), self.seconds.sum(axis=1).tolist())]
+
+    def defaulters(self, threshold):
+        """
+        Students under threshold percent, worst first (then most sessions missed), each with the number of
+        consecutive sessions they would have to attend to get back to the threshold
+        """
+        present, held = self.present.sum(axis=1), self.held.sum(axis=1)
+        pct = self._pct(present, held)
+        idx = np.flatnonzero((pct < threshold) & (held > 0))
+        idx = idx[np.lexsort((self.prns[idx], -(held - present)[idx], pct[idx]))]
+        # smallest k with (present + k) / (held + k) >= threshold / 100; unreachable at 100%
+        need = np.ceil((threshold * held - 100.0 * present) / max(100.0 - threshold, 1e-9)).astype(np.int64) \
+            if threshold < 100 else np.full(len(held), -1)
+        prns = self.prns.tolist()
+        return [{'rank': k + 1, 'prn_no': prns[i], 'roll_no': self.rolls[i], 'name': self.names[i],
+                 'present': int(present[i]), 'held': int(held[i]), 'absent': int(held[i] - present[i]),
+                 'percentage': float(pct[i]), 'sessions_to_threshold': int(need[i])}
+                for k, i in enumerate(idx.tolist())]
+
+    def per_slot(self):
+        """By session slot (Session 1..8) across all days of the term"""
+        keys, present, held = self._grouped(self.slots)
+        order = sorted(range(len(keys)), key=lambda i: ALL_SESSIONS.index(keys[i]) if keys[i] in ALL_SESSIONS else 99)
+        pct = self._pct(present, held)
+        return [{'session': str(keys[i]), 'present': int(present[i]), 'held': int(held[i]),
+                 'percentage': float(pct[i])} for i in order]
+
+    def per_day(self):
+        keys, present, held = self._grouped(self.dates)
+        pct = self._pct(present, held)
+        return [{'date': str(k), 'present': int(a), 'held': int(h), 'percentage': float(x)}
+                for k, a, h, x in zip(keys.tolist(), present.tolist(), held.tolist(), pct.tolist())]
+
+    def summary(self):
+        present, held = int(self.present.sum()), int(self.held.sum())
+        return {'students': len(self.prns), 'sessions': len(self.columns), 'days': len(self.days),
+                'present': present, 'held': held,
+                'percentage': round(present * 100.0 / held, 2) if held else 0}
+
+
+def load_term(db, rollups, days):
+    """TermMatrix over lecture_metadata rows days, from their stored rollups"""
+    return TermMatrix([r for r in (rollups.get(db, d['collection_name']) for d in days) if r is not None])
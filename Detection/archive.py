@@ -0,0 +1,136 @@
+"""
+Cold archive of finished days: one compressed columnar .npz per daily collection
+A day is written once and never edited, so it is stored as flat NumPy columns (students, session rows,
+presence intervals) and rebuilt into the same document shape the hot collections have when read.
+"""
+
+import json
+import os
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+from storage import STATUSES
+
+FLAG_BITS = ['manual_override', 'is_temp_absent', 'is_perm_absent', 'using_roll_as_prn']
+DAY_FIELDS = ['date', 'department', 'year', 'year_code', 'classroom', 'teacher_name', 'camera_ids', 'metadata']
+SESSION_FIELDS = ['start_time', 'end_time', 'version', 'counts']
+
+
+def archive_path(directory, cn):
+    return os.path.join(directory, f"{cn}.npz")
+
+
+def _flag_bits(flags):
+    return sum(1 << i for i, f in enumerate(FLAG_BITS) if (flags or {}).get(f))
+
+
+def _flags(bits):
+    return {f: bool(bits >> i & 1) for i, f in enumerate(FLAG_BITS)}
+
+
+def _status_code(status):
+    return STATUSES.index(status) if status in STATUSES else STATUSES.index('Absent')
+
+
+def write_day(directory, cn, doc):
+    """Write day document doc as <directory>/<cn>.npz (atomically); returns (path, bytes)"""
+    roster = doc.get('roster') or {}
+    sessions = doc.get('sessions') or {}
+    sess_names = list(sessions)
+    prns = list(roster)
+    index = {p: i for i, p in enumerate(prns)}
+    info = {}
+    for sd in sessions.values():
+        for prn, stu in sd.get('students', {}).items():
+            if prn not in index:
+                index[prn] = len(prns)
+                prns.append(prn)
+            info.setdefault(prn, stu)
+    for prn, stu in roster.items():
+        info[prn] = stu
+
+    rows, lens, flat, legacy = [], [], [], {}
+    for si, sn in enumerate(sess_names):
+        for prn, stu in sessions[sn].get('students', {}).items():
+            ivs = stu.get('intervals')
+            if ivs is None or 'timestamps' in stu or 'durations' in stu:
+                # Records from before presence intervals keep their stored timing alongside
+                legacy[len(rows)] = {k: stu[k] for k in ('timestamps', 'durations') if k in stu}
+            rows.append((si, index[prn], _status_code(stu.get('status', 'Absent')), stu.get('version') or 0,
+                         stu.get('updated') or 0, _flag_bits(stu.get('flags'))))
+            lens.append(-1 if ivs is None else len(ivs))
+            flat.extend(ivs or ())
+    rows = np.array(rows, dtype=np.int64).reshape(-1, 6)
+
+    meta = {k: doc.get(k) for k in DAY_FIELDS}
+    meta['created_at'] = doc['created_at'].isoformat() if doc.get('created_at') else None
+    meta['sessions'] = [dict({k: sessions[sn][k] for k in SESSION_FIELDS if k in sessions[sn]}, name=sn)
+                        for sn in sess_names]
+    meta['legacy'] = legacy
+
+    os.makedirs(directory, exist_ok=True)
+    path = archive_path(directory, cn)
+    tmp = path + '.tmp.npz'
+    np.savez_compressed(
+        tmp, meta=np.array(json.dumps(meta, default=str)),
+        prn=np.array(prns, dtype=str), roll_no=np.array([info[p].get('roll_no', '') for p in prns], dtype=str),
+        name=np.array([info[p].get('name', '') for p in prns], dtype=str),
+        in_roster=np.array([p in roster for p in prns], dtype=bool),
+        student_flags=np.array([_flag_bits(info[p].get('flags')) for p in prns], dtype=np.uint8),
+        session=rows[:, 0].astype(np.int8), student=rows[:, 1].astype(np.int32),
+        status=rows[:, 2].astype(np.int8), version=rows[:, 3], updated=rows[:, 4],
+        flags=rows[:, 5].astype(np.uint8), iv_len=np.array(lens, dtype=np.int32),
+        intervals=np.array(flat, dtype=np.int64).reshape(-1, 2))
+    os.replace(tmp, path)
+    return path, os.path.getsize(path)
+
+
+@lru_cache(maxsize=64)
+def _columns(path, mtime):
+    with np.load(path, allow_pickle=False) as z:
+        cols = {k: z[k] for k in z.files}
+    cols['meta'] = json.loads(cols['meta'].item())
+    return cols
+
+
+def load_columns(path):
+    """The archive's raw columns (cached per file version); meta is decoded from JSON"""
+    return _columns(path, os.path.getmtime(path))
+
+
+def load_day(path, sessions=None):
+    """
+    Rebuild the day document stored at path, in the hot collection's shape.
+    sessions limits which sessions' students are rebuilt (all by default); the roster is always included.
+    """
+    c = load_columns(path)
+    meta = c['meta']
+    prn, roll, name = c['prn'].tolist(), c['roll_no'].tolist(), c['name'].tolist()
+    doc = {k: meta.get(k) for k in DAY_FIELDS}
+    doc['created_at'] = datetime.fromisoformat(meta['created_at']) if meta.get('created_at') else None
+    doc['roster'] = {prn[i]: {'prn_no': prn[i], 'roll_no': roll[i], 'name': name[i], 'status': 'Absent',
+                              'intervals': [], 'updated': None, 'flags': _flags(int(b))}
+                     for i, b in enumerate(c['student_flags'].tolist()) if c['in_roster'][i]}
+    names = [s['name'] for s in meta['sessions']]
+    wanted = {i for i, sn in enumerate(names) if sessions is None or sn in sessions}
+    doc['sessions'] = {s['name']: dict({k: s[k] for k in SESSION_FIELDS if k in s}, students={})
+                       for s in meta['sessions']}
+    ends = np.cumsum(np.maximum(c['iv_len'], 0))
+    starts = ends - np.maximum(c['iv_len'], 0)
+    ivs = c['intervals'].tolist()
+    legacy = meta.get('legacy', {})
+    cols = zip(c['session'].tolist(), c['student'].tolist(), c['status'].tolist(), c['version'].tolist(),
+               c['updated'].tolist(), c['flags'].tolist(), c['iv_len'].tolist(), starts.tolist(), ends.tolist())
+    for r, (si, st, code, ver, upd, bits, n, a, b) in enumerate(cols):
+        if si not in wanted:
+            continue
+        stu = {'prn_no': prn[st], 'roll_no': roll[st], 'name': name[st], 'status': STATUSES[code],
+               'flags': _flags(bits), 'version': ver}
+        if n >= 0:
+            stu['intervals'] = ivs[a:b]
+            stu['updated'] = upd or None
+        stu.update(legacy.get(str(r), {}))
+        doc['sessions'][names[si]]['students'][prn[st]] = stu
+    return doc
@@ -0,0 +1,159 @@
+"""
+ASGI variant of the attendance API (Starlette)
+Streaming and polling routes run natively on the event loop, with database calls on the thread pool;
+every other route is served by the Flask app mounted underneath, so JSON contracts stay identical.
+Use it when several viewers watch /api/video_feed: they share one capture and recognition loop, where
+the Flask app runs one per viewer. For event streams alone the threaded Flask app answers as well or better.
+Run: uvicorn asgi_app:app --port 5001   (or python asgi_app.py)
+"""
+
+import asyncio
+import contextlib
+import sqlite3
+import threading
+
+import cv2
+from pymongo.errors import PyMongoError
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import present_duration_added as server
+
+
+class FrameHub:
+    """One capture + recognition loop on a worker thread, fanned out to any number of async viewers"""
+
+    def __init__(self):
+        self.latest = None
+        self.viewers = 0
+        self.thread = None
+        self.loop = None
+        self.changed = None  # asyncio.Event swapped on every frame
+
+    def _capture(self):
+        cap = server.open_camera()
+        try:
+            while server.camera_running and self.viewers and cap.isOpened():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                a = server.attendance_system
+                if a:
+                    frame = a.process_frame(frame)
+                ok, buf = cv2.imencode('.jpg', frame)
+                if ok:
+                    self.loop.call_soon_threadsafe(self._publish, buf.tobytes())
+        except Exception as e:
+            print(f"Video error: {e}")
+        finally:
+            cap.release()
+            self.loop.call_soon_threadsafe(self._publish, None)
+
+    def _publish(self, jpeg):
+        self.latest = jpeg
+        ev, self.changed = self.changed, asyncio.Event()
+        ev.set()
+        if jpeg is None:
+            self.thread = None
+
+    async def frames(self):
+        self.loop = asyncio.get_running_loop()
+        if self.changed is None:
+            self.changed = asyncio.Event()
+        self.viewers += 1
+        try:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._capture, daemon=True)
+                self.thread.start()
+            while server.camera_running:
+                await self.changed.wait()
+                if self.latest is None:
+                    break
+                # A slow viewer simply skips to the newest frame instead of queueing old ones
+                yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + self.latest + b'\r\n'
+        finally:
+            self.viewers -= 1
+
+
+frame_hub = FrameHub()
+
+
+async def video_feed(request):
+    if not server.camera_running:
+        return JSONResponse({'error': 'Camera not running'}, status_code=400)
+    return StreamingResponse(frame_hub.frames(), media_type='multipart/x-mixed-replace; boundary=frame')
+
+
+async def live_event_stream(request):
+    return StreamingResponse(server.live_events.astream(server.current_session_snapshot),
+                             media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def current_session(request):
+    err = server.format_error('get_current_session_data', request.query_params.get('format'))
+    if err:
+        return JSONResponse({'success': False, 'error': err}, status_code=406)
+    try:
+        try:
+            since = int(request.query_params['since'])
+        except (KeyError, ValueError):
+            since = None
+        payload, etag = await run_in_threadpool(server.current_session_state, since,
+                                                request.headers.get('if-none-match'))
+        if payload is None:
+            return Response(status_code=304, headers={'ETag': etag})
+        if not payload['active']:
+            return JSONResponse(payload)
+        body, headers = await run_in_threadpool(server.encode_roster, payload, request.query_params.get('format'),
+                                                request.headers.get('accept-encoding', ''), 'attendance')
+        return Response(body, headers=dict(headers, ETag=etag))
+    except Exception as e:
+        print(f"Current session error: {e}")
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+
+def _ping():
+    try:
+        db = server.open_db()
+        db.ping()
+        db.close()
+        return True
+    except (PyMongoError, sqlite3.Error, OSError):
+        return False
+
+
+async def camera_status(request):
+    return JSONResponse(server.camera_status_payload())
+
+
+async def health(request):
+    dbc = await run_in_threadpool(_ping)
+    return JSONResponse({'status': 'healthy' if dbc else 'degraded', 'database': 'connected' if dbc else 'disconnected',
+                         'camera_status': 'running' if server.camera_running else 'stopped',
+                         'system_initialized': server.attendance_system is not None})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    asyncio.get_running_loop().run_in_executor(None, server.startup_maintenance)
+    threading.Thread(target=server.nightly_rollups, daemon=True).start()
+    yield
+
+
+app = Starlette(routes=[
+    Route('/api/video_feed', video_feed),
+    Route('/api/events', live_event_stream),
+    Route('/api/current-session', current_session),
+    Route('/api/camera/status', camera_status),
+    Route('/api/health', health),
+    Mount('/', WSGIMiddleware(server.app)),
+], lifespan=lifespan)
+
+if __name__ == '__main__':
+    import uvicorn
+    print("🚀 Starting ASGI server on http://localhost:5001")
+    uvicorn.run(app, host='0.0.0.0', port=5001)
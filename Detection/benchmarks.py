@@ -0,0 +1,324 @@
+"""
+Offline benchmarks for the attendance server
+Run: python benchmarks.py [name ...]   (no arguments runs all of them)
+"""
+
+import gzip
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import analytics
+import archive
+import bitmaps
+import intervals
+import wire_format
+from storage import SQLiteStore, STATUSES
+
+
+def _timeit(fn, repeat=50):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+
+def synthetic_session(n=300, seed=7):
+    rnd = random.Random(seed)
+    students = []
+    for i in range(n):
+        tp, ta = rnd.randint(0, 3600), rnd.randint(0, 600)
+        students.append({
+            'prn_no': f'1032{220000 + i}', 'roll_no': str(i + 1), 'name': f'Student Name {i + 1}',
+            'status': rnd.choice(STATUSES), 'version': rnd.randint(0, 40),
+            'timestamps': {'first_seen': '2025-01-15 09:0%d:12' % (i % 10), 'last_seen': '2025-01-15 09:58:40',
+                           'present_timer_start': None, 'absence_timer_start': None,
+                           'last_updated': '2025-01-15 09:58:40'},
+            'durations': {'total_present_seconds': tp, 'total_absent_seconds': ta,
+                          'total_present_human': f'{tp // 60} min {tp % 60} sec',
+                          'total_absent_human': f'{ta // 60} min {ta % 60} sec'},
+            'flags': {'manual_override': False, 'is_temp_absent': False, 'is_perm_absent': False,
+                      'using_roll_as_prn': False}})
+    return students
+
+
+def bench_encoding():
+    """Row vs columnar payload for a current-session response: size and serialize time"""
+    students = synthetic_session()
+    rows = {'success': True, 'active': True, 'attendance': students}
+    cols = {'success': True, 'active': True, 'attendance': wire_format.columnar(students, {'status': STATUSES})}
+    print(f"{'layout':<10}{'encoder':<10}{'bytes':>10}{'gzip':>10}{'ms':>8}{'gzip ms':>9}")
+    for layout, payload in (('rows', rows), ('columnar', cols)):
+        encoders = [('json', lambda p=payload: json.dumps(p, default=str).encode())]
+        if wire_format.orjson is not None:
+            encoders.append(('orjson', lambda p=payload: wire_format.dumps(p)))
+        for name, enc in encoders:
+            body = enc()
+            gz = gzip.compress(body, compresslevel=wire_format.GZIP_LEVEL)
+            ms = _timeit(enc)
+            gz_ms = _timeit(lambda: gzip.compress(enc(), compresslevel=wire_format.GZIP_LEVEL), repeat=20)
+            print(f"{layout:<10}{name:<10}{len(body):>10}{len(gz):>10}{ms:>8.2f}{gz_ms:>9.2f}")
+    t = _timeit(lambda: wire_format.columnar(students, {'status': STATUSES}))
+    print(f"columnar transform: {t:.2f} ms for {len(students)} students")
+    if wire_format.brotli is not None:
+        body = wire_format.dumps(cols)
+        br = wire_format.brotli.compress(body, quality=wire_format.BROTLI_QUALITY)
+        print(f"columnar brotli: {len(br)} bytes")
+
+
+def synthetic_roster(n=300):
+    """(students, counts) in the shape build_roster returns"""
+    students = {}
+    for s in synthetic_session(n):
+        students[s['prn_no']] = {k: s[k] for k in ('prn_no', 'roll_no', 'name', 'flags')}
+        students[s['prn_no']].update(status='Absent', intervals=[], updated=None)
+    return students, {'prn_count': n, 'roll_fallback_count': 0, 'skipped_count': 0}
+
+
+def bench_storage(days=20, students=300, rounds=20):
+    """Embedded backend on one node: day creation, recognition batches, manual updates and reads"""
+    rnd = random.Random(11)
+    roster = synthetic_roster(students)
+    prns = list(roster[0])
+    with tempfile.TemporaryDirectory() as d:
+        store = SQLiteStore(os.path.join(d, 'bench.db'))
+        t = time.perf_counter()
+        cns = [store.create_or_get_daily_collection('CSE', '2023', f'2025-01-{i + 1:02d}', 'A1', 'T', roster)
+               for i in range(days)]
+        print(f"create day: {(time.perf_counter() - t) / days * 1000:.2f} ms")
+
+        t = time.perf_counter()
+        for cn in cns:
+            store.ensure_session(cn, 'Session 1')
+        el = time.perf_counter() - t
+        print(f"materialize session: {el / days * 1000:.2f} ms ({days * students / el:,.0f} rows/s)")
+
+        writes, t = 0, time.perf_counter()
+        for cn in cns:
+            for _ in range(rounds):
+                batch = {p: {'status': rnd.choice(STATUSES)} for p in rnd.sample(prns, 30)}
+                writes += store.batch_update_attendance(cn, 'Session 1', batch)
+        el = time.perf_counter() - t
+        print(f"batch update (30 students): {el / (days * rounds) * 1000:.2f} ms ({writes / el:,.0f} student writes/s)")
+
+        n, t = 500, time.perf_counter()
+        for _ in range(n):
+            store.update_student_attendance(cns[-1], 'Session 1', rnd.choice(prns), rnd.choice(STATUSES), manual=True)
+        el = time.perf_counter() - t
+        print(f"single update: {el / n * 1000:.3f} ms ({n / el:,.0f} writes/s)")
+
+        for name, fn in (('summary', lambda: store.get_session_summary(cns[-1], 'Session 1')),
+                         ('session attendance', lambda: store.get_session_attendance(cns[-1], 'Session 1')),
+                         ('delta since v10', lambda: store.get_session_changes(cns[-1], 'Session 1', 10)),
+                         ('student history page', lambda: store.get_student_history(prns[7])),
+                         ('student statistics', lambda: store.get_student_statistics(prns[7])),
+                         ('collections page', lambda: store.get_all_daily_collections())):
+            print(f"{name}: {_timeit(fn, repeat=20):.3f} ms")
+        store.close()
+
+
+def bench_intervals(students=300):
+    """Deriving timestamps/durations for a roster from presence intervals, a present-at lookup and the minute raster"""
+    rnd = random.Random(3)
+    roster = []
+    for i in range(students):
+        t, ivs = 1736913600, []
+        for _ in range(rnd.randint(0, 8)):
+            t += rnd.randint(10, 300)
+            ivs.append([t, t + rnd.randint(5, 900)])
+            t = ivs[-1][1]
+        roster.append({'prn_no': str(i), 'status': rnd.choice(STATUSES), 'intervals': ivs, 'updated': t})
+    stored = len(json.dumps([s['intervals'] for s in roster]))
+    legacy = len(json.dumps([{'timestamps': s['timestamps'], 'durations': s['durations']}
+                             for s in synthetic_session(students)]))
+    print(f"stored presence bytes: intervals {stored}, legacy timestamps/durations {legacy}")
+    print(f"derive {students} students: {_timeit(lambda: intervals.derive_many(roster)):.2f} ms")
+    print(f"present at one instant: {_timeit(lambda: intervals.present_at(roster, 1736915000)):.3f} ms")
+    edges, raster = intervals.presence_raster(roster)
+    print(f"minute raster {raster.shape[0]} x {raster.shape[1]}: "
+          f"{_timeit(lambda: intervals.presence_raster(roster)):.2f} ms")
+
+
+def synthetic_day(students=300, sessions=8, seed=5):
+    """A finished day document in the hot collection's shape, every session run"""
+    rnd = random.Random(seed)
+    roster, counts = synthetic_roster(students)
+    day = {'date': '2025-01-15', 'department': 'CSE', 'year': '2023', 'year_code': 'TY', 'classroom': 'A1',
+           'teacher_name': 'T', 'camera_ids': [], 'created_at': datetime(2025, 1, 15, 8), 'roster': roster,
+           'sessions': {}, 'metadata': counts}
+    for k in range(sessions):
+        studs = {}
+        for prn, s in roster.items():
+            t, ivs = 1736913600 + k * 3600, []
+            for _ in range(rnd.randint(0, 6)):
+                t += rnd.randint(10, 300)
+                ivs.append([t, t + rnd.randint(5, 600)])
+                t = ivs[-1][1]
+            studs[prn] = dict(s, status=rnd.choice(STATUSES), intervals=ivs, updated=t, version=rnd.randint(1, 60))
+        day['sessions'][f'Session {k + 1}'] = {'start_time': None, 'end_time': None, 'version': 60,
+                                               'counts': dict.fromkeys(STATUSES, 0), 'students': studs}
+    return day
+
+
+def bench_archive():
+    """Cold archive of one finished day: size against the hot document, write and read times"""
+    day = synthetic_day()
+    with tempfile.TemporaryDirectory() as d:
+        path, size = archive.write_day(d, 'CSE_TY_2025-01-15', day)
+        print(f"hot document (JSON) {len(json.dumps(day, default=str))} bytes, archive {size} bytes")
+        print(f"write: {_timeit(lambda: archive.write_day(d, 'CSE_TY_2025-01-15', day), repeat=10):.2f} ms")
+        archive._columns.cache_clear()
+        t = time.perf_counter()
+        archive.load_columns(path)
+        print(f"first open: {(time.perf_counter() - t) * 1000:.2f} ms")
+        print(f"rebuild one session: {_timeit(lambda: archive.load_day(path, ['Session 1']), repeat=20):.2f} ms")
+        print(f"rebuild whole day: {_timeit(lambda: archive.load_day(path), repeat=20):.2f} ms")
+
+
+def synthetic_rollups(students=1000, days=100, sessions=6, seed=9):
+    """Per-day rollups in the shape analytics.RollupStore stores them"""
+    rnd = np.random.default_rng(seed)
+    prn = np.array([f'1032{220000 + i}' for i in range(students)])
+    out = []
+    for d in range(days):
+        status = rnd.choice(len(STATUSES), size=(students, sessions), p=[0.8, 0.05, 0.05, 0.1]).astype(np.int8)
+        out.append({'prn': prn, 'name': prn, 'roll_no': prn, 'status': status,
+                    'seconds': (status == 0).astype(np.int32) * 3000,
+                    'meta': {'collection_name': f'CSE_TY_{d}', 'date': f'2025-{1 + d // 28:02d}-{1 + d % 28:02d}',
+                             'sessions': [f'Session {k + 1}' for k in range(sessions)]}})
+    return out
+
+
+def bench_analytics(students=1000, days=100):
+    """A term for a department: matrix assembly from day rollups and the vectorized percentages"""
+    days_ = synthetic_rollups(students, days)
+    term = analytics.TermMatrix(days_)
+    print(f"matrix {term.status.shape[0]} students x {term.status.shape[1]} sessions, "
+          f"{term.status.nbytes + term.seconds.nbytes} bytes")
+    print(f"assemble: {_timeit(lambda: analytics.TermMatrix(days_), repeat=5):.1f} ms")
+    for name, fn in (('per student', term.per_student), ('per slot', term.per_slot), ('per day', term.per_day)):
+        print(f"{name}: {_timeit(fn, repeat=5):.1f} ms")
+
+
+def bench_bitmaps(students=5000, days=365, sessions=8):
+    """A campus-year of present/held bits: size, and the popcount and bitwise queries over it"""
+    rnd = np.random.default_rng(13)
+    bm = bitmaps.TermBitmaps()
+    roster = [(f'1032{220000 + i}', f'S{i}') for i in range(students)]
+    t = time.perf_counter()
+    for d in range(days):
+        for k in range(sessions):
+            bm.set_session(f'2025-{d:03d}', f'Session {k + 1}', roster, rnd.random(students) < 0.8)
+    el = time.perf_counter() - t
+    print(f"{students} students x {days * sessions} sessions: {bm.nbytes() / 1e6:.2f} MB in memory, "
+          f"{el / (days * sessions) * 1000:.2f} ms per closed session")
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'term.npz')
+        bm.save(path)
+        print(f"on disk: {os.path.getsize(path) / 1e6:.2f} MB, load {_timeit(lambda: bitmaps.TermBitmaps.load(path), 5):.1f} ms")
+    both = [('2025-010', 'Session 2'), ('2025-010', 'Session 3')]
+    for name, fn in (('percentages', bm.percentages), ('under 75%', lambda: bm.below(75)),
+                     ('present in both', lambda: bm.present_in(both)), ('streaks', bm.streaks)):
+        print(f"{name}: {_timeit(fn, repeat=5):.1f} ms")
+
+
+def _template(rows, cols, merges):
+    """A formatted attendance-style template sheet: banded styles, borders and merged session headers"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Sheet 1'
+    side = Side(style='thin')
+    fonts = [Font(bold=b, color=c) for b in (True, False) for c in ('000000', '4472C4', 'FF0000')]
+    fills = [PatternFill(start_color=c, fill_type='solid') for c in ('FFFFFF', 'D9E1F2', 'FCE4D6')]
+    for r in range(1, rows + 1):
+        for c in range(1, cols + 1):
+            cell = ws.cell(row=r, column=c, value=f'Session {r // 40 + 1}' if c == 1 and r % 40 == 1 else f'R{r}C{c}')
+            cell.font, cell.fill = fonts[(r + c) % len(fonts)], fills[r % len(fills)]
+            cell.border, cell.alignment = Border(left=side, right=side, top=side, bottom=side), Alignment(horizontal='center')
+    for k in range(merges):
+        r = 1 + (k * 3) % rows
+        ws.merge_cells(start_row=r, start_column=2 + k % (cols - 3), end_row=r, end_column=3 + k % (cols - 3))
+    return wb, ws
+
+
+def _saved_styles(wb):
+    """Size of the cellXfs table the workbook is written with (openpyxl only fills it in while saving)"""
+    wb.save(io.BytesIO())
+    return len(wb._cell_styles)
+
+
+def bench_sheet_clone(days=5):
+    """Creating the day's sheet from the template: copy_worksheet clone vs the cell-by-cell copy"""
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        print("openpyxl is not installed")
+        return
+    from openpyxl import load_workbook
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    sys.path.append(root)
+    import Excel_Format
+    book2 = os.path.join(root, 'Book2.xlsx')
+
+    def real():
+        wb = load_workbook(book2)
+        return wb, wb['Sheet1']
+
+    templates = [('Book2.xlsx Sheet1', real)] if os.path.exists(book2) else []
+    templates += [('large 2000 x 20, 300 merges', lambda: _template(2000, 20, 300))]
+    for label, template in templates:
+        for name, copy in (('cell by cell, new styles', lambda wb, ws, t: Excel_Format.copy_sheet_by_cell(wb, ws, t, False)),
+                           ('cell by cell, shared styles', Excel_Format.copy_sheet_by_cell),
+                           ('copy_worksheet clone', Excel_Format.clone_sheet)):
+            wb, ws = template()
+            styles = _saved_styles(wb)
+            t = time.perf_counter()
+            for d in range(days):
+                copy(wb, ws, f'2025-01-{d + 1:02d}')
+            el = (time.perf_counter() - t) / days * 1000
+            print(f"{label}, {name}: {el:.1f} ms per day, style table {styles} -> {_saved_styles(wb)}")
+
+
+def bench_startup(repeat=5):
+    """What a server pays at import, its session timetable, and what Excel_Format used to load up front"""
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+    def run(code):
+        best = float('inf')
+        for _ in range(repeat):
+            t = time.perf_counter()
+            proc = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True)
+            best = min(best, time.perf_counter() - t)
+        return best * 1000, proc.returncode == 0
+
+    base, _ = run('pass')
+    for label, code in (('import present_duration_added (whole server)',
+                         "import sys; sys.path.insert(0, 'Detection'); import present_duration_added"),
+                        ('import timetable', 'import timetable'),
+                        ('import Excel_Format (lazy workbook)', 'import Excel_Format'),
+                        ('import Excel_Format + load Book2.xlsx and today sheet',
+                         "import Excel_Format as E; E.AttendanceWorkbook('Book2.xlsx', 'Sheet1').today_sheet()")):
+        ms, ok = run(code)
+        print(f"{label}: {ms - base:.1f} ms over bare interpreter" if ok else f"{label}: failed (openpyxl missing?)")
+
+
+BENCHMARKS = {'encoding': bench_encoding, 'storage': bench_storage, 'intervals': bench_intervals,
+              'archive': bench_archive, 'analytics': bench_analytics, 'bitmaps': bench_bitmaps,
+              'sheet_clone': bench_sheet_clone, 'startup': bench_startup}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        print(f"\n== {name} ==")
+        BENCHMARKS[name]()
@@ -0,0 +1,241 @@
+"""
+Attendance bitmaps: per term, one bit per student per session for "present" and one for "held"
+Percentages are popcounts, "under X%" is a comparison over them, and questions about particular
+sessions are bitwise ANDs/ORs of their columns. A year of sessions for 5,000 students is a few MB.
+"""
+
+import json
+import os
+from threading import Lock
+
+import numpy as np
+
+from storage import STATUSES, ALL_SESSIONS, YEAR_MAPPING
+
+TERM_MONTHS = 6  # Jan-Jun is H1, Jul-Dec is H2
+# Set bits of every byte value, for NumPy before 2.0 (no np.bitwise_count)
+_BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1, dtype=np.int64)
+
+
+def popcount_rows(m):
+    """Set bits in each row of a uint8 matrix"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(m).sum(axis=1, dtype=np.int64)
+    return _BYTE_BITS[m].sum(axis=1)
+
+
+def term_of(date):
+    y, m = date[:4], int(date[5:7])
+    return f"{y}H{(m - 1) // TERM_MONTHS + 1}"
+
+
+def year_code(year):
+    """The year code for an admission year ('2023' -> 'TY'); codes pass through unchanged"""
+    return YEAR_MAPPING.get(str(year), year)
+
+
+class TermBitmaps:
+    """
+    present/held are (students, bytes) uint8 matrices; column c is bit 7 - c % 8 of byte c // 8
+    (np.packbits order). columns[c] is the (date, session) the bit stands for.
+    """
+
+    def __init__(self, prns=None, names=None, columns=None, present=None, held=None):
+        self.prns, self.names = list(prns or []), list(names or [])
+        self.rows = {p: i for i, p in enumerate(self.prns)}
+        self.columns = [tuple(c) for c in (columns or [])]
+        self.cols = {c: i for i, c in enumerate(self.columns)}
+        self.present = present if present is not None else np.zeros((0, 8), dtype=np.uint8)
+        self.held = held if held is not None else np.zeros((0, 8), dtype=np.uint8)
+
+    def _grow(self, rows, cols):
+        r, b = self.present.shape
+        need_b = (cols + 7) // 8
+        if rows <= r and need_b <= b:
+            return
+        nr, nb = max(rows, r), max(need_b, b * 2 if need_b > b else b)
+        for name in ('present', 'held'):
+            m = np.zeros((nr, nb), dtype=np.uint8)
+            m[:r, :b] = getattr(self, name)
+            setattr(self, name, m)
+
+    def _column(self, date, session):
+        key = (date, session)
+        if key not in self.cols:
+            self.cols[key] = len(self.columns)
+            self.columns.append(key)
+        return self.cols[key]
+
+    def _rows_for(self, students):
+        for prn, name in students:
+            if prn not in self.rows:
+                self.rows[prn] = len(self.prns)
+                self.prns.append(prn)
+                self.names.append(name)
+        return np.fromiter((self.rows[p] for p, _ in students), dtype=np.int64, count=len(students))
+
+    def set_session(self, date, session, students, present):
+        """
+        Record one held session: students is [(prn, name)], present a bool per student.
+        Re-recording a session replaces its column, so later corrections are picked up.
+        """
+        c = self._column(date, session)
+        rows = self._rows_for(students)
+        self._grow(len(self.prns), len(self.columns))
+        byte, bit = c // 8, np.uint8(1 << (7 - c % 8))
+        self.present[:, byte] &= ~bit
+        self.held[:, byte] &= ~bit
+        self.held[rows, byte] |= bit
+        self.present[rows[np.asarray(present, dtype=bool)], byte] |= bit
+
+    def _n(self):
+        return len(self.prns)
+
+    def counts(self):
+        """(present, held) session counts per student, by popcount"""
+        n = self._n()
+        return popcount_rows(self.present[:n]), popcount_rows(self.held[:n])
+
+    def percentages(self):
+        present, held = self.counts()
+        return present, held, np.round(np.divide(present * 100.0, held, out=np.zeros(len(held)), where=held > 0), 2)
+
+    def below(self, threshold):
+        """Students under threshold percent (of sessions held for them), lowest first"""
+        present, held, pct = self.percentages()
+        idx = np.flatnonzero((pct < threshold) & (held > 0))
+        idx = idx[np.lexsort((np.array(self.prns, dtype=str)[idx], pct[idx]))]
+        return [{'prn_no': self.prns[i], 'name': self.names[i], 'present': int(present[i]), 'held': int(held[i]),
+                 'percentage': float(pct[i])} for i in idx.tolist()]
+
+    def _order(self):
+        """Column indexes in chronological order (date, then session slot)"""
+        return sorted(range(len(self.columns)), key=lambda c: (
+            self.columns[c][0], ALL_SESSIONS.index(self.columns[c][1]) if self.columns[c][1] in ALL_SESSIONS else 99))
+
+    def _bit(self, matrix, c):
+        return (matrix[:self._n(), c // 8] >> (7 - c % 8) & 1).astype(bool)
+
+    def _unpacked(self, matrix):
+        """(columns, students) bools, one contiguous row per session"""
+        return np.unpackbits(np.ascontiguousarray(matrix[:self._n()].T), axis=0, count=len(self.columns)).view(bool)
+
+    def streaks(self):
+        """(longest, current) runs of consecutive absences per student, over the sessions held for them"""
+        n = self._n()
+        held, present = self._unpacked(self.held), self._unpacked(self.present)
+        longest, current = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+        for c in self._order():
+            # Sessions not held for a student neither extend nor end their run
+            current += held[c] & ~present[c]
+            current[present[c]] = 0
+            np.maximum(longest, current, out=longest)
+        return longest, current
+
+    def present_in(self, columns, mode='all'):
+        """Indexes of students present in all (or any) of the given (date, session) columns"""
+        n = self._n()
+        acc = np.ones(n, dtype=bool) if mode == 'all' else np.zeros(n, dtype=bool)
+        for key in columns:
+            c = self.cols.get(tuple(key))
+            hit = self._bit(self.present, c) if c is not None else np.zeros(n, dtype=bool)
+            acc = acc & hit if mode == 'all' else acc | hit
+        return np.flatnonzero(acc).tolist()
+
+    def snapshot(self):
+        """Independent copy trimmed to the recorded students and columns, safe to query while recording goes on"""
+        n, b = self._n(), (len(self.columns) + 7) // 8
+        return TermBitmaps(self.prns, self.names, self.columns, self.present[:n, :b].copy(), self.held[:n, :b].copy())
+
+    def nbytes(self):
+        n, b = self._n(), (len(self.columns) + 7) // 8
+        return 2 * n * b
+
+    def save(self, path):
+        n, b = self._n(), (len(self.columns) + 7) // 8
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, prn=np.array(self.prns, dtype=str), name=np.array(self.names, dtype=str),
+                            columns=np.array(json.dumps(self.columns)),
+                            present=self.present[:n, :b], held=self.held[:n, :b])
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z['prn'].tolist(), z['name'].tolist(), json.loads(z['columns'].item()),
+                       z['present'].copy(), z['held'].copy())
+
+
+class BitmapStore:
+    """TermBitmaps per (department, year code, term), kept in memory and saved as <directory>/<key>.npz"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.terms = {}
+        self.dirty = set()
+        self.lock = Lock()
+
+    @staticmethod
+    def key(department, year, term):
+        return f"{department}_{year_code(year)}_{term}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _get(self, key):
+        bm = self.terms.get(key)
+        if bm is None:
+            path = self._path(key)
+            bm = self.terms[key] = TermBitmaps.load(path) if os.path.exists(path) else TermBitmaps()
+        return bm
+
+    def get(self, department, year, term):
+        """
+        A snapshot of the term's bitmaps, taken under the store lock so that sessions being recorded meanwhile
+        never show up half-written (empty, and not kept, if nothing was recorded for the term)
+        """
+        key = self.key(department, year, term)
+        with self.lock:
+            if key in self.terms or os.path.exists(self._path(key)):
+                return self._get(key).snapshot()
+        return TermBitmaps()
+
+    def record(self, department, year, date, sessions, save=True):
+        """
+        sessions is {session: [(prn, name, status)]}; every session is written into its term's bitmaps.
+        With save=False the term is only marked dirty, for bulk loads that flush() once at the end.
+        """
+        key = self.key(department, year, term_of(date))
+        with self.lock:
+            bm = self._get(key)
+            for sn, rows in sessions.items():
+                bm.set_session(date, sn, [(p, n) for p, n, _ in rows], [s == 'Present' for _, _, s in rows])
+            self.dirty.add(key)
+        if save:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            for key in self.dirty:
+                self.terms[key].save(self._path(key))
+            self.dirty.clear()
+
+    def record_session(self, db, cn, sn):
+        """Write one closed session of day cn"""
+        doc = db.get_day_document(cn)
+        if not doc or sn not in doc['sessions']:
+            return
+        rows = [(s.get('prn_no', ''), s.get('name', ''), s.get('status', 'Absent'))
+                for s in db.get_session_attendance(cn, sn)]
+        self.record(doc['department'], doc.get('year_code') or doc.get('year'), doc['date'], {sn: rows})
+
+    def record_rollup(self, rollup, save=True):
+        """Write every session of an analytics day rollup (used by the nightly refresh and rebuilds)"""
+        m = rollup['meta']
+        prn, name = rollup['prn'].tolist(), rollup['name'].tolist()
+        sessions = {}
+        for j, sn in enumerate(m['sessions']):
+            col = rollup['status'][:, j]
+            sessions[sn] = [(prn[i], name[i], STATUSES[col[i]]) for i in np.flatnonzero(col >= 0).tolist()]
+        self.record(m['department'], m.get('year_code') or m.get('year'), m['date'], sessions, save)
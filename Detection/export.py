@@ -0,0 +1,177 @@
+"""
+Streaming multi-day export (CSV, write-only XLSX, Parquet)
+Rows are produced one session at a time and written out in chunks, so memory stays flat no matter
+how many days or students the requested range covers.
+"""
+
+import csv
+import io
+import os
+import tempfile
+
+from storage import ALL_SESSIONS
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_COLUMNS = ['date', 'department', 'classroom', 'teacher_name', 'session', 'prn_no', 'roll_no', 'name',
+                  'status', 'first_seen', 'last_seen', 'total_present_seconds', 'total_absent_seconds']
+CHUNK_BYTES = 64 * 1024
+PARQUET_ROW_GROUP = 50_000
+FORMATS = {'csv': ('text/csv', 'csv'),
+           'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+           'parquet': ('application/vnd.apache.parquet', 'parquet')}
+
+
+def available_formats():
+    """Formats whose writer library is installed"""
+    missing = {'xlsx': openpyxl is None, 'parquet': pyarrow is None}
+    return [f for f in FORMATS if not missing.get(f)]
+
+
+def iter_days(db, date_from=None, date_to=None, departments=None, years=None):
+    """
+    lecture_metadata rows of the days in range, oldest first (metadata only, so holding them is cheap).
+    years matches either the admission year or its year code (e.g. '2023' or 'TY').
+    """
+    days, after = [], None
+    while True:
+        page, after = db.get_all_daily_collections(limit=500, after=after, date_from=date_from, date_to=date_to,
+                                                   fields=['collection_name', 'date', 'department', 'year', 'year_code'])
+        days += [d for d in page if (not departments or d.get('department') in departments)
+                 and (not years or str(d.get('year')) in years or d.get('year_code') in years)]
+        if after is None:
+            break
+    return sorted(days, key=lambda d: (d.get('date') or '', d['collection_name']))
+
+
+def iter_rows(db, days):
+    """One tuple per student-session in EXPORT_COLUMNS order, fetched a session at a time"""
+    for d in days:
+        doc = db.get_day_document(d['collection_name'])
+        if not doc:
+            continue
+        for sn in ALL_SESSIONS:
+            if sn not in doc['sessions']:
+                continue
+            for s in db.get_session_attendance(d['collection_name'], sn):
+                ts, du = s.get('timestamps') or {}, s.get('durations') or {}
+                yield (doc['date'], doc['department'], doc['classroom'], doc['teacher_name'], sn,
+                       s.get('prn_no', ''), s.get('roll_no', ''), s.get('name', ''), s.get('status', 'Absent'),
+                       ts.get('first_seen'), ts.get('last_seen'),
+                       int(du.get('total_present_seconds', 0)), int(du.get('total_absent_seconds', 0)))
+
+
+def stream_csv(rows, columns=EXPORT_COLUMNS):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(columns)
+    for row in rows:
+        w.writerow(row)
+        if buf.tell() >= CHUNK_BYTES:
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode()
+
+
+def _stream_file(path):
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.unlink(path)
+
+
+def stream_xlsx(rows, columns=EXPORT_COLUMNS, title='Attendance'):
+    """
+    Write-only workbook: rows are spooled to openpyxl's temporary sheet files as they arrive, the zip is
+    assembled on disk and then sent in chunks
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    font, fill = Font(bold=True, color="FFFFFF"), PatternFill(start_color="4472C4", fill_type="solid")
+    header = []
+    for h in columns:
+        c = WriteOnlyCell(ws, h)
+        c.font, c.fill = font, fill
+        header.append(c)
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    wb.save(path)
+    yield from _stream_file(path)
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink whose bytes are handed back to the generator after each row group"""
+
+    def __init__(self):
+        self.parts, self.pos = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.parts.append(bytes(b))
+        self.pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.pos
+
+    def take(self):
+        out, self.parts = b''.join(self.parts), []
+        return out
+
+
+def stream_parquet(rows):
+    schema = pyarrow.schema([(c, pyarrow.int64() if c.startswith('total_') else pyarrow.string())
+                             for c in EXPORT_COLUMNS])
+    sink = _Drain()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    batch = []
+
+    def flush():
+        cols = list(zip(*batch))
+        writer.write_table(pyarrow.Table.from_arrays([pyarrow.array(c, type=f.type) for c, f in zip(cols, schema)],
+                                                     schema=schema))
+        batch.clear()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= PARQUET_ROW_GROUP:
+            flush()
+            yield sink.take()
+    if batch:
+        flush()
+    writer.close()
+    yield sink.take()
+
+
+WRITERS = {'csv': stream_csv, 'xlsx': stream_xlsx, 'parquet': stream_parquet}
+
+
+def stream_export(db, fmt, date_from=None, date_to=None, departments=None):
+    """Chunks of the export file; the db is closed once the last chunk has been produced"""
+    try:
+        yield from WRITERS[fmt](iter_rows(db, iter_days(db, date_from, date_to, departments)))
+    finally:
+        db.close()
@@ -0,0 +1,166 @@
+"""
+Presence intervals: each student-session stores [[start, end], ...] in epoch seconds
+Timestamps, durations and their human strings are derived on read, for a whole roster at once
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+MERGE_GAP_SECONDS = 5  # a return within this many seconds continues the previous interval
+
+
+def fmt_duration(sec):
+    s = int(sec)
+    if s < 60:
+        return f"{s} sec"
+    elif s < 3600:
+        return f"{s//60} min {s%60} sec"
+    else:
+        return f"{s//3600} hr {(s%3600)//60} min"
+
+
+def now_epoch():
+    return int(datetime.now().timestamp())
+
+
+def _local_strings(epochs):
+    """'%Y-%m-%d %H:%M:%S' local-time strings for an array of epoch seconds, in one NumPy pass"""
+    if not len(epochs):
+        return []
+    # One UTC offset for the batch: a roster's timestamps all fall within the same lecture
+    offset = int(datetime.fromtimestamp(int(epochs.max())).astimezone().utcoffset().total_seconds())
+    stamps = np.datetime_as_string((epochs + offset).astype('datetime64[s]'), unit='s')
+    return np.char.replace(stamps, 'T', ' ').tolist()
+
+
+def _open_present_span(stu, now):
+    """
+    Epoch start of a pre-interval record's running present timer, or None. Those records added a present
+    span to total_present_seconds only when it closed, so an open one is still uncounted.
+    """
+    start = (stu.get('timestamps') or {}).get('present_timer_start')
+    if not start:
+        return None
+    try:
+        start = start if isinstance(start, datetime) else datetime.strptime(start, '%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+    return min(int(start.timestamp()), now)
+
+
+def transition(stu, status, now, manual=False):
+    """
+    Move stu to status at epoch second now; returns (changes, student)
+    changes are dotted paths relative to the student, touching only the interval that moved
+    """
+    ivs = [list(iv) for iv in stu.get('intervals', [])]
+    was_present = stu.get('status', 'Absent') == 'Present'
+    if 'intervals' not in stu:
+        opened = _open_present_span(stu, now)
+        if opened is not None:
+            # Converted with its present timer running: that span becomes the first interval, closed below
+            ivs, was_present = [[opened, opened]], True
+    changes = {}
+    if status == 'Present':
+        if ivs and (was_present or now - ivs[-1][1] <= MERGE_GAP_SECONDS):
+            ivs[-1][1] = now
+            changes[f'intervals.{len(ivs) - 1}.1'] = now
+        else:
+            ivs.append([now, now])
+            changes[f'intervals.{len(ivs) - 1}'] = [now, now]
+    elif was_present and ivs:
+        ivs[-1][1] = now
+        changes[f'intervals.{len(ivs) - 1}.1'] = now
+    if 'intervals' not in stu:
+        # Record from before intervals existed: write the whole array so it is created as one
+        changes = {'intervals': ivs}
+    changes.update({'status': status, 'updated': now, 'flags.manual_override': manual})
+    student = dict(stu, status=status, intervals=ivs, updated=now,
+                   flags=dict(stu.get('flags', {}), manual_override=manual))
+    return changes, student
+
+
+def _arrays(students):
+    """(start, end, owner, lengths) over every interval of students"""
+    lens = np.fromiter((len(s.get('intervals') or ()) for s in students), dtype=np.int64, count=len(students))
+    flat = np.array([iv for s in students for iv in (s.get('intervals') or ())], dtype=np.int64).reshape(-1, 2)
+    owner = np.repeat(np.arange(len(students)), lens)
+    return flat[:, 0], flat[:, 1], owner, lens
+
+
+def derive_many(students):
+    """Students with timestamps and durations filled in from their intervals (legacy records pass through)"""
+    live = [i for i, s in enumerate(students) if 'intervals' in s]
+    out = list(students)
+    if not live:
+        return out
+    subset = [students[i] for i in live]
+    start, end, owner, lens = _arrays(subset)
+    n = len(subset)
+    present = np.bincount(owner, weights=end - start, minlength=n).astype(np.int64)
+    gaps = np.zeros(len(start), dtype=np.int64)
+    if len(start) > 1:
+        gaps[1:] = np.where(owner[1:] == owner[:-1], start[1:] - end[:-1], 0)
+    absent = np.bincount(owner, weights=gaps, minlength=n).astype(np.int64)
+    has = lens > 0
+    if len(start):
+        first_idx = np.minimum(np.cumsum(lens) - lens, len(start) - 1)
+        last_idx = np.maximum(np.cumsum(lens) - 1, 0)
+        first, last_start, last_end = start[first_idx], start[last_idx], end[last_idx]
+    else:
+        first = last_start = last_end = np.zeros(n, dtype=np.int64)
+    updated = np.array([students[i].get('updated') or 0 for i in live], dtype=np.int64)
+    first_s, last_start_s, last_end_s, updated_s = (
+        _local_strings(a) for a in (first, last_start, last_end, updated))
+    for j, i in enumerate(live):
+        s = students[i]
+        ts, du = s.get('timestamps') or {}, s.get('durations') or {}
+        tp = int(present[j]) + du.get('total_present_seconds', 0)
+        ta = int(absent[j]) + du.get('total_absent_seconds', 0)
+        is_present = s.get('status') == 'Present'
+        d = {k: v for k, v in s.items() if k not in ('intervals', 'updated')}
+        d['timestamps'] = {
+            'first_seen': first_s[j] if ts.get('first_seen') is None and has[j] else ts.get('first_seen'),
+            'last_seen': last_end_s[j][11:] if has[j] else ts.get('last_seen'),
+            'present_timer_start': last_start_s[j] if has[j] and is_present else None,
+            'absence_timer_start': last_end_s[j] if has[j] and not is_present else None,
+            'last_updated': updated_s[j] if s.get('updated') else ts.get('last_updated')}
+        d['durations'] = {'total_present_seconds': tp, 'total_absent_seconds': ta,
+                          'total_present_human': fmt_duration(tp), 'total_absent_human': fmt_duration(ta)}
+        out[i] = d
+    return out
+
+
+def derive(stu):
+    return derive_many([stu])[0]
+
+
+def presence_raster(students, start=None, end=None, step=60):
+    """
+    (edges, raster): raster[i, b] is how many seconds student i was present in [edges[b], edges[b + 1]).
+    The window defaults to the whole minutes spanned by the intervals. Each bin is the difference of the
+    cumulative present time at its two edges, evaluated for every interval against every edge at once.
+    """
+    n = len(students)
+    if not n:
+        return np.zeros(1, dtype=np.int64), np.zeros((0, 0), dtype=np.int32)
+    s, e, owner, _ = _arrays(students)
+    if start is None:
+        start = int(s.min()) // step * step if len(s) else 0
+    if end is None:
+        end = -(-int(e.max()) // step) * step if len(e) else start
+    edges = np.arange(start, max(end, start) + step, step, dtype=np.int64)
+    s, e = np.clip(s, start, end), np.clip(e, start, end)
+    # cumulative[i, k]: seconds student i was present before edges[k]
+    cumulative = np.zeros((n, len(edges)), dtype=np.int64)
+    np.add.at(cumulative, owner, np.clip(edges[None, :] - s[:, None], 0, (e - s)[:, None]))
+    return edges, np.diff(cumulative, axis=1).astype(np.int32)
+
+
+def present_at(students, epoch):
+    """Indexes of the students whose intervals cover epoch"""
+    if not students:
+        return []
+    start, end, owner, _ = _arrays(students)
+    return np.unique(owner[(start <= epoch) & (epoch <= end)]).tolist()
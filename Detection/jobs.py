@@ -0,0 +1,141 @@
+"""
+Background job queue for report generation
+A bounded thread pool runs jobs that write one artifact file each; clients poll the job and download
+the file once it is done. Finished jobs and their files are dropped after ttl_seconds; a job still
+running after timeout_seconds is marked failed (its thread cannot be stopped, so whatever it writes
+afterwards is discarded).
+"""
+
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+STATES = ('queued', 'running', 'done', 'failed')
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    __slots__ = ('id', 'kind', 'params', 'state', 'created', 'started', 'finished', 'path', 'mimetype',
+                 'filename', 'bytes', 'error')
+
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex
+        self.kind, self.params = kind, params
+        self.state = 'queued'
+        self.created, self.started, self.finished = time.time(), None, None
+        self.path = self.mimetype = self.filename = self.error = None
+        self.bytes = 0
+
+    def as_dict(self):
+        def ms(a, b):
+            return round((b - a) * 1000, 1) if a and b else None
+        return {'job_id': self.id, 'kind': self.kind, 'params': self.params, 'state': self.state,
+                'created_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.created)),
+                'wait_ms': ms(self.created, self.started or (time.time() if self.state == 'queued' else None)),
+                'run_ms': ms(self.started, self.finished or (time.time() if self.state == 'running' else None)),
+                'filename': self.filename, 'bytes': self.bytes, 'error': self.error}
+
+
+class JobQueue:
+    def __init__(self, directory, workers=2, max_pending=20, ttl_seconds=3600, timeout_seconds=600):
+        self.directory = directory
+        self.workers, self.max_pending, self.ttl = workers, max_pending, ttl_seconds
+        self.timeout = timeout_seconds
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-job')
+        self.jobs = OrderedDict()  # id -> Job, oldest first
+        self.timings = deque(maxlen=200)  # (wait, run) seconds of recently finished jobs
+        self.rejected = 0
+        self.lock = Lock()
+
+    def submit(self, kind, params, run):
+        """
+        Queue run(path) -> (mimetype, filename), which writes the artifact to path.
+        Raises QueueFull once max_pending jobs are waiting or running.
+        """
+        self._expire()
+        with self.lock:
+            self._time_out()
+            active = sum(j.state in ('queued', 'running') for j in self.jobs.values())
+            if active >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull(f'{active} report jobs already pending')
+            job = Job(kind, params)
+            self.jobs[job.id] = job
+        self.pool.submit(self._run, job, run)
+        return job
+
+    def _run(self, job, run):
+        with self.lock:
+            job.state, job.started = 'running', time.time()
+        path = os.path.join(self.directory, job.id)
+        error = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            mimetype, filename = run(path)
+        except Exception as e:
+            print(f"Report job {job.id} ({job.kind}) failed: {e}")
+            error = str(e)
+        with self.lock:
+            if job.state != 'running':  # timed out meanwhile; the artifact is no longer wanted
+                error = error or job.error
+            elif error is None:
+                job.mimetype, job.filename = mimetype, filename
+                job.path, job.bytes = path, os.path.getsize(path)
+                job.state, job.finished = 'done', time.time()
+            else:
+                job.error, job.state, job.finished = error, 'failed', time.time()
+            self.timings.append((job.started - job.created, time.time() - job.started))
+        if error is not None and os.path.exists(path):
+            os.unlink(path)
+
+    def _time_out(self):
+        """Fail running jobs past their deadline; call with the lock held"""
+        now = time.time()
+        for j in self.jobs.values():
+            if j.state == 'running' and now - j.started > self.timeout:
+                j.error, j.state, j.finished = f'timed out after {self.timeout}s', 'failed', now
+                print(f"Report job {j.id} ({j.kind}) timed out")
+
+    def get(self, job_id):
+        with self.lock:
+            self._time_out()
+            return self.jobs.get(job_id)
+
+    def recent(self, n=50):
+        """The n most recently submitted jobs, newest first"""
+        with self.lock:
+            self._time_out()
+            return list(self.jobs.values())[-n:][::-1]
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            old = [j for j in self.jobs.values() if j.finished and j.finished < cutoff]
+            for j in old:
+                del self.jobs[j.id]
+        for j in old:
+            if j.path and os.path.exists(j.path):
+                os.unlink(j.path)
+
+    def stats(self):
+        with self.lock:
+            self._time_out()
+            counts = dict.fromkeys(STATES, 0)
+            for j in self.jobs.values():
+                counts[j.state] += 1
+            waits = sorted(w for w, _ in self.timings)
+            runs = sorted(r for _, r in self.timings)
+
+        def pct(xs, p):
+            return round(xs[min(len(xs) - 1, int(len(xs) * p))] * 1000, 1) if xs else None
+        return {'workers': self.workers, 'max_pending': self.max_pending,
+                'queue_depth': counts['queued'], 'running': counts['running'],
+                'done': counts['done'], 'failed': counts['failed'], 'rejected': self.rejected,
+                'wait_ms_p50': pct(waits, 0.5), 'wait_ms_p95': pct(waits, 0.95),
+                'run_ms_p50': pct(runs, 0.5), 'run_ms_p95': pct(runs, 0.95)}
@@ -0,0 +1,118 @@
+"""
+Server-Sent Events broker for live attendance updates
+Publishers push status transitions; each dashboard connection gets its own bounded queue
+"""
+
+import asyncio
+import json
+import queue
+from threading import Lock
+
+HEARTBEAT_SECONDS = 15
+SUBSCRIBER_QUEUE_SIZE = 500
+
+
+class EventBroker:
+    def __init__(self):
+        self.subscribers = set()
+        self.async_subscribers = set()  # (event loop, asyncio.Queue) for ASGI connections
+        self.lock = Lock()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def subscribe_async(self):
+        sub = (asyncio.get_running_loop(), asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE))
+        with self.lock:
+            self.async_subscribers.add(sub)
+        return sub
+
+    def unsubscribe_async(self, sub):
+        with self.lock:
+            self.async_subscribers.discard(sub)
+
+    def publish(self, event_type, data):
+        with self.lock:
+            subs = list(self.subscribers)
+            async_subs = list(self.async_subscribers)
+        for q in subs:
+            try:
+                q.put_nowait((event_type, data))
+            except queue.Full:
+                # Client is not reading; tell it to resync instead of blocking the publisher
+                self._reset(q)
+        for loop, q in async_subs:
+            # Publishers run on worker threads; asyncio queues may only be touched from their own loop
+            try:
+                loop.call_soon_threadsafe(self._put_async, q, (event_type, data))
+            except RuntimeError:
+                self.unsubscribe_async((loop, q))  # loop already closed
+
+    def _put_async(self, q, item):
+        try:
+            q.put_nowait(item)
+        except asyncio.QueueFull:
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait(('resync', {}))
+
+    def _reset(self, q):
+        try:
+            while True:
+                q.get_nowait()
+        except queue.Empty:
+            pass
+        q.put_nowait(('resync', {}))
+
+    @property
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers) + len(self.async_subscribers)
+
+    @staticmethod
+    def format(event_type, data):
+        return f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+    def stream(self, snapshot):
+        """Generator for a Flask streaming response: one snapshot, then transitions as they happen"""
+        q = self.subscribe()
+        try:
+            yield self.format('snapshot', snapshot())
+            while True:
+                try:
+                    event_type, data = q.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event_type == 'resync':
+                    yield self.format('snapshot', snapshot())
+                else:
+                    yield self.format(event_type, data)
+        finally:
+            self.unsubscribe(q)
+
+    async def astream(self, snapshot):
+        """Async generator for ASGI responses; snapshot() hits the database, so it runs on an executor"""
+        loop = asyncio.get_running_loop()
+        sub = self.subscribe_async()
+        try:
+            yield self.format('snapshot', await loop.run_in_executor(None, snapshot))
+            while True:
+                try:
+                    event_type, data = await asyncio.wait_for(sub[1].get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                if event_type == 'resync':
+                    yield self.format('snapshot', await loop.run_in_executor(None, snapshot))
+                else:
+                    yield self.format(event_type, data)
+        finally:
+            self.unsubscribe_async(sub)
@@ -0,0 +1,130 @@
+"""
+Concurrent-client capacity of the Flask and ASGI servers
+Holds N long-lived streams open (SSE by default, like dashboard tabs) and measures whether
+ordinary JSON requests still get answered while they are held.
+Held streams are read as they arrive; with --window the frames each one received (MJPEG parts of
+/api/video_feed, or SSE events) are counted over that many seconds per step.
+Run against each server, e.g.
+    python load_test.py --url http://localhost:5000      (Flask)
+    python load_test.py --url http://localhost:5001      (ASGI)
+    python load_test.py --url http://localhost:5001 --stream /api/video_feed --steps 1,5,10 --window 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+# What ends one frame of a held stream, by its Content-Type: an MJPEG part boundary, an SSE event
+FRAME_MARKERS = {'multipart/x-mixed-replace': b'--frame\r\n', 'text/event-stream': b'\n\n'}
+
+
+async def _request(host, port, path, timeout, keep_open=False):
+    """(status, seconds to headers, (reader, writer, content type) or None); keep_open leaves the connection held"""
+    t = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: */*\r\n"
+                 f"Connection: {'keep-alive' if keep_open else 'close'}\r\n\r\n".encode())
+    await writer.drain()
+    line = await asyncio.wait_for(reader.readline(), timeout)
+    status = int(line.split()[1])
+    headers = (await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)).decode('latin-1').lower()
+    elapsed = time.perf_counter() - t
+    if keep_open:
+        ctype = next((h.split(':', 1)[1].split(';')[0].strip() for h in headers.split('\r\n')
+                      if h.startswith('content-type:')), '')
+        return status, elapsed, (reader, writer, ctype)
+    writer.close()
+    return status, elapsed, None
+
+
+class _Stream:
+    """A held stream, drained in the background so the server never blocks on it; counts frames received"""
+
+    def __init__(self, reader, writer, ctype):
+        self.writer, self.frames = writer, 0
+        self.task = asyncio.ensure_future(self._drain(reader, FRAME_MARKERS.get(ctype)))
+
+    async def _drain(self, reader, marker):
+        tail = b''
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                if marker is None:
+                    continue
+                buf = tail + data
+                self.frames += buf.count(marker)
+                tail = buf[-16:]
+                self.frames -= tail.count(marker)  # counted again with the next read
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+
+async def _open_stream(host, port, path, timeout):
+    try:
+        status, _, conn = await _request(host, port, path, timeout, keep_open=True)
+    except Exception:
+        return None
+    if status != 200:
+        conn[1].close()
+        return None
+    return _Stream(*conn)
+
+
+async def _probe(host, port, path, timeout):
+    try:
+        status, elapsed, _ = await _request(host, port, path, timeout)
+        return elapsed if status == 200 else None
+    except Exception:
+        return None
+
+
+async def run(url, stream_path, probe_path, steps, probes, timeout, window=0):
+    u = urlsplit(url)
+    host, port = u.hostname, u.port or 80
+    held = []
+    print(f"{'streams':>8}{'held':>6}{'probes ok':>11}{'p50 ms':>9}{'p95 ms':>9}"
+          + (f"{'frames/s min':>14}{'median':>8}{'total':>8}" if window else ''))
+    try:
+        for target in steps:
+            opened = await asyncio.gather(*(_open_stream(host, port, stream_path, timeout)
+                                            for _ in range(target - len(held))))
+            held += [st for st in opened if st]
+            lat = await asyncio.gather(*(_probe(host, port, probe_path, timeout) for _ in range(probes)))
+            ok = sorted(x * 1000 for x in lat if x is not None)
+            p50 = statistics.median(ok) if ok else float('nan')
+            p95 = ok[int(len(ok) * 0.95) - 1] if ok else float('nan')
+            line = f"{target:>8}{len(held):>6}{len(ok):>7}/{probes:<3}{p50:>9.1f}{p95:>9.1f}"
+            if window and held:
+                before = [st.frames for st in held]
+                await asyncio.sleep(window)
+                rates = sorted((st.frames - b) / window for st, b in zip(held, before))
+                line += f"{rates[0]:>14.1f}{statistics.median(rates):>8.1f}{sum(rates):>8.1f}"
+            print(line)
+            if not ok:
+                print("server stopped answering; capacity reached")
+                break
+    finally:
+        for st in held:
+            st.close()
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--url', default='http://localhost:5000')
+    ap.add_argument('--stream', default='/api/events', help='long-lived endpoint each client holds open')
+    ap.add_argument('--probe', default='/api/camera/status', help='JSON endpoint timed while streams are held')
+    ap.add_argument('--steps', default='10,25,50,100,200,400')
+    ap.add_argument('--probes', type=int, default=20)
+    ap.add_argument('--timeout', type=float, default=5.0)
+    ap.add_argument('--window', type=float, default=0, help='seconds to count frames received per step (0: skip)')
+    a = ap.parse_args()
+    asyncio.run(run(a.url, a.stream, a.probe, [int(x) for x in a.steps.split(',')], a.probes, a.timeout, a.window))
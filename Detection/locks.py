@@ -0,0 +1,73 @@
+"""
+Per-key locks with contention metrics
+Writers to one (collection, session) serialize in-process; different sessions never wait on each other
+"""
+
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+
+class KeyStats:
+    __slots__ = ('acquired', 'contended', 'wait_total', 'wait_max', 'hold_total', 'conflicts')
+
+    def __init__(self):
+        self.acquired = self.contended = self.conflicts = 0
+        self.wait_total = self.wait_max = self.hold_total = 0.0
+
+    def as_dict(self):
+        return {'acquired': self.acquired, 'contended': self.contended,
+                'wait_ms_total': round(self.wait_total * 1000, 3), 'wait_ms_max': round(self.wait_max * 1000, 3),
+                'wait_ms_avg': round(self.wait_total / self.acquired * 1000, 3) if self.acquired else 0,
+                'hold_ms_total': round(self.hold_total * 1000, 3), 'cas_conflicts': self.conflicts}
+
+
+class LockRegistry:
+    def __init__(self):
+        self.locks = {}
+        self.stats = {}
+        self.guard = Lock()  # only protects the two dicts above, never held while waiting
+
+    def _get(self, key):
+        with self.guard:
+            lock = self.locks.get(key)
+            if lock is None:
+                lock = self.locks[key] = Lock()
+                self.stats[key] = KeyStats()
+            return lock, self.stats[key]
+
+    @contextmanager
+    def hold(self, key):
+        lock, st = self._get(key)
+        t0 = time.perf_counter()
+        contended = not lock.acquire(blocking=False)
+        if contended:
+            lock.acquire()
+        t1 = time.perf_counter()
+        try:
+            yield
+        finally:
+            t2 = time.perf_counter()
+            lock.release()
+            # Stats are updated after release so bookkeeping never extends the critical section
+            with self.guard:
+                st.acquired += 1
+                st.contended += contended
+                st.wait_total += t1 - t0
+                st.wait_max = max(st.wait_max, t1 - t0)
+                st.hold_total += t2 - t1
+
+    def record_conflict(self, key):
+        self._get(key)
+        with self.guard:
+            self.stats[key].conflicts += 1
+
+    def snapshot(self):
+        with self.guard:
+            per_key = {':'.join(map(str, k)) if isinstance(k, tuple) else str(k): s.as_dict()
+                       for k, s in self.stats.items()}
+        totals = {'keys': len(per_key)}
+        for f in ('acquired', 'contended', 'cas_conflicts', 'wait_ms_total', 'hold_ms_total'):
+            totals[f] = round(sum(v[f] for v in per_key.values()), 3)
+        totals['wait_ms_max'] = max((v['wait_ms_max'] for v in per_key.values()), default=0)
+        return {'totals': totals, 'keys': per_key}
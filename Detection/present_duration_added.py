@@ -3,36 +3,77 @@ Complete Attendance System with PRN tracking, auto-detection, and web preview
 Save this as: attendance_system_complete.py
 """
 
-from flask import Flask, jsonify, request, render_template_string, Response, send_file
+from flask import Flask, jsonify, request, render_template_string, Response, send_file, stream_with_context
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timedelta
-import os, threading, cv2, numpy as np, face_recognition, sys, io, traceback
+import os, threading, cv2, numpy as np, face_recognition, sys, io, traceback, base64
 from time import sleep
 from threading import Lock, Event
-from openpyxl import load_workbook, Workbook
+from openpyxl import load_workbook
 from collections import defaultdict
 import time
-from openpyxl.styles import Font, PatternFill
+from bson.objectid import ObjectId
+from live_events import EventBroker
+from locks import LockRegistry
+import wire_format
+import export
+from report_cache import ReportCache, data_version
+from jobs import JobQueue, QueueFull
+from analytics import RollupStore, load_term
+from bitmaps import BitmapStore, term_of
+from storage import (AttendanceStore, SQLiteStore, YEAR_MAPPING, STATUSES,
+                     ALL_SESSIONS, DEFAULT_PAGE_SIZE, COLLECTION_FIELDS, HISTORY_FIELDS)
+from intervals import transition, derive_many, now_epoch, presence_raster
+import archive
 
-sys.path.append(os.path.abspath('../'))
-try:
-    from Excel_Format import get_current_session
-except:
-    def get_current_session():
-        h = datetime.now().hour
-        return f"Session {min(max((h - 9) + 1, 1), 8)}"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from timetable import get_current_session, session_bounds
 
 app = Flask(__name__)
 CORS(app)
 
 MONGODB_CONFIG = {'host': 'localhost', 'port': 27017, 'database': 'Attendance_system'}
+# ATTENDANCE_STORAGE=sqlite keeps everything in one local file, for offline classrooms and local runs
+STORAGE_CONFIG = {'backend': os.environ.get('ATTENDANCE_STORAGE', 'mongo'),
+                  'sqlite_path': os.environ.get('ATTENDANCE_SQLITE_PATH', 'attendance.db')}
+# Capture device index, or a video file or stream URL (e.g. rtsp://...) read instead of a local camera
+CAMERA_SOURCE = os.environ.get('ATTENDANCE_CAMERA', '0')
+# Days older than after_days are compacted into <dir>/<collection>.npz and their hot collection dropped.
+# A relative dir is taken from this file's directory, never the working directory. Only POST /api/archive
+# compacts, unless ATTENDANCE_ARCHIVE_ON_STARTUP=1 opts in to doing it on every server start.
+ARCHIVE_CONFIG = {'dir': os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      os.environ.get('ATTENDANCE_ARCHIVE_DIR', 'archive')),
+                  'after_days': int(os.environ.get('ATTENDANCE_ARCHIVE_AFTER_DAYS', 30)),
+                  'on_startup': os.environ.get('ATTENDANCE_ARCHIVE_ON_STARTUP') == '1'}
+REPORT_CACHE_CONFIG = {'dir': os.environ.get('ATTENDANCE_REPORT_CACHE_DIR', 'report_cache'),
+                       'memory_bytes': 64 << 20, 'disk_bytes': 1 << 30}
+# Range exports spanning more than sync_max_days (or open-ended) become jobs unless the client asks for ?async=0
+JOB_CONFIG = {'dir': os.environ.get('ATTENDANCE_JOB_DIR', 'report_jobs'), 'workers': 2, 'max_pending': 20,
+              'ttl_seconds': 3600, 'timeout_seconds': 600, 'sync_max_days': 31}
+# Per-day analytics rollups, refreshed incrementally every night at refresh_hour
+ANALYTICS_CONFIG = {'dir': os.environ.get('ATTENDANCE_ROLLUP_DIR', 'analytics_rollups'), 'refresh_hour': 2,
+                    'bitmap_dir': os.environ.get('ATTENDANCE_BITMAP_DIR', 'attendance_bitmaps')}
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 TEMPLATE_FILE = 'Book2.xlsx'
-ALL_SESSIONS = [f"Session {i}" for i in range(1, 9)]
-YEAR_MAPPING = {'2022': 'B.Tech', '2023': 'TY', '2024': 'SY', '2025': 'FY'}
+MAX_PAGE_SIZE = 500
 
 attendance_system = None
 camera_running = False
+known_collections = set()  # daily collections this process has already created or seen
+archived_days = {}  # collection -> archive path, for days whose hot collection has been dropped
+session_counts = {}  # (collection, session) -> (session version, status counters) last written or derived here
+live_events = EventBroker()
+session_locks = LockRegistry()  # (collection, session) -> writer lock shared by every DatabaseManager here
+identifier_index = {}  # (collection, session) -> read-only {ROLL/NAME: prn}, replaced wholesale, read without locks
+CAS_RETRIES = 5
+report_cache = ReportCache(REPORT_CACHE_CONFIG['dir'], REPORT_CACHE_CONFIG['memory_bytes'],
+                           REPORT_CACHE_CONFIG['disk_bytes'])
+rollups = RollupStore(ANALYTICS_CONFIG['dir'])
+attendance_bits = BitmapStore(ANALYTICS_CONFIG['bitmap_dir'])  # per-term present/held bits, fed as sessions close
+report_jobs = JobQueue(JOB_CONFIG['dir'], JOB_CONFIG['workers'], JOB_CONFIG['max_pending'], JOB_CONFIG['ttl_seconds'],
+                       JOB_CONFIG['timeout_seconds'])
 
 class FilePathResolver:
     @staticmethod
@@ -55,25 +96,81 @@ class FilePathResolver:
                     return os.path.abspath(p)
         raise FileNotFoundError(f"Training folder not found: {dept_year}/{mode_name}")
 
-class DatabaseManager:
-    def __init__(self, config):
-        self.config = config
-        self.client = None
-        self.db = None
-        self.lock = Lock()
-        self._init()
+class PageCursor:
+    """Opaque keyset cursor over (created_at, _id)"""
+    @staticmethod
+    def encode(doc):
+        raw = f"{doc['created_at'].isoformat()}|{doc['_id']}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
     
-    def _init(self):
-        self.client = MongoClient(self.config['host'], self.config['port'], serverSelectionTimeoutMS=5000)
-        self.db = self.client[self.config['database']]
+    @staticmethod
+    def decode(cursor):
         try:
-            self.db.lecture_metadata.create_index([('collection_name', 1)], unique=True)
-        except:
-            pass
-    
-    def _get_year_code(self, year):
-        return YEAR_MAPPING.get(str(year), 'B.Tech')
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            ts, oid = raw.split('|', 1)
+            return datetime.fromisoformat(ts), ObjectId(oid)
+        except Exception:
+            raise ValueError('Invalid cursor')
     
+    @staticmethod
+    def after(cursor, id_order=-1):
+        """Filter for documents after the cursor when sorted by created_at desc, _id in id_order"""
+        ts, oid = PageCursor.decode(cursor)
+        return {'$or': [{'created_at': {'$lt': ts}},
+                        {'created_at': ts, '_id': {'$lt' if id_order < 0 else '$gt': oid}}]}
+
+def page_args(args, allowed_fields):
+    """Parse limit/after/fields/from/to query parameters shared by the listing endpoints"""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    fields = [f.strip() for f in args.get('fields', '').split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed_fields]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return {'limit': max(1, min(limit, MAX_PAGE_SIZE)), 'after': args.get('after') or None,
+            'fields': fields or None, 'date_from': args.get('from') or None, 'date_to': args.get('to') or None}
+
+def date_filter(query, date_from=None, date_to=None):
+    if date_from or date_to:
+        query['date'] = {}
+        if date_from:
+            query['date']['$gte'] = date_from
+        if date_to:
+            query['date']['$lte'] = date_to
+    return query
+
+def encode_roster(payload, fmt, accept_encoding, rows_key=None, dicts=None):
+    """(body, headers): fast-serialized, compressed JSON; fmt='columnar' re-lays payload[rows_key] out as columns"""
+    if rows_key and fmt == 'columnar':
+        payload[rows_key] = wire_format.columnar(payload[rows_key], dicts or {'status': STATUSES})
+    return wire_format.encode(payload, accept_encoding)
+
+# ?format values an endpoint serves besides the JSON layouts
+FILE_FORMATS = {'defaulters': ('csv', 'xlsx'), 'export_range': tuple(export.FORMATS)}
+
+def format_error(endpoint, fmt):
+    """Why endpoint cannot answer ?format=fmt, or None when it can (or no format was asked for)"""
+    allowed = wire_format.LAYOUTS + FILE_FORMATS.get(endpoint, ())
+    if not fmt or fmt in allowed:
+        return None
+    return f"format must be one of {', '.join(allowed)}"
+
+@app.before_request
+def refuse_unknown_format():
+    """406 for a ?format the endpoint cannot produce, instead of silently sending JSON"""
+    err = format_error(request.endpoint, request.args.get('format'))
+    if err:
+        return jsonify({'success': False, 'error': err}), 406
+
+def roster_response(payload, rows_key=None, dicts=None):
+    body, headers = encode_roster(payload, request.args.get('format'), request.headers.get('Accept-Encoding', ''),
+                                  rows_key, dicts)
+    return Response(body, headers=headers)
+
+class RosterMixin:
+    """Excel roster loading, independent of where attendance is stored"""
     def load_students_from_excel(self, file, sheet):
         path = FilePathResolver.find_file(file)
         wb = load_workbook(path, data_only=True)
@@ -92,192 +189,437 @@ class DatabaseManager:
         wb.close()
         return headers, data
     
-    # Update the create_or_get_daily_collection method to handle PRN better
-    def create_or_get_daily_collection(self, dept, year, date, room, teacher, headers, data, cams=None):
-        yc = self._get_year_code(year)
-        cn = f"{dept}_{yc}_{date}"
-        with self.lock:
-            if cn in self.db.list_collection_names():
-                return cn
+    def build_roster(self, headers, data):
+        """Student template shared by every session of a day; returns (students, id_counts)"""
+        students = {}
+        counts = {'prn_count': 0, 'roll_fallback_count': 0, 'skipped_count': 0}
+        for row in data:
+            doc = {headers[i]: str(row[i]).strip() if i < len(row) and row[i] not in (None, '') else ''
+                for i in range(len(headers))}
             
-            col = self.db[cn]
-            ct = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            sessions = {}
+            # Extract PRN with multiple variations
+            prn = ''
+            for k, v in doc.items():
+                k_lower = str(k).strip().lower()
+                if k_lower in ['prn no.', 'prn no', 'prn_no', 'prn', 'prnno', 'prn number']:
+                    prn = str(v).strip()
+                    if prn:
+                        break
             
-            prn_count = 0
-            roll_fallback_count = 0
-            skipped_count = 0
+            # Extract Roll Number
+            roll_no = ''
+            for k, v in doc.items():
+                k_lower = str(k).strip().lower()
+                if k_lower in ['roll no.', 'roll no', 'roll_no', 'rollno', 'roll number']:
+                    roll_no = str(v).strip()
+                    if roll_no:
+                        break
             
-            for sn in ALL_SESSIONS:
-                students = {}
-                for row in data:
-                    doc = {headers[i]: str(row[i]).strip() if i < len(row) and row[i] not in (None, '') else ''
-                        for i in range(len(headers))}
-                    
-                    # Extract PRN with multiple variations
-                    prn = ''
-                    for k, v in doc.items():
-                        k_lower = str(k).strip().lower()
-                        if k_lower in ['prn no.', 'prn no', 'prn_no', 'prn', 'prnno', 'prn number']:
-                            prn = str(v).strip()
-                            if prn:
-                                break
-                    
-                    # Extract Roll Number
-                    roll_no = ''
-                    for k, v in doc.items():
-                        k_lower = str(k).strip().lower()
-                        if k_lower in ['roll no.', 'roll no', 'roll_no', 'rollno', 'roll number']:
-                            roll_no = str(v).strip()
-                            if roll_no:
-                                break
-                    
-                    # Determine identifier to use
-                    if prn:
-                        identifier = prn
-                        using_roll = False
-                        prn_count += 1
-                    elif roll_no:
-                        identifier = roll_no
-                        using_roll = True
-                        roll_fallback_count += 1
-                    else:
-                        skipped_count += 1
-                        print(f"⚠️  Skipping student - no PRN or Roll: {doc.get('Name', 'Unknown')}")
-                        continue
-                    
-                    students[identifier] = {
-                        'prn_no': prn if prn else roll_no,
-                        'roll_no': roll_no,
-                        'name': doc.get('Name', ''),
-                        'status': 'Absent',
-                        'timestamps': {
-                            'first_seen': None,
-                            'last_seen': None,
-                            'present_timer_start': None,
-                            'absence_timer_start': None,
-                            'last_updated': ct
-                        },
-                        'durations': {
-                            'total_present_seconds': 0,
-                            'total_absent_seconds': 0,
-                            'total_present_human': '0 sec',
-                            'total_absent_human': '0 sec'
-                        },
-                        'flags': {
-                            'manual_override': False,
-                            'is_temp_absent': False,
-                            'is_perm_absent': False,
-                            'using_roll_as_prn': using_roll
-                        }
-                    }
-                
-                sessions[sn] = {
-                    'start_time': None,
-                    'end_time': None,
-                    'students': students
-                }
+            # Determine identifier to use
+            if prn:
+                identifier = prn
+                using_roll = False
+                counts['prn_count'] += 1
+            elif roll_no:
+                identifier = roll_no
+                using_roll = True
+                counts['roll_fallback_count'] += 1
+            else:
+                counts['skipped_count'] += 1
+                print(f"⚠️  Skipping student - no PRN or Roll: {doc.get('Name', 'Unknown')}")
+                continue
             
-            print(f"\n📊 Collection Created: {cn}")
-            print(f"   ✅ Students with PRN: {prn_count}")
-            if roll_fallback_count > 0:
-                print(f"   ⚠️  Students using Roll as ID: {roll_fallback_count}")
-            if skipped_count > 0:
-                print(f"   ❌ Students skipped (no ID): {skipped_count}")
-            print(f"   📝 Total loaded: {len(sessions['Session 1']['students'])}\n")
+            students[identifier] = {
+                'prn_no': prn if prn else roll_no,
+                'roll_no': roll_no,
+                'name': doc.get('Name', ''),
+                'status': 'Absent',
+                'intervals': [],  # [[start, end], ...] epoch seconds; timestamps/durations derive from these
+                'updated': None,
+                'flags': {
+                    'manual_override': False,
+                    'is_temp_absent': False,
+                    'is_perm_absent': False,
+                    'using_roll_as_prn': using_roll
+                }
+            }
+        return students, counts
+
+def day_written(cn):
+    """Drop everything derived from day cn after a write to it"""
+    report_cache.invalidate(cn)
+    rollups.invalidate(cn)
+
+def archive_file(stored):
+    """
+    Resolve an archive entry's path: entries hold the file name under ARCHIVE_CONFIG['dir']; older ones hold
+    the path relative to the directory the server ran in, whose file name is kept
+    """
+    return stored if os.path.isabs(stored) else os.path.join(ARCHIVE_CONFIG['dir'], os.path.basename(stored))
+
+def live_session():
+    """(collection, session) the camera of this process is recording, or None"""
+    a = attendance_system
+    if a is None or not camera_running or a.current_collection is None:
+        return None
+    return a.current_collection, a.current_session
+
+class DatabaseManager(RosterMixin, AttendanceStore):
+    def __init__(self, config):
+        self.config = config
+        self.client = None
+        self.db = None
+        self._init()
+    
+    def _init(self):
+        self.client = MongoClient(self.config['host'], self.config['port'], serverSelectionTimeoutMS=5000)
+        self.db = self.client[self.config['database']]
+        try:
+            self.db.lecture_metadata.create_index([('collection_name', 1)], unique=True)
+            self.db.lecture_metadata.create_index([('created_at', -1), ('_id', -1)])
+            # One row per student-session of a day collection; the key once lacked collection_name, so two
+            # classes of the same department sharing a PRN on one date overwrote each other's row
+            if 'prn_no_1_date_1_session_1' in self.db.attendance_records.index_information():
+                self.db.attendance_records.drop_index('prn_no_1_date_1_session_1')
+            self.db.attendance_records.create_index([('collection_name', 1), ('session', 1), ('prn_no', 1)],
+                                                    unique=True)
+            for key in ('prn_no', 'roll_no_norm', 'name_norm'):
+                self.db.attendance_records.create_index([(key, 1), ('created_at', -1), ('_id', 1)])
+        except:
+            pass
+    
+    def _record_op(self, doc, cn, sn, stu):
+        """Upsert for the denormalized attendance_records row of one (derived) student-session"""
+        ts, du = stu.get('timestamps', {}), stu.get('durations', {})
+        tp = du.get('total_present_seconds', 0)
+        return UpdateOne(
+            {'collection_name': cn, 'session': sn, 'prn_no': stu.get('prn_no', '')},
+            {'$set': {
+                'date': doc['date'], 'department': doc.get('department', ''),
+                'classroom': doc.get('classroom', ''), 'year_code': doc.get('year_code', ''),
+                'roll_no': stu.get('roll_no', ''), 'roll_no_norm': self._norm(stu.get('roll_no')),
+                'name': stu.get('name', ''), 'name_norm': self._norm(stu.get('name')),
+                'status': stu.get('status', 'Absent'),
+                'first_seen': ts.get('first_seen'),
+                'last_seen': ts.get('last_seen'),
+                'total_present_seconds': int(tp), 'present_duration': self._fmt(tp),
+                'updated_at': datetime.now()},
+             '$setOnInsert': {'created_at': doc.get('created_at') or datetime.now()}},
+            upsert=True)
+    
+    def _write_records(self, ops):
+        if not ops:
+            return
+        try:
+            self.db.attendance_records.bulk_write(ops, ordered=False)
+        except Exception as e:
+            print(f"attendance_records write error: {e}")
+    
+    def backfill_attendance_records(self):
+        """Populate attendance_records from daily collections created before the store existed"""
+        metas = list(self.db.lecture_metadata.find({'records_backfilled': {'$ne': True}, 'archive': {'$exists': False}},
+                                                   {'collection_name': 1}))
+        total = 0
+        for m in metas:
+            cn = m['collection_name']
+            # Record upserts are idempotent, so this needs no lock against live writers
+            doc = self.db[cn].find_one({})
+            if doc:
+                ops = [self._record_op(doc, cn, sn, stu)
+                       for sn, sd in doc.get('sessions', {}).items()
+                       for stu in derive_many(list(sd.get('students', {}).values()))]
+                self._write_records(ops)
+                total += len(ops)
+            self.db.lecture_metadata.update_one({'_id': m['_id']}, {'$set': {'records_backfilled': True}})
+        if metas:
+            print(f"✅ Backfilled {total} attendance records from {len(metas)} collections")
+        return total
+    
+    def create_or_get_daily_collection(self, dept, year, date, room, teacher, roster, cams=None):
+        """Create the day's document with only the roster; sessions are added on first use.
+        Existence is decided by an upsert on lecture_metadata, never by listing collections."""
+        yc = self._get_year_code(year)
+        cn = f"{dept}_{yc}_{date}"
+        if cn in known_collections:
+            return cn
+        with session_locks.hold((cn,)):
+            now = datetime.now()
+            try:
+                res = self.db.lecture_metadata.update_one({'collection_name': cn}, {'$setOnInsert': {
+                    'collection_name': cn, 'date': date, 'department': dept, 'year': year,
+                    'year_code': yc, 'classroom': room, 'teacher_name': teacher,
+                    'created_at': now, 'records_backfilled': True
+                }}, upsert=True)
+                created = res.upserted_id is not None
+            except DuplicateKeyError:
+                created = False
+            if not created and self._archive_of(cn):
+                # Archived days are read-only; recreating the hot collection would shadow the archive
+                return cn
             
-            col.insert_one({
+            students, counts = roster
+            # Idempotent, so a metadata row left without its day document heals itself
+            self.db[cn].update_one({}, {'$setOnInsert': {
                 'date': date, 'department': dept, 'year': year, 'year_code': yc,
                 'classroom': room, 'teacher_name': teacher, 'camera_ids': cams or [],
-                'created_at': datetime.now(), 'sessions': sessions,
-                'metadata': {
-                    'prn_count': prn_count,
-                    'roll_fallback_count': roll_fallback_count,
-                    'skipped_count': skipped_count
-                }
-            })
-            
-            self.db.lecture_metadata.insert_one({
-                'collection_name': cn, 'date': date, 'department': dept, 'year': year,
-                'year_code': yc, 'classroom': room, 'teacher_name': teacher,
-                'created_at': datetime.now()
-            })
+                'created_at': now, 'roster': students, 'sessions': {},
+                'metadata': counts
+            }}, upsert=True)
+            known_collections.add(cn)
             
+            if created:
+                print(f"\n📊 Collection Created: {cn}")
+                print(f"   ✅ Students with PRN: {counts['prn_count']}")
+                if counts['roll_fallback_count'] > 0:
+                    print(f"   ⚠️  Students using Roll as ID: {counts['roll_fallback_count']}")
+                if counts['skipped_count'] > 0:
+                    print(f"   ❌ Students skipped (no ID): {counts['skipped_count']}")
+                print(f"   📝 Total loaded: {len(students)}\n")
             return cn
     
+    def _materialize_session(self, doc, cn, sn):
+        """Copy the roster into doc's session sn on its first use; returns False if it cannot exist"""
+        if sn in doc.get('sessions', {}):
+            return True
+        if doc.get('roster') is None or sn not in ALL_SESSIONS:
+            return False
+        now = now_epoch()
+        session = {'start_time': None, 'end_time': None, 'version': 0,
+                   'counts': dict(dict.fromkeys(STATUSES, 0), Absent=len(doc['roster'])),
+                   'students': {k: dict(v, updated=now) for k, v in doc['roster'].items()}}
+        res = self.db[cn].update_one({f'sessions.{sn}': {'$exists': False}}, {'$set': {f'sessions.{sn}': session}})
+        if res.modified_count:
+            self._write_records([self._record_op(doc, cn, sn, stu)
+                                 for stu in derive_many(list(session['students'].values()))])
+            doc.setdefault('sessions', {})[sn] = session
+            self._written(cn)
+        else:
+            # Another writer materialized it first
+            doc['sessions'] = self.db[cn].find_one({}, {'sessions': 1}).get('sessions', {})
+        return sn in doc['sessions']
+    
+    def _session_students(self, doc, sn):
+        """Students of a session, falling back to the untouched roster for sessions not yet run"""
+        if sn in doc.get('sessions', {}):
+            return doc['sessions'][sn]['students']
+        if sn in ALL_SESSIONS:
+            return doc.get('roster')
+        return None
+    
+    def _counts_of(self, doc, sn):
+        """Status counters stored with a session, derived in one pass for sessions that predate them"""
+        sd = doc.get('sessions', {}).get(sn)
+        if sd is not None and 'counts' in sd:
+            return dict(sd['counts'])
+        counts = dict.fromkeys(STATUSES, 0)
+        for stu in (self._session_students(doc, sn) or {}).values():
+            counts[stu.get('status', 'Absent')] = counts.get(stu.get('status', 'Absent'), 0) + 1
+        return counts
+    
+    def _apply_counts(self, doc, sn, transitions, update):
+        """Fold (old, new) status transitions into update as $inc; returns the resulting counters"""
+        inc = {}
+        for old, new in transitions:
+            if old != new:
+                inc[old] = inc.get(old, 0) - 1
+                inc[new] = inc.get(new, 0) + 1
+        counts = self._counts_of(doc, sn)
+        for k, v in inc.items():
+            counts[k] = counts.get(k, 0) + v
+        if 'counts' in doc['sessions'][sn]:
+            if any(inc.values()):
+                update.setdefault('$inc', {}).update({f'sessions.{sn}.counts.{k}': v for k, v in inc.items() if v})
+        else:
+            update['$set'][f'sessions.{sn}.counts'] = counts
+        return counts
+    
+    def _publish_transition(self, cn, sn, prn, student, counts):
+        live_events.publish('status', {'collection_name': cn, 'session_name': sn, 'prn_no': prn,
+                                       'version': student.get('version'), 'student': student,
+                                       'summary': self._summary(counts)})
+    
+    def _archive_of(self, cn):
+        path = archived_days.get(cn)
+        if path is None:
+            m = self.db.lecture_metadata.find_one({'collection_name': cn, 'archive': {'$exists': True}}, {'archive.path': 1})
+            if not m:
+                return None
+            path = archived_days[cn] = archive_file(m['archive']['path'])
+        return path
+    
+    @staticmethod
+    def _archive_matches(path, doc):
+        """Whether the archive at path loads back with doc's roster and every session's student statuses"""
+        try:
+            back = archive.load_day(path)
+        except Exception as e:
+            print(f"Archive check failed for {path}: {e}")
+            return False
+        statuses = lambda d: {sn: {p: stu.get('status', 'Absent') for p, stu in sd.get('students', {}).items()}
+                              for sn, sd in (d.get('sessions') or {}).items()}
+        return set(back['roster']) == set(doc.get('roster') or {}) and statuses(back) == statuses(doc)
+    
+    def _day(self, cn, projection=None, sessions=None):
+        """The day document from its hot collection, or rebuilt from the cold archive once that is dropped"""
+        doc = self.db[cn].find_one({}, projection)
+        if doc is None:
+            path = self._archive_of(cn)
+            if path:
+                doc = archive.load_day(path, sessions)
+        return doc
+    
+    def archive_days(self, older_than_days=None):
+        """
+        Compact every day older than older_than_days into the cold archive and drop its hot collection.
+        lecture_metadata keeps the day (with an archive entry), and attendance_records keeps its history rows.
+        """
+        days = ARCHIVE_CONFIG['after_days'] if older_than_days is None else older_than_days
+        cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        metas = list(self.db.lecture_metadata.find({'date': {'$lt': cutoff}, 'archive': {'$exists': False}},
+                                                   {'collection_name': 1, 'records_backfilled': 1}))
+        done, total = 0, 0
+        for m in metas:
+            cn = m['collection_name']
+            with session_locks.hold((cn,)):
+                doc = self.db[cn].find_one({})
+                if not doc:
+                    continue
+                if not m.get('records_backfilled'):
+                    self._write_records([self._record_op(doc, cn, sn, stu)
+                                         for sn, sd in doc.get('sessions', {}).items()
+                                         for stu in derive_many(list(sd.get('students', {}).values()))])
+                path, size = archive.write_day(ARCHIVE_CONFIG['dir'], cn, doc)
+                # The archive becomes the only copy, so it must read back before the hot collection goes
+                if not self._archive_matches(path, doc):
+                    print(f"Archive of {cn} did not read back; keeping its collection")
+                    os.remove(path)
+                    continue
+                # The index entry (a path under ARCHIVE_CONFIG['dir']) lands before the drop, so readers
+                # always find one of the two
+                self.db.lecture_metadata.update_one({'_id': m['_id']}, {'$set': {
+                    'records_backfilled': True,
+                    'archive': {'path': os.path.basename(path), 'bytes': size, 'archived_at': datetime.now(),
+                                'sessions': list(doc.get('sessions', {})), 'students': len(doc.get('roster') or {})}}})
+                archived_days[cn] = path
+                self.db[cn].drop()
+                known_collections.discard(cn)
+                for key in [k for k in identifier_index if k[0] == cn]:
+                    identifier_index.pop(key, None)
+            done += 1
+            total += size
+        if done:
+            print(f"🗄️  Archived {done} days ({total / 1024:.0f} KB) older than {cutoff}")
+        return {'archived': done, 'bytes': total, 'cutoff': cutoff}
+    
+    def _written(self, cn):
+        day_written(cn)
+    
+    def ping(self):
+        self.client.server_info()
+        return True
+    
+    def get_day_document(self, cn):
+        doc = self.db[cn].find_one({}, {'roster': 0, 'sessions': 0})
+        if not doc:
+            path = self._archive_of(cn)
+            if not path:
+                return None
+            meta = archive.load_columns(path)['meta']
+            doc = {k: meta.get(k) for k in archive.DAY_FIELDS}
+            return dict(doc, collection_name=cn, archived=True,
+                        sessions=[s for s in ALL_SESSIONS if s in {x['name'] for x in meta['sessions']}])
+        sessions = (self.db[cn].find_one({}, {f'sessions.{s}.start_time': 1 for s in ALL_SESSIONS}) or {}).get('sessions', {})
+        doc.pop('_id', None)
+        return dict(doc, collection_name=cn, sessions=[s for s in ALL_SESSIONS if s in sessions])
+    
+    def ensure_session(self, cn, sn):
+        with session_locks.hold((cn, sn)):
+            doc = self.db[cn].find_one({})
+            return bool(doc) and self._materialize_session(doc, cn, sn)
+    
     def find_prn_by_identifier(self, cn, sn, ident):
-        with self.lock:
+        index = identifier_index.get((cn, sn))
+        if index is None:
+            doc = self._day(cn, {'roster': 1, f'sessions.{sn}.students': 1}, [sn])
+            stus = self._session_students(doc, sn) if doc else None
+            if not stus:
+                return None
+            index = {}
+            for prn, stu in stus.items():
+                for key in (stu.get('name', ''), stu.get('roll_no', '')):
+                    if key:
+                        index[key.upper()] = prn
+            identifier_index[(cn, sn)] = index
+        return index.get(ident.upper())
+    
+    def _write_session(self, cn, sn, build, materialize=True):
+        """
+        Read-modify-write of session sn, committed only if its version is unchanged since the read.
+        build(doc) returns (update, result) or None to abort; a concurrent write from another
+        instance or process makes the update match nothing, and the whole step is retried.
+        Returns (doc, result) or None.
+        """
+        path = f'sessions.{sn}.version'
+        for _ in range(CAS_RETRIES):
             doc = self.db[cn].find_one({})
-            if not doc or sn not in doc.get('sessions', {}):
+            if not doc or not (self._materialize_session(doc, cn, sn) if materialize
+                               else sn in doc.get('sessions', {})):
                 return None
-            for prn, stu in doc['sessions'][sn]['students'].items():
-                if stu.get('roll_no', '').upper() == ident.upper() or stu.get('name', '').upper() == ident.upper():
-                    return prn
-            return None
+            built = build(doc)
+            if built is None:
+                return None
+            update, result = built
+            seen = doc['sessions'][sn].get('version')
+            guard = {path: seen} if seen is not None else {path: {'$exists': False}}
+            if self.db[cn].update_one(guard, update).matched_count:
+                return doc, result
+            session_locks.record_conflict((cn, sn))
+        print(f"⚠️  {cn}/{sn}: gave up after {CAS_RETRIES} concurrent write conflicts")
+        return None
     
     def update_student_attendance(self, cn, sn, prn, status, manual=False):
-        with self.lock:
-            doc = self.db[cn].find_one({})
-            if not doc or sn not in doc.get('sessions', {}) or prn not in doc['sessions'][sn]['students']:
-                return False
+        def build(doc):
+            if prn not in doc['sessions'][sn]['students']:
+                return None
             sp = f'sessions.{sn}.students.{prn}'
             stu = doc['sessions'][sn]['students'][prn]
-            ct = datetime.now()
-            cts = ct.strftime('%Y-%m-%d %H:%M:%S')
+            now = now_epoch()
             ps = stu.get('status', 'Absent')
-            pstart = stu['timestamps'].get('present_timer_start')
-            astart = stu['timestamps'].get('absence_timer_start')
-            tp = stu['durations'].get('total_present_seconds', 0)
-            ta = stu['durations'].get('total_absent_seconds', 0)
-            upd = {}
-            if ps == 'Present' and status != 'Present':
-                if pstart:
-                    try:
-                        tp += (ct - datetime.strptime(pstart, '%Y-%m-%d %H:%M:%S')).total_seconds()
-                    except:
-                        pass
-                upd[f'{sp}.timestamps.present_timer_start'] = None
-                upd[f'{sp}.timestamps.absence_timer_start'] = cts
-            elif ps != 'Present' and status == 'Present':
-                if astart:
-                    try:
-                        ta += (ct - datetime.strptime(astart, '%Y-%m-%d %H:%M:%S')).total_seconds()
-                    except:
-                        pass
-                upd[f'{sp}.timestamps.absence_timer_start'] = None
-                upd[f'{sp}.timestamps.present_timer_start'] = cts
-            elif status == 'Present' and not pstart:
-                upd[f'{sp}.timestamps.present_timer_start'] = cts
-            elif status != 'Present' and not astart:
-                upd[f'{sp}.timestamps.absence_timer_start'] = cts
-            upd[f'{sp}.status'] = status
-            upd[f'{sp}.timestamps.last_updated'] = cts
-            upd[f'{sp}.flags.manual_override'] = manual
-            if stu['timestamps']['first_seen'] is None and status == 'Present':
-                upd[f'{sp}.timestamps.first_seen'] = cts
-            if status == 'Present':
-                upd[f'{sp}.timestamps.last_seen'] = ct.strftime('%H:%M:%S')
-            upd[f'{sp}.durations.total_present_seconds'] = int(tp)
-            upd[f'{sp}.durations.total_absent_seconds'] = int(ta)
-            upd[f'{sp}.durations.total_present_human'] = self._fmt(tp)
-            upd[f'{sp}.durations.total_absent_human'] = self._fmt(ta)
+            changes, new = transition(stu, status, now, manual)
+            upd = {f'{sp}.{k}': v for k, v in changes.items()}
             if doc['sessions'][sn]['start_time'] is None:
-                upd[f'sessions.{sn}.start_time'] = cts
-            self.db[cn].update_one({}, {'$set': upd})
-            return True
+                upd[f'sessions.{sn}.start_time'] = datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')
+            version = doc['sessions'][sn].get('version', 0) + 1
+            upd[f'sessions.{sn}.version'] = version
+            upd[f'{sp}.version'] = version
+            update = {'$set': upd}
+            counts = self._apply_counts(doc, sn, [(ps, status)], update)
+            return update, (ps, counts, version, new)
+        
+        with session_locks.hold((cn, sn)):
+            res = self._write_session(cn, sn, build)
+            if res is None:
+                return False
+            doc, (ps, counts, version, new) = res
+            session_counts[(cn, sn)] = (version, counts)
+            self._written(cn)
+            # Published and recorded under the session lock so they land in version order
+            new = derive_many([dict(new, version=version)])[0]
+            if ps != status or manual:
+                self._publish_transition(cn, sn, prn, new, counts)
+            self._write_records([self._record_op(doc, cn, sn, new)])
+        return True
+    
     def batch_update_attendance(self, cn, sn, updates_dict):
         """
         Batch update multiple students' attendance
         updates_dict: {prn: {'status': 'Present', 'timestamp': datetime}, ...}
         """
-        with self.lock:
-            doc = self.db[cn].find_one({})
-            if not doc or sn not in doc.get('sessions', {}):
-                return 0
-            
-            ct = datetime.now()
+        def build(doc):
+            now = now_epoch()
             bulk_updates = {}
-            success_count = 0
+            transitions = []
+            version = doc['sessions'][sn].get('version', 0) + 1
             
             for prn, update_info in updates_dict.items():
                 if prn not in doc['sessions'][sn]['students']:
@@ -286,220 +628,268 @@ class DatabaseManager:
                 sp = f'sessions.{sn}.students.{prn}'
                 stu = doc['sessions'][sn]['students'][prn]
                 status = update_info['status']
-                cts = ct.strftime('%Y-%m-%d %H:%M:%S')
-                
-                ps = stu.get('status', 'Absent')
-                pstart = stu['timestamps'].get('present_timer_start')
-                astart = stu['timestamps'].get('absence_timer_start')
-                tp = stu['durations'].get('total_present_seconds', 0)
-                ta = stu['durations'].get('total_absent_seconds', 0)
-                
-                # Timer logic
-                if ps == 'Present' and status != 'Present':
-                    if pstart:
-                        try:
-                            tp += (ct - datetime.strptime(pstart, '%Y-%m-%d %H:%M:%S')).total_seconds()
-                        except:
-                            pass
-                    bulk_updates[f'{sp}.timestamps.present_timer_start'] = None
-                    bulk_updates[f'{sp}.timestamps.absence_timer_start'] = cts
-                elif ps != 'Present' and status == 'Present':
-                    if astart:
-                        try:
-                            ta += (ct - datetime.strptime(astart, '%Y-%m-%d %H:%M:%S')).total_seconds()
-                        except:
-                            pass
-                    bulk_updates[f'{sp}.timestamps.absence_timer_start'] = None
-                    bulk_updates[f'{sp}.timestamps.present_timer_start'] = cts
-                elif status == 'Present' and not pstart:
-                    bulk_updates[f'{sp}.timestamps.present_timer_start'] = cts
-                elif status != 'Present' and not astart:
-                    bulk_updates[f'{sp}.timestamps.absence_timer_start'] = cts
-                
-                # Update status and timestamps
-                bulk_updates[f'{sp}.status'] = status
-                bulk_updates[f'{sp}.timestamps.last_updated'] = cts
-                bulk_updates[f'{sp}.flags.manual_override'] = False
-                
-                if stu['timestamps']['first_seen'] is None and status == 'Present':
-                    bulk_updates[f'{sp}.timestamps.first_seen'] = cts
-                
-                if status == 'Present':
-                    bulk_updates[f'{sp}.timestamps.last_seen'] = ct.strftime('%H:%M:%S')
-                
-                bulk_updates[f'{sp}.durations.total_present_seconds'] = int(tp)
-                bulk_updates[f'{sp}.durations.total_absent_seconds'] = int(ta)
-                bulk_updates[f'{sp}.durations.total_present_human'] = self._fmt(tp)
-                bulk_updates[f'{sp}.durations.total_absent_human'] = self._fmt(ta)
-                
-                success_count += 1
+                changes, new = transition(stu, status, now)
+                changes['version'] = version
+                bulk_updates.update({f'{sp}.{k}': v for k, v in changes.items()})
+                transitions.append((stu.get('status', 'Absent'), status, prn, dict(new, version=version)))
             
-            # Single database update for all students
-            if bulk_updates:
-                if doc['sessions'][sn]['start_time'] is None:
-                    bulk_updates[f'sessions.{sn}.start_time'] = ct.strftime('%Y-%m-%d %H:%M:%S')
-                
-                self.db[cn].update_one({}, {'$set': bulk_updates})
+            if not bulk_updates:
+                return None
+            if doc['sessions'][sn]['start_time'] is None:
+                bulk_updates[f'sessions.{sn}.start_time'] = datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')
+            bulk_updates[f'sessions.{sn}.version'] = version
             
-            return success_count
-
-
-    def _fmt(self, sec):
-        s = int(sec)
-        if s < 60:
-            return f"{s} sec"
-        elif s < 3600:
-            return f"{s//60} min {s%60} sec"
-        else:
-            return f"{s//3600} hr {(s%3600)//60} min"
+            # Single database update for all students
+            update = {'$set': bulk_updates}
+            counts = self._apply_counts(doc, sn, [t[:2] for t in transitions], update)
+            return update, (transitions, counts, version)
+        
+        with session_locks.hold((cn, sn)):
+            res = self._write_session(cn, sn, build)
+            if res is None:
+                return 0
+            doc, (transitions, counts, version) = res
+            session_counts[(cn, sn)] = (version, counts)
+            self._written(cn)
+            derived = derive_many([t[3] for t in transitions])
+            self._write_records([self._record_op(doc, cn, sn, d) for d in derived])
+            for (ps, status, prn, _), d in zip(transitions, derived):
+                if ps != status:
+                    self._publish_transition(cn, sn, prn, d, counts)
+        return len(transitions)
     
     def get_session_attendance(self, cn, sn):
-        with self.lock:
-            doc = self.db[cn].find_one({})
-            if not doc or sn not in doc.get('sessions', {}):
-                return []
-            return list(doc['sessions'][sn]['students'].values())
+        doc = self._day(cn, {f'sessions.{sn}.students': 1}, [sn])
+        if doc and sn not in doc.get('sessions', {}) and 'roster' not in doc:
+            # Session not run yet: its students are the untouched roster
+            doc = self._day(cn, {'roster': 1}, [sn])
+        stus = self._session_students(doc, sn) if doc else None
+        return derive_many(list(stus.values())) if stus else []
+    
+    def get_session_version(self, cn, sn):
+        # Always the stored version (one-field projection): other processes write to the same session
+        doc = self._day(cn, {f'sessions.{sn}.version': 1}, []) or {}
+        return (doc.get('sessions', {}).get(sn) or {}).get('version', 0)
+    
+    def get_session_changes(self, cn, sn, since):
+        """(version, students changed after since), filtered inside Mongo rather than shipping the roster"""
+        path = f'$sessions.{sn}'
+        res = list(self.db[cn].aggregate([{'$project': {
+            '_id': 0,
+            'version': {'$ifNull': [f'{path}.version', 0]},
+            'students': {'$filter': {
+                'input': {'$objectToArray': {'$ifNull': [f'{path}.students', {}]}},
+                'cond': {'$gt': [{'$ifNull': ['$$this.v.version', 0]}, since]}}}
+        }}]))
+        if not res:
+            doc = self._day(cn, sessions=[sn])
+            sd = (doc or {}).get('sessions', {}).get(sn)
+            if not sd:
+                return 0, []
+            return sd.get('version') or 0, derive_many([s for s in sd['students'].values()
+                                                        if (s.get('version') or 0) > since])
+        return res[0]['version'], derive_many([kv['v'] for kv in res[0]['students']])
     
     def get_session_summary(self, cn, sn):
-        with self.lock:
-            doc = self.db[cn].find_one({})
-            if not doc or sn not in doc.get('sessions', {}):
-                return {}
-            stu = doc['sessions'][sn]['students']
-            t = len(stu)
-            p = sum(1 for s in stu.values() if s['status'] == 'Present')
-            return {
-                'total': t, 'present': p,
-                'temporary_absent': sum(1 for s in stu.values() if s['status'] == 'Temporary Absent'),
-                'permanently_absent': sum(1 for s in stu.values() if s['status'] == 'Permanently Absent'),
-                'absent': sum(1 for s in stu.values() if s['status'] == 'Absent'),
-                'attendance_percentage': round((p / t * 100), 2) if t > 0 else 0
-            }
+        """
+        Summary of the session the camera here is recording straight from session_counts, which every write
+        of this process refreshes under the session lock; any other session is read from its stored counters
+        (a counters-and-version projection), since other processes may have written it. Counters derived for
+        sessions that predate them are kept in session_counts until the stored version moves.
+        """
+        mirrored = session_counts.get((cn, sn))
+        if mirrored is not None and live_session() == (cn, sn):
+            return self._summary(mirrored[1])
+        doc = self._day(cn, {f'sessions.{sn}.counts': 1, f'sessions.{sn}.version': 1}, [sn])
+        if not doc:
+            return {}
+        sd = doc.get('sessions', {}).get(sn)
+        if sd and 'counts' in sd:
+            return self._summary(dict(sd['counts']))
+        version = (sd or {}).get('version', 0)
+        if mirrored is not None and mirrored[0] == version:
+            return self._summary(mirrored[1])
+        # Session not run yet or created before counters existed
+        doc = self._day(cn, sessions=[sn])
+        if self._session_students(doc, sn) is None:
+            return {}
+        counts = self._counts_of(doc, sn)
+        session_counts[(cn, sn)] = (version, counts)
+        return self._summary(counts)
+    
+    def get_day_versions(self, cn):
+        doc = self._day(cn, {f'sessions.{s}.version': 1 for s in ALL_SESSIONS}, [])
+        if doc is None:
+            return None
+        return {sn: (sd or {}).get('version', 0) for sn, sd in doc.get('sessions', {}).items()}
     
-    def get_all_daily_collections(self):
-        with self.lock:
-            cols = list(self.db.lecture_metadata.find().sort('created_at', -1))
-            for c in cols:
-                c['_id'] = str(c['_id'])
-                if 'created_at' in c:
+    def get_all_daily_collections(self, limit=DEFAULT_PAGE_SIZE, after=None, fields=None, date_from=None, date_to=None):
+        """One page of lecture_metadata, newest first; returns (collections, next_cursor)"""
+        q = date_filter({}, date_from, date_to)
+        if after:
+            q.update(PageCursor.after(after))
+        proj = dict.fromkeys((fields or COLLECTION_FIELDS) + ['created_at'], 1)
+        cols = list(self.db.lecture_metadata.find(q, proj).sort([('created_at', -1), ('_id', -1)]).limit(limit + 1))
+        nxt = PageCursor.encode(cols[limit - 1]) if len(cols) > limit else None
+        cols = cols[:limit]
+        for c in cols:
+            c['_id'] = str(c['_id'])
+            if 'created_at' in c:
+                if fields and 'created_at' not in fields:
+                    del c['created_at']
+                else:
                     c['created_at'] = c['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-            return cols
+        return cols, nxt
     
-    def get_student_history(self, ident, field='prn_no'):
-        with self.lock:
-            metas = list(self.db.lecture_metadata.find().sort('created_at', -1))
-            hist = []
-            for m in metas:
-                doc = self.db[m['collection_name']].find_one({})
-                if not doc:
-                    continue
-                for sn, sd in doc.get('sessions', {}).items():
-                    stu = None
-                    stus = sd.get('students', {})
-                    if field == 'prn_no':
-                        stu = stus.get(ident)
-                    else:
-                        for s in stus.values():
-                            if (field == 'roll_no' and s.get('roll_no', '').upper() == ident.upper()) or \
-                               (field == 'name' and s.get('name', '').upper() == ident.upper()):
-                                stu = s
-                                break
-                    if stu:
-                        hist.append({
-                            'date': m['date'], 'session': sn, 'status': stu.get('status', 'N/A'),
-                            'first_seen': stu.get('timestamps', {}).get('first_seen', 'N/A'),
-                            'last_seen': stu.get('timestamps', {}).get('last_seen', 'N/A'),
-                            'present_duration': stu.get('durations', {}).get('total_present_human', '0 sec'),
-                            'department': m.get('department', ''), 'classroom': m.get('classroom', ''),
-                            'prn_no': stu.get('prn_no', ''), 'roll_no': stu.get('roll_no', ''),
-                            'name': stu.get('name', '')
-                        })
-            return hist
+    HISTORY_KEYS = {'prn_no': 'prn_no', 'roll_no': 'roll_no_norm', 'name': 'name_norm'}
+    
+    def _history_query(self, ident, field, date_from=None, date_to=None):
+        key = self.HISTORY_KEYS.get(field, 'prn_no')
+        return date_filter({key: ident if key == 'prn_no' else self._norm(ident)}, date_from, date_to)
+    
+    def get_student_history(self, ident, field='prn_no', limit=DEFAULT_PAGE_SIZE, after=None, fields=None,
+                            date_from=None, date_to=None):
+        """One page of a student's sessions from attendance_records; returns (history, next_cursor)"""
+        q = self._history_query(ident, field, date_from, date_to)
+        if after:
+            q.update(PageCursor.after(after, id_order=1))
+        fields = fields or HISTORY_FIELDS
+        proj = dict.fromkeys(fields + ['created_at'], 1)
+        recs = list(self.db.attendance_records.find(q, proj).sort([('created_at', -1), ('_id', 1)]).limit(limit + 1))
+        nxt = PageCursor.encode(recs[limit - 1]) if len(recs) > limit else None
+        defaults = {'status': 'N/A', 'first_seen': 'N/A', 'last_seen': 'N/A', 'present_duration': '0 sec'}
+        hist = [{f: r.get(f) or defaults.get(f, '') for f in fields} for r in recs[:limit]]
+        return hist, nxt
+    
+    def get_student_statistics(self, ident, field='prn_no', date_from=None, date_to=None):
+        counts = {r['_id']: r['n'] for r in self.db.attendance_records.aggregate([
+            {'$match': self._history_query(ident, field, date_from, date_to)},
+            {'$group': {'_id': '$status', 'n': {'$sum': 1}}}])}
+        return self._statistics(counts)
     
     def clear_session_data(self, cn, sn):
-        with self.lock:
-            doc = self.db[cn].find_one({})
-            if not doc or sn not in doc.get('sessions', {}):
-                return 0
-            cts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            upd = {}
+        def build(doc):
+            now = now_epoch()
+            version = doc['sessions'][sn].get('version', 0) + 1
+            upd = {f'sessions.{sn}.version': version}
+            unset = {}
             for prn in doc['sessions'][sn]['students'].keys():
                 p = f'sessions.{sn}.students.{prn}'
-                upd.update({f'{p}.status': 'Absent', f'{p}.timestamps.first_seen': None,
-                           f'{p}.timestamps.last_seen': None, f'{p}.timestamps.present_timer_start': None,
-                           f'{p}.timestamps.absence_timer_start': None, f'{p}.timestamps.last_updated': cts,
-                           f'{p}.durations.total_present_seconds': 0, f'{p}.durations.total_absent_seconds': 0,
-                           f'{p}.durations.total_present_human': '0 sec', f'{p}.durations.total_absent_human': '0 sec',
-                           f'{p}.flags.manual_override': False, f'{p}.flags.is_temp_absent': False,
-                           f'{p}.flags.is_perm_absent': False})
-            self.db[cn].update_one({}, {'$set': upd})
-            return len(doc['sessions'][sn]['students'])
+                upd.update({f'{p}.version': version, f'{p}.status': 'Absent', f'{p}.intervals': [],
+                           f'{p}.updated': now, f'{p}.flags.manual_override': False,
+                           f'{p}.flags.is_temp_absent': False, f'{p}.flags.is_perm_absent': False})
+                # Fields from before presence intervals are dropped rather than reset
+                unset.update({f'{p}.timestamps': '', f'{p}.durations': ''})
+            counts = dict(dict.fromkeys(STATUSES, 0), Absent=len(doc['sessions'][sn]['students']))
+            upd[f'sessions.{sn}.counts'] = counts
+            return {'$set': upd, '$unset': unset}, (counts, version)
+        
+        with session_locks.hold((cn, sn)):
+            res = self._write_session(cn, sn, build, materialize=False)
+            if res is None:
+                return 0
+            doc, (counts, version) = res
+            session_counts[(cn, sn)] = (version, counts)
+            self._written(cn)
+            live_events.publish('reset', {'collection_name': cn, 'session_name': sn})
+            self.db.attendance_records.update_many(
+                {'collection_name': cn, 'session': sn},
+                {'$set': {'status': 'Absent', 'first_seen': None, 'last_seen': None,
+                          'total_present_seconds': 0, 'present_duration': '0 sec',
+                          'updated_at': datetime.now()}})
+        return len(doc['sessions'][sn]['students'])
     
-    def generate_excel_report(self, cn, sn=None):
-        try:
-            wb = Workbook()
-            wb.remove(wb.active)
-            doc = self.db[cn].find_one({})
-            if not doc:
-                return None
-            summ = wb.create_sheet("Summary", 0)
-            summ['A1'] = f"Attendance Report - {doc['date']}"
-            summ['A1'].font = Font(bold=True, size=14)
-            summ['A2'] = f"Department: {doc['department']}"
-            summ['A3'] = f"Classroom: {doc['classroom']}"
-            summ['A4'] = f"Teacher: {doc['teacher_name']}"
-            for sess in ([sn] if sn else ALL_SESSIONS):
-                if sess not in doc['sessions']:
-                    continue
-                sh = wb.create_sheet(sess[:31])
-                stus = list(doc['sessions'][sess]['students'].values())
-                hdrs = ['PRN No', 'Roll No', 'Name', 'Status', 'First Seen', 'Last Seen', 
-                        'Present Duration', 'Absent Duration']
-                for c, h in enumerate(hdrs, 1):
-                    cell = sh.cell(1, c, h)
-                    cell.font = Font(bold=True, color="FFFFFF")
-                    cell.fill = PatternFill(start_color="4472C4", fill_type="solid")
-                for r, s in enumerate(stus, 2):
-                    sh.cell(r, 1, s['prn_no'])
-                    sh.cell(r, 2, s['roll_no'])
-                    sh.cell(r, 3, s['name'])
-                    sh.cell(r, 4, s['status'])
-                    sh.cell(r, 5, s['timestamps'].get('first_seen', 'N/A'))
-                    sh.cell(r, 6, s['timestamps'].get('last_seen', 'N/A'))
-                    sh.cell(r, 7, s['durations'].get('total_present_human', '0 sec'))
-                    sh.cell(r, 8, s['durations'].get('total_absent_human', '0 sec'))
-            ef = io.BytesIO()
-            wb.save(ef)
-            ef.seek(0)
-            return ef
-        except:
+    def get_session_intervals(self, cn, sn):
+        doc = self._day(cn, {f'sessions.{sn}.students': 1}, [sn])
+        sd = (doc or {}).get('sessions', {}).get(sn)
+        return list(sd['students'].values()) if sd else None
+    
+    def get_present_at(self, cn, when, sn=None):
+        sessions = [sn] if sn else ALL_SESSIONS
+        doc = self._day(cn, {f'sessions.{s}.students': 1 for s in sessions}, sessions)
+        if not doc:
             return None
+        return {s: self._present_at(list(sd['students'].values()), when)
+                for s, sd in doc.get('sessions', {}).items() if s in sessions}
     
     def get_session_data_for_preview(self, cn, sn):
-        with self.lock:
-            doc = self.db[cn].find_one({})
-            if not doc or sn not in doc.get('sessions', {}):
-                return None
-            stus = list(doc['sessions'][sn]['students'].values())
-            t = len(stus)
-            p = sum(1 for s in stus if s['status'] == 'Present')
-            return {
-                'date': doc['date'], 'department': doc['department'], 'classroom': doc['classroom'],
-                'teacher_name': doc['teacher_name'], 'session_name': sn,
-                'summary': {
-                    'total': t, 'present': p,
-                    'temporary_absent': sum(1 for s in stus if s['status'] == 'Temporary Absent'),
-                    'permanently_absent': sum(1 for s in stus if s['status'] == 'Permanently Absent'),
-                    'absent': sum(1 for s in stus if s['status'] == 'Absent'),
-                    'attendance_percentage': round((p / t * 100), 2) if t > 0 else 0
-                },
-                'students': stus
-            }
+        doc = self._day(cn, sessions=[sn])
+        stus = self._session_students(doc, sn) if doc else None
+        if stus is None:
+            return None
+        return {
+            'date': doc['date'], 'department': doc['department'], 'classroom': doc['classroom'],
+            'teacher_name': doc['teacher_name'], 'session_name': sn,
+            'summary': self._summary(self._counts_of(doc, sn)),
+            'students': derive_many(list(stus.values()))
+        }
     
     def close(self):
         if self.client:
             self.client.close()
 
+class LocalDatabaseManager(RosterMixin, SQLiteStore):
+    """Embedded SQLite backend with the same roster loading and live events as DatabaseManager"""
+    def _publish(self, event_type, data):
+        live_events.publish(event_type, data)
+    
+    def _written(self, cn):
+        day_written(cn)
+
+def open_db():
+    if STORAGE_CONFIG['backend'] == 'sqlite':
+        return LocalDatabaseManager(STORAGE_CONFIG['sqlite_path'])
+    return DatabaseManager(MONGODB_CONFIG)
+
+def refresh_rollups(date_from=None, date_to=None):
+    db = open_db()
+    try:
+        res = rollups.refresh(db, export.iter_days(db, date_from, date_to),
+                              on_rebuilt=lambda r: attendance_bits.record_rollup(r, save=False))
+    finally:
+        db.close()
+        attendance_bits.flush()
+    if res['rebuilt']:
+        print(f"📈 Rebuilt {res['rebuilt']} of {res['checked']} analytics rollups")
+    return res
+
+def nightly_rollups():
+    """Refresh changed rollups once a night at ANALYTICS_CONFIG['refresh_hour']"""
+    while True:
+        now = datetime.now()
+        nxt = now.replace(hour=ANALYTICS_CONFIG['refresh_hour'], minute=0, second=0, microsecond=0)
+        if nxt <= now:
+            nxt += timedelta(days=1)
+        sleep((nxt - now).total_seconds())
+        try:
+            refresh_rollups()
+        except Exception as e:
+            print(f"Rollup refresh error: {e}")
+
+def session_closed(cn, sn):
+    """Write a finished session into the attendance bitmaps, off the camera thread"""
+    def run():
+        try:
+            db = open_db()
+            try:
+                attendance_bits.record_session(db, cn, sn)
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"Bitmap update error: {e}")
+    threading.Thread(target=run, daemon=True).start()
+
+def startup_maintenance():
+    """Background work on server start: backfill history records, then archive finished days if opted in"""
+    try:
+        db = open_db()
+        db.backfill_attendance_records()
+        if ARCHIVE_CONFIG['on_startup']:
+            db.archive_days()
+        db.close()
+    except Exception as e:
+        print(f"Maintenance error: {e}")
+
 class AttendanceSystem:
     def __init__(self, mode, year, dept, room, teacher, cams=None):
         self.mode = mode
@@ -512,10 +902,11 @@ class AttendanceSystem:
         self.room = room
         self.teacher = teacher
         self.cams = cams or ['CAM-01']
-        self.db = DatabaseManager(MONGODB_CONFIG)
+        self.db = open_db()
         yc = self.db._get_year_code(year)
         sheet = f"{dept}_{yc}"
         self.headers, self.data = self.db.load_students_from_excel(TEMPLATE_FILE, sheet)
+        self.roster = self.db.build_roster(self.headers, self.data)
         self.total_students = len(self.data)
         self.current_session = None
         self.current_collection = None
@@ -648,6 +1039,8 @@ class AttendanceSystem:
             date = datetime.now().strftime('%Y-%m-%d')
             
             if sess != self.current_session or date != self.current_date:
+                if self.current_session and self.current_collection:
+                    session_closed(self.current_collection, self.current_session)
                 self.current_session = sess
                 self.current_date = date
                 self.student_status = {}
@@ -657,8 +1050,10 @@ class AttendanceSystem:
                 
                 self.current_collection = self.db.create_or_get_daily_collection(
                     self.dept, self.year, date, self.room, self.teacher,
-                    self.headers, self.data, self.cams
+                    self.roster, self.cams
                 )
+                live_events.publish('session', {'collection_name': self.current_collection,
+                                                'session_name': sess, 'date': date})
             
             # Process all detected faces
             detected_this_frame = []
@@ -712,13 +1107,15 @@ class AttendanceSystem:
 
     def stop(self):
         self.stop_event.set()
+        if self.current_session and self.current_collection:
+            session_closed(self.current_collection, self.current_session)
 
 @app.route('/api/health')
 def health():
     try:
-        c = MongoClient(MONGODB_CONFIG['host'], MONGODB_CONFIG['port'], serverSelectionTimeoutMS=2000)
-        c.server_info()
-        c.close()
+        db = open_db()
+        db.ping()
+        db.close()
         dbc = True
     except:
         dbc = False
@@ -788,7 +1185,7 @@ def preview_config():
         print(f"  Classroom: {room}")
         print(f"  Teacher: {teach}")
         
-        db = DatabaseManager(MONGODB_CONFIG)
+        db = open_db()
         yc = db._get_year_code(y)
         sheet = f"{dept}_{yc}"
         
@@ -830,7 +1227,8 @@ def preview_config():
         print(f"  Session: {sess}")
         print(f"  Date: {date}")
         
-        cn = db.create_or_get_daily_collection(dept, y, date, room, teach, h, data, d.get('camera_ids', ['CAM-01']))
+        cn = db.create_or_get_daily_collection(dept, y, date, room, teach, db.build_roster(h, data),
+                                               d.get('camera_ids', ['CAM-01']))
         
         print(f"\nFetching attendance data...")
         att = db.get_session_attendance(cn, sess)
@@ -890,13 +1288,15 @@ def start_camera():
         cn = attendance_system.db.create_or_get_daily_collection(
             d['department'], d['year'], date,
             d['classroom'], d['teacher_name'],
-            attendance_system.headers, attendance_system.data,
+            attendance_system.roster,
             d.get('camera_ids', ['CAM-01'])
         )
+        attendance_system.db.ensure_session(cn, sess)
         
         attendance_system.current_collection = cn
         attendance_system.current_session = sess
         attendance_system.current_date = date
+        live_events.publish('session', {'collection_name': cn, 'session_name': sess, 'date': date})
         
         print(f"🎥 Camera started - Multi-face detection enabled")
         print(f"📊 Ready to track {attendance_system.total_students} students")
@@ -932,9 +1332,8 @@ def stop_camera():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/camera/status')
-def camera_status():
-    global camera_running, attendance_system
+def camera_status_payload():
+    """Body of /api/camera/status, shared by the Flask and ASGI apps (in-memory only, no database call)"""
     status = {'running': camera_running, 'attendance_count': 0, 'current_faces': 0,
               'current_session': None, 'current_collection': None, 'camera_ids': []}
     if attendance_system:
@@ -943,11 +1342,18 @@ def camera_status():
                       'current_session': attendance_system.current_session,
                       'current_collection': attendance_system.current_collection,
                       'camera_ids': attendance_system.cams})
-    return jsonify(status)
+    return status
+
+@app.route('/api/camera/status')
+def camera_status():
+    return jsonify(camera_status_payload())
+
+def open_camera():
+    return cv2.VideoCapture(int(CAMERA_SOURCE) if CAMERA_SOURCE.isdigit() else CAMERA_SOURCE)
 
 def generate_frames():
     global attendance_system, camera_running
-    cap = cv2.VideoCapture(0)
+    cap = open_camera()
     if not cap.isOpened():
         return
     try:
@@ -972,30 +1378,63 @@ def video_feed():
         return jsonify({'error': 'Camera not running'}), 400
     return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
+def current_session_state(since=None, if_none_match=None):
+    """
+    (payload, etag) behind /api/current-session, shared by the Flask and ASGI apps.
+    payload is None when the client is already at the current version (304)
+    """
+    a = attendance_system
+    if not (a and a.current_collection and a.current_session):
+        return {'success': True, 'active': False}, None
+    cn, sn = a.current_collection, a.current_session
+    version = a.db.get_session_version(cn, sn)
+    etag = f'"{cn}:{sn}:{version}"'
+    if since == version or if_none_match == etag:
+        return None, etag
+    delta = since is not None and since < version
+    if delta:
+        version, att = a.db.get_session_changes(cn, sn, since)
+    else:
+        att = a.db.get_session_attendance(cn, sn)
+    summ = a.db.get_session_summary(cn, sn)
+    return ({'success': True, 'active': True, 'collection_name': cn, 'session_name': sn,
+             'date': a.current_date, 'version': version, 'delta': delta,
+             'summary': summ, 'attendance': att}, f'"{cn}:{sn}:{version}"')
+
 @app.route('/api/current-session')
 def get_current_session_data():
+    """Full session, or with ?since=<version> only the students changed after it; 304 when nothing changed"""
     try:
-        print(f"Current session request - attendance_system exists: {attendance_system is not None}")
-        if attendance_system and attendance_system.current_collection and attendance_system.current_session:
-            print(f"Getting data for: {attendance_system.current_collection}, {attendance_system.current_session}")
-            att = attendance_system.db.get_session_attendance(attendance_system.current_collection, 
-                                                              attendance_system.current_session)
-            summ = attendance_system.db.get_session_summary(attendance_system.current_collection, 
-                                                           attendance_system.current_session)
-            print(f"Returning {len(att)} records")
-            return jsonify({'success': True, 'active': True,
-                          'collection_name': attendance_system.current_collection,
-                          'session_name': attendance_system.current_session,
-                          'date': attendance_system.current_date,
-                          'summary': summ,
-                          'attendance': att})
-        print("No active attendance system")
-        return jsonify({'success': True, 'active': False})
+        payload, etag = current_session_state(request.args.get('since', type=int),
+                                              request.headers.get('If-None-Match'))
+        if payload is None:
+            resp = Response(status=304)
+        elif not payload['active']:
+            return jsonify(payload)
+        else:
+            resp = roster_response(payload, 'attendance')
+        resp.headers['ETag'] = etag
+        return resp
     except Exception as e:
         print(f"Current session error: {e}")
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def current_session_snapshot():
+    a = attendance_system
+    if not (a and a.current_collection and a.current_session):
+        return {'active': False}
+    return {'active': True, 'collection_name': a.current_collection, 'session_name': a.current_session,
+            'date': a.current_date, 'version': a.db.get_session_version(a.current_collection, a.current_session),
+            'summary': a.db.get_session_summary(a.current_collection, a.current_session),
+            'attendance': a.db.get_session_attendance(a.current_collection, a.current_session)}
+
+@app.route('/api/events')
+def live_event_stream():
+    """SSE feed: a snapshot of the current session, then status transitions as they are written"""
+    return Response(live_events.stream(current_session_snapshot), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/attendance/update', methods=['POST'])
 def update_attendance_manual():
     try:
@@ -1028,8 +1467,11 @@ def update_attendance_manual():
         if not status:
             print("❌ Missing status")
             return jsonify({'success': False, 'error': 'Missing status'}), 400
+        if status not in STATUSES:
+            print(f"❌ Unknown status: {status}")
+            return jsonify({'success': False, 'error': f'Status must be one of: {", ".join(STATUSES)}'}), 400
         
-        db = DatabaseManager(MONGODB_CONFIG)
+        db = open_db()
         
         print(f"Updating attendance...")
         success = db.update_student_attendance(collection_name, session_name, prn_no, status, manual=True)
@@ -1058,76 +1500,516 @@ def clear_attendance_data():
             attendance_system.attendance_count = 0
             count = attendance_system.db.clear_session_data(d['collection_name'], d['session_name'])
         else:
-            db = DatabaseManager(MONGODB_CONFIG)
+            db = open_db()
             count = db.clear_session_data(d['collection_name'], d['session_name'])
             db.close()
         return jsonify({'success': True, 'message': f'Cleared {count} students', 'count': count})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/attendance/present-at')
+def present_at():
+    """Who was present at ?time=HH:MM[:SS] on a day, from the stored presence intervals"""
+    cn, t, sn = request.args.get('collection_name'), request.args.get('time', ''), request.args.get('session')
+    if not cn or not t:
+        return jsonify({'success': False, 'error': 'collection_name and time are required'}), 400
+    try:
+        db = open_db()
+        doc = db.get_day_document(cn)
+        if not doc:
+            db.close()
+            return jsonify({'success': False, 'error': 'Collection not found'}), 404
+        try:
+            when = datetime.strptime(f"{doc['date']} {t}", '%Y-%m-%d %H:%M:%S' if t.count(':') == 2 else '%Y-%m-%d %H:%M')
+        except ValueError:
+            db.close()
+            return jsonify({'success': False, 'error': 'time must be HH:MM or HH:MM:SS'}), 400
+        res = db.get_present_at(cn, when, sn)
+        db.close()
+        return jsonify({'success': True, 'collection_name': cn, 'time': when.strftime('%Y-%m-%d %H:%M:%S'),
+                        'sessions': res, 'count': sum(len(v) for v in res.values())})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def session_heatmap(db, cn, sn, step, fmt, accept):
+    """
+    (body, headers) of the occupancy curve and per-student presence raster of a session over its timetable
+    slot, or None
+    """
+    students = db.get_session_intervals(cn, sn)
+    day = db.get_day_document(cn) if students is not None else None
+    if day is None:
+        return None
+    start, end = (int(t.timestamp()) for t in session_bounds(sn, day['date']))
+    edges, raster = presence_raster(students, start, end, step)
+    labels = [datetime.fromtimestamp(int(t)).strftime('%H:%M') for t in edges[:-1]]
+    payload = {'success': True, 'collection_name': cn, 'session_name': sn, 'step_seconds': step,
+               'bins': labels,
+               # students-equivalent present on average in each bin, and how many were seen in it at all
+               'occupancy': np.round(raster.sum(axis=0) / step, 2).tolist(),
+               'seen': (raster > 0).sum(axis=0).tolist(),
+               'students': [{'prn_no': s.get('prn_no', ''), 'roll_no': s.get('roll_no', ''), 'name': s.get('name', ''),
+                             'seconds': row} for s, row in zip(students, raster.tolist())]}
+    return encode_roster(payload, fmt, accept, 'students')
+
+@app.route('/api/analytics/heatmap/<collection_name>')
+def heatmap(collection_name):
+    """
+    Minute-by-minute presence of ?session (bins of ?step seconds, default 60) across its timetable slot,
+    from the stored intervals.
+    Cached once the session is no longer the one being recorded.
+    """
+    sn, step = request.args.get('session'), request.args.get('step', 60, type=int)
+    if not sn or not 10 <= step <= 3600:
+        return jsonify({'success': False, 'error': 'session is required and step must be 10-3600 seconds'}), 400
+    fmt, accept = request.args.get('format'), request.headers.get('Accept-Encoding', '')
+    a = attendance_system
+    live = bool(a and a.current_collection == collection_name and a.current_session == sn)
+    try:
+        db = open_db()
+        try:
+            build = lambda: session_heatmap(db, collection_name, sn, step, fmt, accept)
+            if live:
+                res = build()
+            else:
+                kind = f"heatmap-{step}-{'columnar' if fmt == 'columnar' else 'rows'}-{wire_format.negotiate(accept) or 'identity'}"
+                res = cached_report(db, collection_name, sn, kind, build, request.headers.get('If-None-Match'))
+        finally:
+            db.close()
+        if res is None:
+            return jsonify({'success': False, 'error': 'Session not found'}), 404
+        body, headers = res
+        return Response(body, headers=headers) if body is not None else Response(status=304, headers=headers)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/metrics/locks')
+def lock_metrics():
+    """Per-(collection, session) writer lock contention, wait times and version-conflict retries"""
+    return jsonify({'success': True, **session_locks.snapshot()})
+
+@app.route('/api/archive', methods=['POST'])
+def archive_old_days():
+    """Compact days older than older_than_days (default ARCHIVE_CONFIG['after_days']) into the cold archive"""
+    try:
+        days = (request.get_json(silent=True) or {}).get('older_than_days')
+        days = None if days is None else int(days)
+        if days is not None and days < 1:
+            raise ValueError('older_than_days must be at least 1')
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    try:
+        db = open_db()
+        res = db.archive_days(days)
+        db.close()
+        return jsonify({'success': True, **res})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/collections')
 def get_collections():
     try:
-        db = DatabaseManager(MONGODB_CONFIG)
-        cols = db.get_all_daily_collections()
+        pa = page_args(request.args, COLLECTION_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    try:
+        db = open_db()
+        cols, nxt = db.get_all_daily_collections(**pa)
         db.close()
-        return jsonify({'success': True, 'data': cols})
+        return jsonify({'success': True, 'data': cols, 'next_cursor': nxt, 'has_more': nxt is not None})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/student/history/<identifier>')
 def get_student_history(identifier):
+    try:
+        pa = page_args(request.args, HISTORY_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     try:
         field = request.args.get('search_by', 'prn_no')
-        db = DatabaseManager(MONGODB_CONFIG)
-        hist = db.get_student_history(identifier, field)
+        db = open_db()
+        hist, nxt = db.get_student_history(identifier, field, **pa)
+        resp = {'success': True, 'identifier': identifier, 'history': hist,
+                'next_cursor': nxt, 'has_more': nxt is not None}
+        if not pa['after']:
+            # Totals and student details only accompany the first page
+            resp['statistics'] = db.get_student_statistics(identifier, field, pa['date_from'], pa['date_to'])
+            det, _ = db.get_student_history(identifier, field, limit=1, fields=['prn_no', 'roll_no', 'name'],
+                                            date_from=pa['date_from'], date_to=pa['date_to'])
+            det = det[0] if det else {}
+            resp['student_details'] = {'prn_no': det.get('prn_no', ''), 'roll_no': det.get('roll_no', ''),
+                                       'name': det.get('name', '')}
         db.close()
-        t = len(hist)
-        p = sum(1 for h in hist if h['status'] == 'Present')
-        det = hist[0] if hist else {}
-        return jsonify({'success': True, 'identifier': identifier,
-                       'student_details': {'prn_no': det.get('prn_no', ''), 'roll_no': det.get('roll_no', ''),
-                                          'name': det.get('name', '')},
-                       'statistics': {'total_sessions': t, 'present': p, 'absent': t - p,
-                                     'attendance_percentage': round((p / t * 100), 2) if t > 0 else 0},
-                       'history': hist})
+        return roster_response(resp, 'history', {'status': STATUSES, 'session': ALL_SESSIONS})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def columnar_students(data):
+    if request.args.get('format') == 'columnar':
+        data['students'] = wire_format.columnar(data['students'], {'status': STATUSES})
+    return data
+
+def cached_report(db, cn, sn, kind, build, if_none_match=None):
+    """
+    (body, headers) of report kind for cn/sn, served from report_cache while the day's data version
+    is unchanged; build() -> (body, headers) or None. None when the day or the report does not exist,
+    and body None when if_none_match already names this version.
+    """
+    versions = db.get_day_versions(cn)
+    if versions is None:
+        return None
+    version = data_version(versions)
+    etag = f'"{ReportCache.name(cn, sn, kind, version)}"'
+    if if_none_match == etag:
+        return None, {'ETag': etag}
+    hit = report_cache.get(cn, sn, kind, version)
+    if hit is None:
+        hit = build()
+        if hit is None:
+            return None
+        report_cache.put(cn, sn, kind, version, *hit)
+    return hit[0], dict(hit[1], ETag=etag)
+
 @app.route('/api/reports/preview/<collection_name>')
 def preview_report(collection_name):
     try:
         sn = request.args.get('session')
-        db = DatabaseManager(MONGODB_CONFIG)
-        if sn:
-            data = db.get_session_data_for_preview(collection_name, sn)
-            db.close()
-            return jsonify({'success': True, 'data': data}) if data else \
-                   jsonify({'success': False, 'error': 'No data found'}), 404
-        doc = db.db[collection_name].find_one({})
-        if not doc:
+        db = open_db()
+        fmt, accept = request.args.get('format'), request.headers.get('Accept-Encoding', '')
+        kind = f"preview-{'columnar' if fmt == 'columnar' else 'rows'}-{wire_format.negotiate(accept) or 'identity'}"
+        
+        def build():
+            if sn:
+                data = db.get_session_data_for_preview(collection_name, sn)
+                if not data:
+                    return None
+                return encode_roster({'success': True, 'data': columnar_students(data)}, fmt, accept)
+            doc = db.get_day_document(collection_name)
+            if not doc:
+                return None
+            all_sess = [db.get_session_data_for_preview(collection_name, s) 
+                        for s in ALL_SESSIONS if s in doc['sessions']]
+            all_sess = [s for s in all_sess if s]
+            return encode_roster({'success': True, 'collection_name': collection_name, 'date': doc['date'],
+                                  'department': doc['department'], 'classroom': doc['classroom'],
+                                  'teacher_name': doc['teacher_name'],
+                                  'sessions': [columnar_students(x) for x in all_sess]}, fmt, accept)
+        
+        res = cached_report(db, collection_name, sn, kind, build, request.headers.get('If-None-Match'))
+        db.close()
+        if res is None:
+            return jsonify({'success': False, 'error': 'No data found' if sn else 'Collection not found'}), 404
+        body, headers = res
+        return Response(body, headers=headers) if body is not None else Response(status=304, headers=headers)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def excel_report(db, cn, sn, if_none_match=None):
+    """cached_report of the day's workbook (one session's if sn is given)"""
+    def build():
+        ef = db.generate_excel_report(cn, sn)
+        return (ef.getvalue(), {}) if ef else None
+    return cached_report(db, cn, sn, 'xlsx', build, if_none_match)
+
+def export_filename(depts, date_from, date_to):
+    return '_'.join(['attendance', *(depts or []), date_from or 'start', date_to or 'today'])
+
+def range_days(date_from, date_to):
+    """Days spanned by a from/to range of 'YYYY-MM-DD' strings; None when it has no start (every day so far)"""
+    if not date_from:
+        return None
+    end = datetime.strptime(date_to, '%Y-%m-%d') if date_to else datetime.now()
+    return (end - datetime.strptime(date_from, '%Y-%m-%d')).days + 1
+
+def report_job(cn, sn):
+    def run(path):
+        db = open_db()
+        try:
+            res = excel_report(db, cn, sn)
+        finally:
             db.close()
-            return jsonify({'success': False, 'error': 'Collection not found'}), 404
-        all_sess = [db.get_session_data_for_preview(collection_name, s) 
-                    for s in ALL_SESSIONS if s in doc['sessions']]
-        all_sess = [s for s in all_sess if s]
+        if res is None:
+            raise ValueError('Collection not found or report failed')
+        with open(path, 'wb') as f:
+            f.write(res[0])
+        return XLSX_MIMETYPE, f"{cn}_{sn if sn else 'all'}.xlsx"
+    return run
+
+def range_export_job(fmt, date_from, date_to, depts):
+    def run(path):
+        with open(path, 'wb') as f:
+            for chunk in export.stream_export(open_db(), fmt, date_from, date_to, depts):
+                f.write(chunk)
+        mimetype, ext = export.FORMATS[fmt]
+        return mimetype, f"{export_filename(depts, date_from, date_to)}.{ext}"
+    return run
+
+def job_accepted(job):
+    return jsonify({'success': True, 'job': job.as_dict(), 'status_url': f'/api/jobs/{job.id}',
+                    'download_url': f'/api/jobs/{job.id}/download'}), 202
+
+def queue_full(e):
+    resp = jsonify({'success': False, 'error': str(e), **report_jobs.stats()})
+    resp.headers['Retry-After'] = '5'
+    return resp, 429
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a report: {type: 'report', collection_name, session?} or {type: 'export', format, from, to, department[]}"""
+    data = request.get_json(silent=True) or {}
+    kind = data.get('type', 'report')
+    try:
+        if kind == 'report':
+            cn, sn = data.get('collection_name'), data.get('session') or None
+            if not cn:
+                return jsonify({'success': False, 'error': 'collection_name is required'}), 400
+            job = report_jobs.submit(kind, {'collection_name': cn, 'session': sn}, report_job(cn, sn))
+        elif kind == 'export':
+            fmt = data.get('format', 'csv')
+            if fmt not in export.available_formats():
+                return jsonify({'success': False,
+                                'error': f"format must be one of {', '.join(export.available_formats())}"}), 400
+            depts = data.get('department') or None
+            depts = [depts] if isinstance(depts, str) else depts
+            params = {'format': fmt, 'from': data.get('from'), 'to': data.get('to'), 'department': depts}
+            job = report_jobs.submit(kind, params, range_export_job(fmt, params['from'], params['to'], depts))
+        else:
+            return jsonify({'success': False, 'error': "type must be 'report' or 'export'"}), 400
+    except QueueFull as e:
+        return queue_full(e)
+    return job_accepted(job)
+
+@app.route('/api/jobs')
+def list_jobs():
+    """Queue depth, concurrency limits and timings, with the most recent jobs"""
+    recent = [j.as_dict() for j in report_jobs.recent(50)]
+    return jsonify({'success': True, **report_jobs.stats(), 'jobs': recent})
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    job = report_jobs.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Unknown or expired job'}), 404
+    return jsonify({'success': True, 'job': job.as_dict()})
+
+@app.route('/api/jobs/<job_id>/download')
+def job_download(job_id):
+    job = report_jobs.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Unknown or expired job'}), 404
+    if job.state != 'done':
+        return jsonify({'success': False, 'error': f'Job is {job.state}', 'job': job.as_dict()}), 409
+    return send_file(os.path.abspath(job.path), mimetype=job.mimetype, as_attachment=True,
+                     download_name=job.filename)
+
+def analytics_days(args):
+    """lecture_metadata rows selected by ?from&to&department&year (department and year repeatable)"""
+    db = open_db()
+    try:
+        return db, export.iter_days(db, args.get('from') or None, args.get('to') or None,
+                                    args.getlist('department') or None, args.getlist('year') or None)
+    except Exception:
         db.close()
-        return jsonify({'success': True, 'collection_name': collection_name, 'date': doc['date'],
-                       'department': doc['department'], 'classroom': doc['classroom'],
-                       'teacher_name': doc['teacher_name'], 'sessions': all_sess})
+        raise
+
+@app.route('/api/analytics/term')
+def term_analytics():
+    """Term percentages per student, per session slot and per day, from the per-day rollups"""
+    groups = request.args.get('group', 'student,slot,day').split(',')
+    if not set(groups) <= {'student', 'slot', 'day'}:
+        return jsonify({'success': False, 'error': 'group must list any of student, slot, day'}), 400
+    try:
+        db, days = analytics_days(request.args)
+        try:
+            term = load_term(db, rollups, days)
+        finally:
+            db.close()
+        resp = {'success': True, 'summary': term.summary()}
+        if 'student' in groups:
+            resp['students'] = term.per_student()
+        if 'slot' in groups:
+            resp['slots'] = term.per_slot()
+        if 'day' in groups:
+            resp['days'] = term.per_day()
+        return roster_response(resp, 'students' if 'student' in groups else None)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+DEFAULTER_COLUMNS = ['rank', 'prn_no', 'roll_no', 'name', 'present', 'held', 'absent', 'percentage',
+                     'sessions_to_threshold']
+
+@app.route('/api/analytics/defaulters')
+def defaulters():
+    """
+    Students under ?threshold percent (default 75) over ?from&to for ?department&year, worst first, from the
+    per-day rollups. ?format=csv or xlsx downloads the list instead.
+    """
+    threshold = request.args.get('threshold', 75, type=float)
+    fmt = request.args.get('format')
+    if not 0 < threshold <= 100:
+        return jsonify({'success': False, 'error': 'threshold must be a percentage'}), 400
+    if fmt in ('csv', 'xlsx') and fmt not in export.available_formats():
+        return jsonify({'success': False, 'error': f'{fmt} export is not available'}), 400
+    try:
+        db, days = analytics_days(request.args)
+        try:
+            term = load_term(db, rollups, days)
+        finally:
+            db.close()
+        rows = term.defaulters(threshold)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    if fmt in ('csv', 'xlsx'):
+        mimetype, ext = export.FORMATS[fmt]
+        name = export_filename(['defaulters', *request.args.getlist('department'), *request.args.getlist('year')],
+                               request.args.get('from'), request.args.get('to'))
+        table = ([r[c] for c in DEFAULTER_COLUMNS] for r in rows)
+        body = export.stream_csv(table, DEFAULTER_COLUMNS) if fmt == 'csv' \
+            else export.stream_xlsx(table, DEFAULTER_COLUMNS, 'Defaulters')
+        return Response(stream_with_context(body), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename="{name}.{ext}"'})
+    return roster_response({'success': True, 'threshold': threshold, 'summary': term.summary(),
+                            'count': len(rows), 'students': rows}, 'students')
+
+@app.route('/api/analytics/refresh', methods=['POST'])
+def refresh_analytics():
+    """Run the nightly rollup refresh now (optionally limited to ?from&to)"""
+    try:
+        return jsonify({'success': True, **refresh_rollups(request.args.get('from') or None,
+                                                           request.args.get('to') or None)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def term_bits(args):
+    """The bitmaps of ?department&year&term (term like 2025H1, default the current one)"""
+    dept, year = args.get('department'), args.get('year')
+    if not dept or not year:
+        raise ValueError('department and year are required')
+    return attendance_bits.get(dept, year, args.get('term') or term_of(datetime.now().strftime('%Y-%m-%d')))
+
+@app.route('/api/analytics/bits/below')
+def bits_below():
+    """Students under ?threshold percent (default 75) of the sessions held for them this term"""
+    try:
+        bm = term_bits(request.args)
+        rows = bm.below(request.args.get('threshold', 75, type=float))
+        return roster_response({'success': True, 'students': rows, 'count': len(rows)}, 'students')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/analytics/bits/streaks')
+def bits_streaks():
+    """Longest and current consecutive-absence runs, for students whose longest run is at least ?min (default 3)"""
+    try:
+        bm = term_bits(request.args)
+        longest, current = bm.streaks()
+        at_least = request.args.get('min', 3, type=int)
+        rows = [{'prn_no': bm.prns[i], 'name': bm.names[i], 'longest': int(longest[i]), 'current': int(current[i])}
+                for i in sorted((i for i in range(len(longest)) if longest[i] >= at_least),
+                                key=lambda i: (-int(current[i]), -int(longest[i]), bm.prns[i]))]
+        return roster_response({'success': True, 'students': rows, 'count': len(rows)}, 'students')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/analytics/bits/present-in')
+def bits_present_in():
+    """Students present in all (?mode=all) or any (?mode=any) of ?session=<date>/<session name> (repeatable)"""
+    mode = request.args.get('mode', 'all')
+    cols = [tuple(c.split('/', 1)) for c in request.args.getlist('session')]
+    if mode not in ('all', 'any') or not cols or any(len(c) != 2 for c in cols):
+        return jsonify({'success': False, 'error': 'give ?session=YYYY-MM-DD/Session N (repeatable) and mode all|any'}), 400
+    try:
+        bm = term_bits(request.args)
+        rows = [{'prn_no': bm.prns[i], 'name': bm.names[i]} for i in bm.present_in(cols, mode)]
+        return roster_response({'success': True, 'students': rows, 'count': len(rows)}, 'students')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/analytics/bits/rebuild', methods=['POST'])
+def rebuild_bits():
+    """Rewrite the bitmaps of every day in ?from&to&department&year from the day rollups"""
+    try:
+        db, days = analytics_days(request.args)
+        try:
+            for d in days:
+                r = rollups.get(db, d['collection_name'])
+                if r is not None:
+                    attendance_bits.record_rollup(r, save=False)
+        finally:
+            db.close()
+            attendance_bits.flush()
+        return jsonify({'success': True, 'days': len(days)})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/reports/cache')
+def report_cache_stats():
+    return jsonify({'success': True, **report_cache.stats()})
+
+@app.route('/api/reports/export')
+def export_range():
+    """
+    Stream every student-session in ?from/to, optionally limited to ?department=... (repeatable).
+    Ranges longer than JOB_CONFIG['sync_max_days'], or without ?from, are queued as a job (202) unless ?async=0;
+    ?async=1 queues any range.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.available_formats():
+        return jsonify({'success': False, 'error': f"format must be one of {', '.join(export.available_formats())}"}), 400
+    date_from, date_to = request.args.get('from') or None, request.args.get('to') or None
+    depts = request.args.getlist('department') or None
+    try:
+        days = range_days(date_from, date_to)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'from and to must be YYYY-MM-DD'}), 400
+    run_async = request.args.get('async')
+    if run_async == '1' or (run_async != '0' and (days is None or days > JOB_CONFIG['sync_max_days'])):
+        params = {'format': fmt, 'from': date_from, 'to': date_to, 'department': depts}
+        try:
+            job = report_jobs.submit('export', params, range_export_job(fmt, date_from, date_to, depts))
+        except QueueFull as e:
+            return queue_full(e)
+        return job_accepted(job)
+    try:
+        db = open_db()
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    mimetype, ext = export.FORMATS[fmt]
+    name = export_filename(depts, date_from, date_to)
+    resp = Response(stream_with_context(export.stream_export(db, fmt, date_from, date_to, depts)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{name}.{ext}"'})
+    # The generator only closes the store once it has started; a client gone before the first chunk never starts it
+    resp.call_on_close(db.close)
+    return resp
+
 @app.route('/api/reports/export/<collection_name>')
 def export_report(collection_name):
     try:
         sn = request.args.get('session')
-        db = DatabaseManager(MONGODB_CONFIG)
-        ef = db.generate_excel_report(collection_name, sn)
+        if request.args.get('async'):
+            # Generated by the job queue; the client polls /api/jobs/<id> and downloads from there
+            try:
+                job = report_jobs.submit('report', {'collection_name': collection_name, 'session': sn},
+                                         report_job(collection_name, sn))
+            except QueueFull as e:
+                return queue_full(e)
+            return job_accepted(job)
+        db = open_db()
+        res = excel_report(db, collection_name, sn, request.headers.get('If-None-Match'))
         db.close()
-        if ef:
-            return send_file(ef, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                           as_attachment=True, download_name=f"{collection_name}_{sn if sn else 'all'}.xlsx")
+        if res:
+            body, headers = res
+            if body is None:
+                return Response(status=304, headers=headers)
+            resp = send_file(io.BytesIO(body), mimetype=XLSX_MIMETYPE,
+                             as_attachment=True, download_name=f"{collection_name}_{sn if sn else 'all'}.xlsx")
+            resp.headers['ETag'] = headers['ETag']
+            return resp
         return jsonify({'success': False, 'error': 'Failed to generate'}), 500
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1205,7 +2087,7 @@ table td{padding:10px 8px;border-bottom:1px solid #eee}table tr:hover{background
 <div class="table-container"><table><thead><tr><th>PRN</th><th>Roll</th><th>Name</th><th>Status</th><th>First</th><th>Last</th><th>Present</th><th>Absent</th><th>Action</th></tr></thead>
 <tbody id="attendanceBody"><tr><td colspan="9" style="text-align:center">Configure and confirm to view data</td></tr></tbody></table></div></div></div>
 <script>const API=window.location.origin+'/api';const YM={'2022':'B.Tech','2023':'TY','2024':'SY','2025':'FY'};
-let running=false,interval=null,col=null,sess=null,conf=false,cfg={};function showError(m){const e=document.getElementById('errorBanner');
+let running=false,interval=null,col=null,sess=null,conf=false,cfg={},es=null,esErrors=0,records={},ver=null;function showError(m){const e=document.getElementById('errorBanner');
 e.textContent='❌ '+m;e.classList.add('show');setTimeout(()=>e.classList.remove('show'),5000)}
 function showInfo(m){const i=document.getElementById('infoBanner');i.textContent='ℹ️ '+m;i.classList.add('show');setTimeout(()=>i.classList.remove('show'),8000)}
 async function confirmConfig(){const y=document.getElementById('year').value.trim(),d=document.getElementById('department').value.trim(),
@@ -1242,9 +2124,13 @@ function updateStatus(r){const dot=document.getElementById('statusDot'),txt=docu
 if(r){dot.classList.add('active');txt.textContent='Running'}else{dot.classList.remove('active');txt.textContent='Stopped'}}
 async function updateInfo(){if(!running)return;try{const r=await fetch(`${API}/camera/status`);const d=await r.json();
 document.getElementById('currentFaces').textContent=d.current_faces||0;document.getElementById('currentSession').textContent=d.current_session||'-';
-if(d.current_session&&d.current_session!==sess){sess=d.current_session;await loadSession()}}catch(e){}}
-async function loadSession(){if(!col||!sess)return;try{const r=await fetch(`${API}/current-session`);const d=await r.json();
-if(d.success&&d.active){col=d.collection_name;sess=d.session_name;updateStats(d.summary);displayData(d.attendance)}}catch(e){}}
+if(d.current_session&&d.current_session!==sess){sess=d.current_session;ver=null;await loadSession()}}catch(e){}}
+async function loadSession(){if(!col||!sess)return;try{const since=ver!==null?`?since=${ver}`:'';
+const r=await fetch(`${API}/current-session${since}`);if(r.status===304)return;const d=await r.json();
+if(d.success&&d.active){if(since&&(d.collection_name!==col||d.session_name!==sess)){col=d.collection_name;sess=d.session_name;ver=null;return loadSession()}
+col=d.collection_name;sess=d.session_name;updateStats(d.summary);
+if(d.delta){d.attendance.forEach(r=>{records[r.prn_no||r.roll_no]=r});displayData(Object.values(records))}else setRecords(d.attendance);ver=d.version}}catch(e){}}
+function setRecords(recs){records={};(recs||[]).forEach(r=>{records[r.prn_no||r.roll_no]=r});displayData(recs)}
 function updateStats(s){document.getElementById('totalStudents').textContent=s.total||0;document.getElementById('presentCount').textContent=s.present||0;
 document.getElementById('absentCount').textContent=s.absent||0;document.getElementById('tempAbsentCount').textContent=s.temporary_absent||0;
 document.getElementById('attendancePercentage').textContent=(s.attendance_percentage||0).toFixed(2)+'%';document.getElementById('quickTotal').textContent=s.total||0;
@@ -1284,8 +2170,17 @@ async function refreshData(){await loadSession()}
 async function clearSessionData(){if(!col||!sess){showError('No active session');return}if(!confirm('Clear all attendance data for this session?'))return;
 try{const r=await fetch(`${API}/attendance/clear`,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({collection_name:col,session_name:sess})});
 const d=await r.json();if(d.success){alert('✓ '+d.message);await refreshData()}else showError(d.error||'Failed to clear')}catch(e){showError('Network error: '+e.message)}}
-function startRefresh(){if(interval)clearInterval(interval);updateInfo();interval=setInterval(()=>{updateInfo();refreshData()},2000)}
-function stopRefresh(){if(interval){clearInterval(interval);interval=null}}window.onload=()=>updateStatus(false);</script></body></html>'''
+function startRefresh(){if(interval)clearInterval(interval);updateInfo();
+if(window.EventSource&&esErrors<3){openEvents();interval=setInterval(updateInfo,2000)}
+else interval=setInterval(()=>{updateInfo();refreshData()},2000)}
+function openEvents(){if(es)es.close();es=new EventSource(`${API}/events`);
+es.addEventListener('snapshot',e=>{esErrors=0;const d=JSON.parse(e.data);if(d.active){col=d.collection_name;sess=d.session_name;ver=d.version;updateStats(d.summary);setRecords(d.attendance)}});
+es.addEventListener('status',e=>{const d=JSON.parse(e.data);if(d.collection_name!==col||d.session_name!==sess)return;
+records[d.prn_no]=d.student;if(d.version)ver=d.version;updateStats(d.summary);displayData(Object.values(records))});
+es.addEventListener('session',e=>{const d=JSON.parse(e.data);col=d.collection_name;sess=d.session_name;ver=null;loadSession()});
+es.addEventListener('reset',()=>loadSession());
+es.onerror=()=>{if(++esErrors>=3){es.close();es=null;if(running)startRefresh()}}}
+function stopRefresh(){if(interval){clearInterval(interval);interval=null}if(es){es.close();es=null}}window.onload=()=>updateStatus(false);</script></body></html>'''
 
 REPORTS_HTML = '''<!DOCTYPE html><html><head><meta charset="UTF-8"><title>Reports</title><style>
 *{margin:0;padding:0;box-sizing:border-box}body{font-family:'Segoe UI',sans-serif;background:linear-gradient(135deg,#667eea 0%,#764ba2 100%);min-height:100vh;padding:20px}
@@ -1312,17 +2207,19 @@ REPORTS_HTML = '''<!DOCTYPE html><html><head><meta charset="UTF-8"><title>Report
 .session-tab.active{background:#667eea;color:white;border-color:#667eea}.download-btn{background:#10b981;color:white;padding:10px 20px;border:none;border-radius:6px;font-weight:bold;cursor:pointer;margin-top:20px}
 </style></head><body><div class="container"><div class="header"><h1>📊 Reports</h1><div class="nav-links">
 <a href="/">Dashboard</a><a href="/reports">Reports</a><a href="/student">Student View</a></div></div>
-<div class="reports-section"><h2>Daily Collections</h2><div id="collectionsContainer" class="collections-grid"><div class="loading">Loading reports...</div></div></div></div>
+<div class="reports-section"><h2>Daily Collections</h2><div id="collectionsContainer" class="collections-grid"><div class="loading">Loading reports...</div></div>
+<button class="btn btn-view" id="moreCollectionsBtn" style="display:none;margin-top:15px" onclick="loadCollections(nextCollections)">Load more</button></div></div>
 <div class="preview-modal" id="previewModal"><div class="preview-content"><button class="preview-close" onclick="closePreview()">✕ Close</button>
 <div class="preview-header"><h2 id="previewTitle">Attendance Report</h2></div><div class="preview-info" id="previewInfo"></div>
 <div class="session-tabs" id="sessionTabs"></div><div class="preview-stats" id="previewStats"></div><div class="preview-table">
 <table><thead><tr><th>PRN</th><th>Roll No</th><th>Name</th><th>Status</th><th>First Seen</th><th>Last Seen</th><th>Present Duration</th><th>Absent Duration</th></tr></thead>
 <tbody id="previewTableBody"></tbody></table></div><button class="download-btn" id="downloadBtn">📥 Download Excel</button></div></div>
-<script>const API=window.location.origin+'/api';let currentCollection=null,allSessionsData=[];
-async function loadCollections(){try{const r=await fetch(`${API}/collections`);const d=await r.json();
-if(d.success&&d.data.length>0)displayCollections(d.data);else document.getElementById('collectionsContainer').innerHTML='<div>No collections found</div>'}
+<script>const API=window.location.origin+'/api';let currentCollection=null,allSessionsData=[],nextCollections=null;
+async function loadCollections(after){try{const r=await fetch(`${API}/collections`+(after?`?after=${encodeURIComponent(after)}`:''));const d=await r.json();
+if(d.success&&d.data.length>0)displayCollections(d.data,!!after);else if(!after)document.getElementById('collectionsContainer').innerHTML='<div>No collections found</div>';
+nextCollections=d.next_cursor||null;document.getElementById('moreCollectionsBtn').style.display=nextCollections?'inline-block':'none'}
 catch(e){document.getElementById('collectionsContainer').innerHTML='<div>Error loading reports</div>'}}
-function displayCollections(cols){const c=document.getElementById('collectionsContainer');c.innerHTML='';cols.forEach(col=>{const card=document.createElement('div');
+function displayCollections(cols,append){const c=document.getElementById('collectionsContainer');if(!append)c.innerHTML='';cols.forEach(col=>{const card=document.createElement('div');
 card.className='collection-card';card.innerHTML=`<div class="collection-header"><div class="collection-title">${col.collection_name}</div></div>
 <div class="collection-meta"><div class="meta-item"><label>Date</label><value>${col.date}</value></div>
 <div class="meta-item"><label>Department</label><value>${col.department}</value></div>
@@ -1369,9 +2266,13 @@ const row=document.createElement('tr');row.innerHTML=`<td>${stu.prn_no||'-'}</td
 <td>${stu.timestamps?.last_seen||'N/A'}</td><td>${stu.durations?.total_present_human||'0 sec'}</td>
 <td>${stu.durations?.total_absent_human||'0 sec'}</td>`;tbody.appendChild(row)})}
 function closePreview(){document.getElementById('previewModal').classList.remove('show');currentCollection=null;allSessionsData=[]}
-async function exportReport(cn){window.location.href=`${API}/reports/export/${cn}`}
-async function exportSession(cn,sn){window.location.href=`${API}/reports/export/${cn}?session=${encodeURIComponent(sn)}`}
-window.onclick=e=>{if(e.target===document.getElementById('previewModal'))closePreview()};window.onload=loadCollections;</script></body></html>'''
+async function runExport(q){const r=await fetch(`${API}/jobs`,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(q)});
+const d=await r.json();if(!d.success){alert('Export failed: '+d.error);return}let j=d.job;
+while(j.state==='queued'||j.state==='running'){await new Promise(ok=>setTimeout(ok,1000));j=(await(await fetch(`${API}/jobs/${j.job_id}`)).json()).job}
+if(j.state==='done')window.location.href=`${API}/jobs/${j.job_id}/download`;else alert('Export failed: '+j.error)}
+async function exportReport(cn){runExport({type:'report',collection_name:cn})}
+async function exportSession(cn,sn){runExport({type:'report',collection_name:cn,session:sn})}
+window.onclick=e=>{if(e.target===document.getElementById('previewModal'))closePreview()};window.onload=()=>loadCollections();</script></body></html>'''
 
 STUDENT_HTML = '''<!DOCTYPE html><html><head><meta charset="UTF-8"><title>Student View</title><style>
 *{margin:0;padding:0;box-sizing:border-box}body{font-family:'Segoe UI',sans-serif;background:linear-gradient(135deg,#667eea 0%,#764ba2 100%);min-height:100vh;padding:20px}
@@ -1405,20 +2306,26 @@ table td{padding:12px;border-bottom:1px solid #eee}table tr:hover{background:#f8
 <div class="stat-box"><h3>Attendance %</h3><div class="value" id="attendancePercent">0%</div></div></div>
 <h3 style="margin-bottom:15px;color:#333">Attendance History</h3><div class="history-table"><table><thead>
 <tr><th>Date</th><th>Session</th><th>Department</th><th>Classroom</th><th>Status</th><th>First</th><th>Last</th><th>Duration</th></tr></thead>
-<tbody id="historyBody"><tr><td colspan="8" style="text-align:center">Search for a student</td></tr></tbody></table></div></div></div>
-<script>const API=window.location.origin+'/api';async function searchStudent(){const sb=document.getElementById('searchBy').value,
+<tbody id="historyBody"><tr><td colspan="8" style="text-align:center">Search for a student</td></tr></tbody></table></div>
+<button class="btn-search" id="moreHistoryBtn" style="display:none;margin-top:15px" onclick="loadMoreHistory()">Load more</button></div></div>
+<script>const API=window.location.origin+'/api';let historyUrl=null,nextHistory=null;async function searchStudent(){const sb=document.getElementById('searchBy').value,
 id=document.getElementById('searchInput').value.trim();if(!id){alert('Please enter a PRN, roll number, or name');return}
 const hb=document.getElementById('historyBody');hb.innerHTML='<tr><td colspan="8" style="text-align:center">Loading...</td></tr>';
-document.getElementById('resultsSection').classList.add('show');try{const r=await fetch(`${API}/student/history/${encodeURIComponent(id)}?search_by=${sb}`);
+document.getElementById('resultsSection').classList.add('show');historyUrl=`${API}/student/history/${encodeURIComponent(id)}?search_by=${sb}`;
+try{const r=await fetch(historyUrl);
 const d=await r.json();if(d.success)displayData(d);else hb.innerHTML='<tr><td colspan="8" style="text-align:center">Error: '+d.error+'</td></tr>'}
 catch(e){hb.innerHTML='<tr><td colspan="8" style="text-align:center">Network error</td></tr>'}}
+async function loadMoreHistory(){if(!historyUrl||!nextHistory)return;try{const r=await fetch(`${historyUrl}&after=${encodeURIComponent(nextHistory)}`);
+const d=await r.json();if(d.success){appendHistory(d.history);setNextHistory(d.next_cursor)}}catch(e){}}
+function setNextHistory(c){nextHistory=c||null;document.getElementById('moreHistoryBtn').style.display=nextHistory?'inline-block':'none'}
 function displayData(d){const det=d.student_details||{};document.getElementById('studentPRN').textContent=det.prn_no||'-';
 document.getElementById('studentRoll').textContent=det.roll_no||'-';document.getElementById('studentFullName').textContent=det.name||'-';
 const s=d.statistics;document.getElementById('totalSessions').textContent=s.total_sessions;
 document.getElementById('presentSessions').textContent=s.present;document.getElementById('absentSessions').textContent=s.absent;
 document.getElementById('attendancePercent').textContent=s.attendance_percentage.toFixed(2)+'%';const hb=document.getElementById('historyBody');
-if(d.history.length===0){hb.innerHTML='<tr><td colspan="8" style="text-align:center">No attendance records found</td></tr>';return}
-hb.innerHTML='';d.history.forEach(r=>{const row=document.createElement('tr');const sc=r.status==='Present'?'present':'absent';
+setNextHistory(d.next_cursor);if(d.history.length===0){hb.innerHTML='<tr><td colspan="8" style="text-align:center">No attendance records found</td></tr>';return}
+hb.innerHTML='';appendHistory(d.history)}
+function appendHistory(recs){const hb=document.getElementById('historyBody');recs.forEach(r=>{const row=document.createElement('tr');const sc=r.status==='Present'?'present':'absent';
 row.innerHTML=`<td>${r.date}</td><td>${r.session}</td><td>${r.department||'-'}</td><td>${r.classroom||'-'}</td>
 <td><span class="status-badge ${sc}">${r.status}</span></td><td>${r.first_seen||'N/A'}</td><td>${r.last_seen||'N/A'}</td>
 <td>${r.present_duration||'0 sec'}</td>`;hb.appendChild(row)})}
@@ -1448,6 +2355,8 @@ if __name__=='__main__':
     print("   - Students with neither PRN nor Roll Number will be skipped")
     print("   - Consider adding PRN numbers to Excel for better tracking")
     print("\n🚀 Starting server on http://localhost:5000")
+    threading.Thread(target=startup_maintenance, daemon=True).start()
+    threading.Thread(target=nightly_rollups, daemon=True).start()
     print("="*80+"\n")
     try:
         app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
@@ -13,13 +13,8 @@ from threading import Lock, Event
 from openpyxl import load_workbook, Workbook
 from openpyxl.styles import Font, PatternFill
 
-sys.path.append(os.path.abspath('../'))
-try:
-    from Excel_Format import get_current_session
-except:
-    def get_current_session():
-        h = datetime.now().hour
-        return f"Session {min(max((h - 9) + 1, 1), 8)}"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from timetable import get_current_session
 
 app = Flask(__name__)
 CORS(app)
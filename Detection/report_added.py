@@ -20,29 +20,10 @@ from openpyxl.styles import Font, PatternFill, Alignment
 import io
 from bson.objectid import ObjectId
 import traceback
+from live_events import EventBroker
 
-sys.path.append(os.path.abspath('../'))
-try:
-    from Excel_Format import get_current_session
-except ImportError:
-    def get_current_session():
-        current_hour = datetime.now().hour
-        if 9 <= current_hour < 10:
-            return "Session 1"
-        elif 10 <= current_hour < 11:
-            return "Session 2"
-        elif 11 <= current_hour < 12:
-            return "Session 3"
-        elif 12 <= current_hour < 13:
-            return "Session 4"
-        elif 13 <= current_hour < 14:
-            return "Session 5"
-        elif 14 <= current_hour < 15:
-            return "Session 6"
-        elif 15 <= current_hour < 16:
-            return "Session 7"
-        else:
-            return "Session 8"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from timetable import get_current_session
 
 app = Flask(__name__)
 CORS(app)
@@ -67,6 +48,7 @@ YEAR_MAPPING = {
 attendance_system = None
 camera_running = False
 camera_lock = Lock()
+live_events = EventBroker()
 
 
 class FilePathResolver:
@@ -392,11 +374,30 @@ class DatabaseManager:
                     update_fields[f'sessions.{session_name}.start_time'] = current_time_str
                 
                 result = collection.update_one({}, {'$set': update_fields})
+                if prev_status != status or manual:
+                    self._publish_transition(collection_name, session_name, roll_no, student, update_fields)
                 return result.modified_count > 0
             except Exception as e:
                 print(f"Error updating: {e}")
                 return False
     
+    def _publish_transition(self, collection_name, session_name, roll_no, student, update_fields):
+        student_path = f'sessions.{session_name}.students.{roll_no}'
+        updated = {k: dict(v) if isinstance(v, dict) else v for k, v in student.items()}
+        for path, value in update_fields.items():
+            if path.startswith(student_path + '.'):
+                keys = path[len(student_path) + 1:].split('.')
+                target = updated
+                for k in keys[:-1]:
+                    target = target.setdefault(k, {})
+                target[keys[-1]] = value
+        live_events.publish('status', {
+            'collection_name': collection_name,
+            'session_name': session_name,
+            'roll_no': roll_no,
+            'student': updated
+        })
+    
     def _format_duration(self, seconds):
         try:
             seconds = int(seconds)
@@ -545,6 +546,7 @@ class DatabaseManager:
                     update_fields[f'{prefix}.flags.is_perm_absent'] = False
                 
                 collection.update_one({}, {'$set': update_fields})
+                live_events.publish('reset', {'collection_name': collection_name, 'session_name': session_name})
                 return len(students)
             except Exception as e:
                 return 0
@@ -776,6 +778,11 @@ class AttendanceSystem:
                 self.template_data,
                 camera_ids=self.camera_ids
             )
+            live_events.publish('session', {
+                'collection_name': self.current_collection,
+                'session_name': session,
+                'date': date_str
+            })
         
         for face_encoding, face_loc in zip(face_encodings, face_locations):
             matches = face_recognition.compare_faces(self.known_encodings, face_encoding, tolerance=0.6)
@@ -969,6 +976,32 @@ def get_current_session_data():
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def current_session_snapshot():
+    if not (attendance_system and attendance_system.current_collection and attendance_system.current_session):
+        return {'active': False}
+    return {
+        'active': True,
+        'collection_name': attendance_system.current_collection,
+        'session_name': attendance_system.current_session,
+        'date': attendance_system.current_date,
+        'summary': attendance_system.db_manager.get_session_summary(
+            attendance_system.current_collection,
+            attendance_system.current_session
+        ),
+        'attendance': attendance_system.db_manager.get_session_attendance(
+            attendance_system.current_collection,
+            attendance_system.current_session
+        )
+    }
+
+@app.route('/api/events', methods=['GET'])
+def live_event_stream():
+    return Response(
+        live_events.stream(current_session_snapshot),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/attendance/update', methods=['POST'])
 def update_attendance_manual():
     try:
@@ -1258,7 +1291,7 @@ table tr:hover{background:#f8f9fa}
 <script>
 const API=''+window.location.origin+'/api';
 const YM={'2022':'B.Tech','2023':'TY','2024':'SY','2025':'FY'};
-let running=false,interval=null,col=null,sess=null,conf=false,cfg={};
+let running=false,interval=null,col=null,sess=null,conf=false,cfg={},es=null,esErrors=0,records={};
 function confirmConfig(){
 const y=document.getElementById('year').value.trim();
 const d=document.getElementById('department').value.trim();
@@ -1329,11 +1362,16 @@ const r=await fetch(`${API}/current-session`);
 const d=await r.json();
 if(d.success&&d.active){
 col=d.collection_name;sess=d.session_name;
-updateStats(d.summary);displayData(d.attendance);
+updateStats(d.summary);setRecords(d.attendance);
 document.getElementById('clearBtn').disabled=false;
 }
 }catch(e){console.error(e)}
 }
+function setRecords(recs){
+records={};
+(recs||[]).forEach(r=>{records[r.roll_no]=r});
+displayData(recs);
+}
 function updateStats(s){
 document.getElementById('totalStudents').textContent=s.total||0;
 document.getElementById('presentCount').textContent=s.present||0;
@@ -1388,9 +1426,40 @@ else alert('Failed: '+(d.error||'Unknown'));
 function startRefresh(){
 if(interval)clearInterval(interval);
 updateInfo();
+if(window.EventSource&&esErrors<3){
+openEvents();
+interval=setInterval(updateInfo,5000);
+}else{
 interval=setInterval(()=>{updateInfo();refreshData()},5000);
 }
-function stopRefresh(){if(interval)clearInterval(interval)}
+}
+function openEvents(){
+if(es)es.close();
+es=new EventSource(`${API}/events`);
+es.addEventListener('snapshot',e=>{
+esErrors=0;
+const d=JSON.parse(e.data);
+if(d.active){col=d.collection_name;sess=d.session_name;setRecords(d.attendance);refreshStats()}
+});
+es.addEventListener('status',e=>{
+const d=JSON.parse(e.data);
+if(d.collection_name!==col||d.session_name!==sess)return;
+records[d.roll_no]=d.student;
+displayData(Object.values(records));
+refreshStats();
+});
+es.addEventListener('session',e=>{const d=JSON.parse(e.data);col=d.collection_name;sess=d.session_name;loadSession()});
+es.addEventListener('reset',()=>loadSession());
+es.onerror=()=>{if(++esErrors>=3){es.close();es=null;if(running)startRefresh()}};
+}
+function refreshStats(){
+const recs=Object.values(records);
+const c=st=>recs.filter(r=>r.status===st).length;
+const total=recs.length,present=c('Present');
+updateStats({total:total,present:present,absent:c('Absent'),temporary_absent:c('Temporary Absent'),
+attendance_percentage:total?present/total*100:0});
+}
+function stopRefresh(){if(interval)clearInterval(interval);if(es){es.close();es=null}}
 window.onload=()=>updateStatus(false);
 </script>
 </body>
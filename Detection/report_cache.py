@@ -0,0 +1,136 @@
+"""
+Report artifacts cached in memory and on disk, keyed by (collection, session, kind, data version)
+A day's data version changes with every attendance write, so a stale artifact is never served; writes
+in this process also drop their day's entries at once. Both tiers evict least-recently-used by size.
+"""
+
+import hashlib
+import json
+import os
+import struct
+from collections import OrderedDict
+from threading import Lock
+
+
+def data_version(versions):
+    """Short token for a day's {session: version} map"""
+    raw = json.dumps(sorted(versions.items()), separators=(',', ':'))
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+class ReportCache:
+    def __init__(self, directory, memory_bytes=64 << 20, disk_bytes=1 << 30):
+        self.directory = directory
+        self.memory_bytes, self.disk_bytes = memory_bytes, disk_bytes
+        self.memory = OrderedDict()  # name -> (body, headers)
+        self.memory_size = 0
+        self.disk = OrderedDict()  # name -> file size, least recently used first
+        self.disk_size = 0
+        self.hits = self.disk_hits = self.misses = 0
+        self.lock = Lock()
+        # Files from earlier runs stay usable; their mtime carries the LRU order across restarts
+        files = [e for e in os.scandir(directory) if e.is_file() and e.name.endswith('.bin')] \
+            if os.path.isdir(directory) else []
+        for e in sorted(files, key=lambda e: e.stat().st_mtime):
+            self.disk[e.name[:-4]] = e.stat().st_size
+            self.disk_size += e.stat().st_size
+        self._evict()
+
+    @staticmethod
+    def name(cn, sn, kind, version):
+        return f"{cn}.{(sn or 'all').replace(' ', '_')}.{kind}.{version}"
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + '.bin')
+
+    def get(self, cn, sn, kind, version):
+        """(body, headers) or None"""
+        name = self.name(cn, sn, kind, version)
+        with self.lock:
+            hit = self.memory.get(name)
+            if hit is not None:
+                self.memory.move_to_end(name)
+                self.hits += 1
+                return hit
+            on_disk = name in self.disk
+            if not on_disk:
+                self.misses += 1
+                return None
+            self.disk.move_to_end(name)
+        try:
+            with open(self._path(name), 'rb') as f:
+                (n,) = struct.unpack('>I', f.read(4))
+                headers = json.loads(f.read(n))
+                body = f.read()
+            os.utime(self._path(name))
+        except (OSError, ValueError, struct.error):
+            with self.lock:
+                self._drop_disk(name)
+                self.misses += 1
+            return None
+        with self.lock:
+            self.disk_hits += 1
+            self._remember(name, body, headers)
+        return body, headers
+
+    def put(self, cn, sn, kind, version, body, headers=None):
+        name = self.name(cn, sn, kind, version)
+        headers = headers or {}
+        meta = json.dumps(headers).encode()
+        path = self._path(name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(struct.pack('>I', len(meta)) + meta)
+                f.write(body)
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"Report cache write error: {e}")
+            size = None
+        with self.lock:
+            self._remember(name, body, headers)
+            if size is not None:
+                self.disk_size += size - self.disk.get(name, 0)
+                self.disk[name] = size
+                self.disk.move_to_end(name)
+            self._evict()
+
+    def invalidate(self, cn):
+        """Drop every artifact of collection cn"""
+        prefix = cn + '.'
+        with self.lock:
+            for name in [n for n in self.memory if n.startswith(prefix)]:
+                self.memory_size -= len(self.memory.pop(name)[0])
+            for name in [n for n in self.disk if n.startswith(prefix)]:
+                self._drop_disk(name)
+
+    def _remember(self, name, body, headers):
+        if len(body) > self.memory_bytes // 4:
+            return  # one huge export would flush everything else; it is served from disk
+        old = self.memory.pop(name, None)
+        if old is not None:
+            self.memory_size -= len(old[0])
+        self.memory[name] = (body, headers)
+        self.memory_size += len(body)
+        while self.memory_size > self.memory_bytes:
+            _, (b, _) = self.memory.popitem(last=False)
+            self.memory_size -= len(b)
+
+    def _drop_disk(self, name):
+        self.disk_size -= self.disk.pop(name, 0)
+        try:
+            os.unlink(self._path(name))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self.disk_size > self.disk_bytes and self.disk:
+            self._drop_disk(next(iter(self.disk)))
+
+    def stats(self):
+        with self.lock:
+            return {'memory_entries': len(self.memory), 'memory_bytes': self.memory_size,
+                    'disk_entries': len(self.disk), 'disk_bytes': self.disk_size,
+                    'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses}
@@ -0,0 +1,587 @@
+"""
+Storage backends for the attendance server
+AttendanceStore is the interface the routes use; MongoDB lives in DatabaseManager, SQLiteStore is the
+embedded backend for offline classrooms and local runs (one file, WAL mode, no server process)
+"""
+
+import base64
+import io
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from datetime import datetime
+from threading import RLock
+
+from intervals import transition, derive_many, present_at, fmt_duration, now_epoch
+
+YEAR_MAPPING = {'2022': 'B.Tech', '2023': 'TY', '2024': 'SY', '2025': 'FY'}
+STATUSES = ['Present', 'Temporary Absent', 'Permanently Absent', 'Absent']
+ALL_SESSIONS = [f"Session {i}" for i in range(1, 9)]
+DEFAULT_PAGE_SIZE = 50
+COLLECTION_FIELDS = ['collection_name', 'date', 'department', 'year', 'year_code', 'classroom', 'teacher_name', 'created_at']
+HISTORY_FIELDS = ['date', 'session', 'status', 'first_seen', 'last_seen', 'present_duration',
+                  'department', 'classroom', 'prn_no', 'roll_no', 'name']
+HISTORY_DEFAULTS = {'status': 'N/A', 'first_seen': 'N/A', 'last_seen': 'N/A', 'present_duration': '0 sec'}
+
+
+class AttendanceStore(ABC):
+    """
+    Operations the server needs from a backend. Collection names identify a day
+    (<dept>_<year_code>_<date>); students are the nested dicts produced by build_roster.
+    """
+
+    @abstractmethod
+    def ping(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_or_get_daily_collection(self, dept, year, date, room, teacher, roster, cams=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_day_document(self, cn):
+        """Day metadata plus the names of the sessions that have run, or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def ensure_session(self, cn, sn):
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_prn_by_identifier(self, cn, sn, ident):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_student_attendance(self, cn, sn, prn, status, manual=False):
+        raise NotImplementedError
+
+    @abstractmethod
+    def batch_update_attendance(self, cn, sn, updates_dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_session_attendance(self, cn, sn):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_session_version(self, cn, sn):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_session_changes(self, cn, sn, since):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_session_summary(self, cn, sn):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_day_versions(self, cn):
+        """{session: version} for the sessions that have run, or None if the day does not exist"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_all_daily_collections(self, limit=DEFAULT_PAGE_SIZE, after=None, fields=None, date_from=None, date_to=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_student_history(self, ident, field='prn_no', limit=DEFAULT_PAGE_SIZE, after=None, fields=None,
+                            date_from=None, date_to=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_student_statistics(self, ident, field='prn_no', date_from=None, date_to=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear_session_data(self, cn, sn):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_present_at(self, cn, when, sn=None):
+        """Students whose presence intervals cover datetime when, per session (all run sessions if sn is None)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_session_intervals(self, cn, sn):
+        """Stored students of a run session with their raw presence intervals, or None"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _present_at(students, when):
+        epoch = int(when.timestamp())
+        return [{'prn_no': students[i].get('prn_no', ''), 'roll_no': students[i].get('roll_no', ''),
+                 'name': students[i].get('name', '')} for i in present_at(students, epoch)]
+
+    def backfill_attendance_records(self):
+        return 0
+
+    def archive_days(self, older_than_days=None):
+        """Move days older than older_than_days out of the hot store; a single-file backend keeps them"""
+        return {'archived': 0, 'bytes': 0, 'cutoff': None}
+
+    def close(self):
+        pass
+
+    def _get_year_code(self, year):
+        return YEAR_MAPPING.get(str(year), 'B.Tech')
+
+    @staticmethod
+    def _norm(value):
+        return ' '.join(str(value or '').split()).upper()
+
+    _fmt = staticmethod(fmt_duration)
+
+    @staticmethod
+    def _summary(counts):
+        t = sum(counts.values())
+        p = counts.get('Present', 0)
+        return {
+            'total': t, 'present': p,
+            'temporary_absent': counts.get('Temporary Absent', 0),
+            'permanently_absent': counts.get('Permanently Absent', 0),
+            'absent': counts.get('Absent', 0),
+            'attendance_percentage': round((p / t * 100), 2) if t > 0 else 0
+        }
+
+    @staticmethod
+    def _statistics(counts):
+        t = sum(counts.values())
+        p = counts.get('Present', 0)
+        return {'total_sessions': t, 'present': p, 'absent': t - p,
+                'attendance_percentage': round((p / t * 100), 2) if t > 0 else 0}
+
+    def _publish(self, event_type, data):
+        """Hook for live updates; the server wires it to its event broker"""
+
+    def _written(self, cn):
+        """Hook called after any write to day cn; the server drops its cached reports"""
+
+    def get_session_data_for_preview(self, cn, sn):
+        doc = self.get_day_document(cn)
+        if not doc:
+            return None
+        stus = self.get_session_attendance(cn, sn)
+        if not stus and sn not in ALL_SESSIONS:
+            return None
+        return {
+            'date': doc['date'], 'department': doc['department'], 'classroom': doc['classroom'],
+            'teacher_name': doc['teacher_name'], 'session_name': sn,
+            'summary': self.get_session_summary(cn, sn),
+            'students': stus
+        }
+
+    def generate_excel_report(self, cn, sn=None):
+        """The day's (or one session's) report as an xlsx stream, or None if the day is unknown or unwritable"""
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font, PatternFill
+        from openpyxl.utils.exceptions import IllegalCharacterError
+        try:
+            doc = self.get_day_document(cn)
+            if not doc:
+                return None
+            # Write-only: rows are spooled as they are appended and styles are shared, not built per cell
+            wb = Workbook(write_only=True)
+            summ = wb.create_sheet("Summary")
+            title = WriteOnlyCell(summ, f"Attendance Report - {doc['date']}")
+            title.font = Font(bold=True, size=14)
+            summ.append([title])
+            summ.append([f"Department: {doc['department']}"])
+            summ.append([f"Classroom: {doc['classroom']}"])
+            summ.append([f"Teacher: {doc['teacher_name']}"])
+            hfont, hfill = Font(bold=True, color="FFFFFF"), PatternFill(start_color="4472C4", fill_type="solid")
+            hdrs = ['PRN No', 'Roll No', 'Name', 'Status', 'First Seen', 'Last Seen',
+                    'Present Duration', 'Absent Duration']
+            for sess in ([sn] if sn else ALL_SESSIONS):
+                if sess not in doc['sessions']:
+                    continue
+                sh = wb.create_sheet(sess[:31])
+                header = []
+                for h in hdrs:
+                    cell = WriteOnlyCell(sh, h)
+                    cell.font, cell.fill = hfont, hfill
+                    header.append(cell)
+                sh.append(header)
+                for s in self.get_session_attendance(cn, sess):
+                    sh.append([s['prn_no'], s['roll_no'], s['name'], s['status'],
+                               s['timestamps'].get('first_seen', 'N/A'), s['timestamps'].get('last_seen', 'N/A'),
+                               s['durations'].get('total_present_human', '0 sec'),
+                               s['durations'].get('total_absent_human', '0 sec')])
+            ef = io.BytesIO()
+            wb.save(ef)
+            ef.seek(0)
+            return ef
+        except (IllegalCharacterError, ValueError, OSError) as e:
+            print(f"Excel report error for {cn}: {e}")
+            return None
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS days (
+    id INTEGER PRIMARY KEY,
+    collection_name TEXT NOT NULL UNIQUE,
+    date TEXT NOT NULL, department TEXT, year TEXT, year_code TEXT,
+    classroom TEXT, teacher_name TEXT, camera_ids TEXT,
+    roster TEXT NOT NULL, metadata TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS days_created ON days (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS days_date ON days (date);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    collection_name TEXT NOT NULL REFERENCES days (collection_name),
+    session TEXT NOT NULL,
+    start_time TEXT, end_time TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (collection_name, session)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS attendance (
+    id INTEGER PRIMARY KEY,
+    collection_name TEXT NOT NULL,
+    session TEXT NOT NULL,
+    prn_no TEXT NOT NULL,
+    roll_no TEXT, roll_no_norm TEXT, name TEXT, name_norm TEXT,
+    date TEXT NOT NULL, department TEXT, classroom TEXT, year_code TEXT,
+    status TEXT NOT NULL DEFAULT 'Absent',
+    intervals TEXT NOT NULL DEFAULT '[]',
+    updated INTEGER,
+    first_seen TEXT, last_seen TEXT,
+    total_present_seconds INTEGER NOT NULL DEFAULT 0,
+    manual_override INTEGER NOT NULL DEFAULT 0,
+    is_temp_absent INTEGER NOT NULL DEFAULT 0,
+    is_perm_absent INTEGER NOT NULL DEFAULT 0,
+    using_roll_as_prn INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    UNIQUE (collection_name, session, prn_no)
+);
+CREATE INDEX IF NOT EXISTS attendance_status ON attendance (collection_name, session, status);
+CREATE INDEX IF NOT EXISTS attendance_version ON attendance (collection_name, session, version);
+CREATE INDEX IF NOT EXISTS attendance_prn ON attendance (prn_no, created_at DESC, id);
+CREATE INDEX IF NOT EXISTS attendance_roll ON attendance (roll_no_norm, created_at DESC, id);
+CREATE INDEX IF NOT EXISTS attendance_name ON attendance (name_norm, created_at DESC, id);
+"""
+
+# Everything but the roster, which is only needed to materialize a session
+DAY_COLUMNS = 'date, department, year, year_code, classroom, teacher_name, camera_ids, metadata, created_at'
+HISTORY_COLUMNS = {'prn_no': 'prn_no', 'roll_no': 'roll_no_norm', 'name': 'name_norm'}
+
+
+class SQLiteStore(AttendanceStore):
+    """Embedded backend: one row per student-session, so history and summaries are plain indexed queries"""
+
+    def __init__(self, path='attendance.db'):
+        self.path = path
+        self.lock = RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self.conn.executescript(SCHEMA)
+
+    def ping(self):
+        with self.lock:
+            self.conn.execute('SELECT 1')
+        return True
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    @staticmethod
+    def _encode_cursor(created_at, rid):
+        return base64.urlsafe_b64encode(f"{created_at}|{rid}".encode()).decode().rstrip('=')
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            ts, rid = raw.split('|', 1)
+            return ts, int(rid)
+        except Exception:
+            raise ValueError('Invalid cursor')
+
+    @staticmethod
+    def _date_clause(where, params, date_from, date_to, col='date'):
+        if date_from:
+            where.append(f'{col} >= ?')
+            params.append(date_from)
+        if date_to:
+            where.append(f'{col} <= ?')
+            params.append(date_to)
+
+    @staticmethod
+    def _student(row):
+        """Stored student (the Mongo shape, intervals not yet derived) from an attendance row"""
+        return {'prn_no': row['prn_no'], 'roll_no': row['roll_no'], 'name': row['name'],
+                'status': row['status'], 'version': row['version'],
+                'intervals': json.loads(row['intervals']), 'updated': row['updated'],
+                'flags': {'manual_override': bool(row['manual_override']),
+                          'is_temp_absent': bool(row['is_temp_absent']),
+                          'is_perm_absent': bool(row['is_perm_absent']),
+                          'using_roll_as_prn': bool(row['using_roll_as_prn'])}}
+
+    def create_or_get_daily_collection(self, dept, year, date, room, teacher, roster, cams=None):
+        yc = self._get_year_code(year)
+        cn = f"{dept}_{yc}_{date}"
+        students, counts = roster
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR IGNORE INTO days (collection_name, date, department, year, year_code, classroom, '
+                'teacher_name, camera_ids, roster, metadata, created_at) VALUES (?,?,?,?,?,?,?,?,?,?,?)',
+                (cn, date, dept, str(year), yc, room, teacher, json.dumps(cams or []), json.dumps(students),
+                 json.dumps(counts), datetime.now().isoformat()))
+        return cn
+
+    def _day(self, cn, columns='*'):
+        return self.conn.execute(f'SELECT {columns} FROM days WHERE collection_name = ?', (cn,)).fetchone()
+
+    def get_day_document(self, cn):
+        with self.lock:
+            day = self._day(cn, DAY_COLUMNS)
+            if not day:
+                return None
+            sessions = [r['session'] for r in self.conn.execute(
+                'SELECT session FROM sessions WHERE collection_name = ?', (cn,))]
+        return {'collection_name': cn, 'date': day['date'], 'department': day['department'],
+                'year': day['year'], 'year_code': day['year_code'], 'classroom': day['classroom'],
+                'teacher_name': day['teacher_name'], 'camera_ids': json.loads(day['camera_ids'] or '[]'),
+                'created_at': day['created_at'], 'metadata': json.loads(day['metadata'] or '{}'),
+                'sessions': [s for s in ALL_SESSIONS if s in sessions]}
+
+    def _materialize_session(self, cn, sn):
+        """Insert the session's rows from the roster on first use; False if it cannot exist"""
+        if self.conn.execute('SELECT 1 FROM sessions WHERE collection_name = ? AND session = ?',
+                             (cn, sn)).fetchone():
+            return True
+        day = self._day(cn)
+        if not day or sn not in ALL_SESSIONS:
+            return False
+        now = now_epoch()
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            cur = self.conn.execute('INSERT OR IGNORE INTO sessions (collection_name, session) VALUES (?, ?)',
+                                    (cn, sn))
+            if cur.rowcount:
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO attendance (collection_name, session, prn_no, roll_no, roll_no_norm, '
+                    'name, name_norm, date, department, classroom, year_code, updated, using_roll_as_prn, '
+                    'created_at) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                    [(cn, sn, prn, s.get('roll_no', ''), self._norm(s.get('roll_no')), s.get('name', ''),
+                      self._norm(s.get('name')), day['date'], day['department'], day['classroom'],
+                      day['year_code'], now, int(s.get('flags', {}).get('using_roll_as_prn', False)),
+                      day['created_at'])
+                     for prn, s in json.loads(day['roster']).items()])
+        self._written(cn)
+        return True
+
+    def ensure_session(self, cn, sn):
+        with self.lock:
+            return self._materialize_session(cn, sn)
+
+    def _session_rows(self, cn, sn, where='', params=()):
+        return self.conn.execute(f'SELECT * FROM attendance WHERE collection_name = ? AND session = ? {where} '
+                                 'ORDER BY id', (cn, sn) + tuple(params)).fetchall()
+
+    def _session_students(self, cn, sn):
+        """prn -> student for a session, falling back to the roster for sessions not yet run"""
+        rows = self._session_rows(cn, sn)
+        if rows:
+            return {r['prn_no']: self._student(r) for r in rows}
+        day = self._day(cn)
+        if day and sn in ALL_SESSIONS:
+            return json.loads(day['roster'])
+        return None
+
+    def find_prn_by_identifier(self, cn, sn, ident):
+        with self.lock:
+            stus = self._session_students(cn, sn)
+        for prn, stu in (stus or {}).items():
+            if stu.get('roll_no', '').upper() == ident.upper() or stu.get('name', '').upper() == ident.upper():
+                return prn
+        return None
+
+    def _counts(self, cn, sn):
+        counts = dict.fromkeys(STATUSES, 0)
+        for r in self.conn.execute('SELECT status, COUNT(*) AS n FROM attendance '
+                                   'WHERE collection_name = ? AND session = ? GROUP BY status', (cn, sn)):
+            counts[r['status']] = r['n']
+        return counts
+
+    def _apply(self, cn, sn, updates, manual):
+        """Write {prn: status} in one transaction; returns [(old_status, derived_student)]"""
+        now = now_epoch()
+        with self.conn:
+            # Read under the write lock, so a writer in another process cannot transition the same rows in between
+            self.conn.execute('BEGIN IMMEDIATE')
+            rows = {r['prn_no']: r for r in self._session_rows(
+                cn, sn, f"AND prn_no IN ({','.join('?' * len(updates))})", updates.keys())}
+            if not rows:
+                return []
+            version = self.conn.execute('UPDATE sessions SET version = version + 1, '
+                                        'start_time = COALESCE(start_time, ?) WHERE collection_name = ? '
+                                        'AND session = ? RETURNING version',
+                                        (datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S'), cn, sn)
+                                        ).fetchone()['version']
+            prns = [p for p in updates if p in rows]
+            students = [dict(transition(self._student(rows[p]), updates[p], now, manual)[1], version=version)
+                        for p in prns]
+            derived = derive_many(students)
+            self.conn.executemany(
+                'UPDATE attendance SET status = ?, intervals = ?, updated = ?, first_seen = ?, last_seen = ?, '
+                'total_present_seconds = ?, manual_override = ?, version = ? WHERE id = ?',
+                [(s['status'], json.dumps(s['intervals']), now, d['timestamps']['first_seen'],
+                  d['timestamps']['last_seen'], d['durations']['total_present_seconds'], int(manual), version,
+                  rows[s['prn_no']]['id']) for s, d in zip(students, derived)])
+        self._written(cn)
+        return [(rows[p]['status'], d) for p, d in zip(prns, derived)]
+
+    def _publish_changes(self, cn, sn, changed, manual):
+        if not any(ps != stu['status'] or manual for ps, stu in changed):
+            return
+        summary = self.get_session_summary(cn, sn)
+        for ps, stu in changed:
+            if ps != stu['status'] or manual:
+                self._publish('status', {'collection_name': cn, 'session_name': sn, 'prn_no': stu['prn_no'],
+                                         'version': stu['version'], 'student': stu, 'summary': summary})
+
+    def update_student_attendance(self, cn, sn, prn, status, manual=False):
+        with self.lock:
+            if not self._materialize_session(cn, sn):
+                return False
+            changed = self._apply(cn, sn, {prn: status}, manual)
+        self._publish_changes(cn, sn, changed, manual)
+        return bool(changed)
+
+    def batch_update_attendance(self, cn, sn, updates_dict):
+        with self.lock:
+            if not updates_dict or not self._materialize_session(cn, sn):
+                return 0
+            changed = self._apply(cn, sn, {prn: u['status'] for prn, u in updates_dict.items()}, False)
+        self._publish_changes(cn, sn, changed, False)
+        return len(changed)
+
+    def get_session_attendance(self, cn, sn):
+        with self.lock:
+            stus = self._session_students(cn, sn)
+        return derive_many(list(stus.values())) if stus else []
+
+    def get_session_version(self, cn, sn):
+        with self.lock:
+            r = self.conn.execute('SELECT version FROM sessions WHERE collection_name = ? AND session = ?',
+                                  (cn, sn)).fetchone()
+        return r['version'] if r else 0
+
+    def get_session_changes(self, cn, sn, since):
+        with self.lock:
+            version = self.get_session_version(cn, sn)
+            rows = self._session_rows(cn, sn, 'AND version > ?', (since,))
+        return version, derive_many([self._student(r) for r in rows])
+
+    def get_session_summary(self, cn, sn):
+        with self.lock:
+            counts = self._counts(cn, sn)
+            if not any(counts.values()):
+                # Session not run yet: everyone on the roster is absent
+                day = self._day(cn)
+                if not day or sn not in ALL_SESSIONS:
+                    return {}
+                counts['Absent'] = len(json.loads(day['roster']))
+        return self._summary(counts)
+
+    def get_day_versions(self, cn):
+        with self.lock:
+            if not self._day(cn, 'id'):
+                return None
+            return {r['session']: r['version'] for r in self.conn.execute(
+                'SELECT session, version FROM sessions WHERE collection_name = ?', (cn,))}
+
+    def get_all_daily_collections(self, limit=DEFAULT_PAGE_SIZE, after=None, fields=None, date_from=None, date_to=None):
+        where, params = [], []
+        self._date_clause(where, params, date_from, date_to)
+        if after:
+            ts, rid = self._decode_cursor(after)
+            where.append('(created_at < ? OR (created_at = ? AND id < ?))')
+            params += [ts, ts, rid]
+        cols = ', '.join(dict.fromkeys(['id', 'created_at'] + (fields or COLLECTION_FIELDS)))
+        sql = (f"SELECT {cols} FROM days {'WHERE ' + ' AND '.join(where) if where else ''} "
+               'ORDER BY created_at DESC, id DESC LIMIT ?')
+        with self.lock:
+            rows = self.conn.execute(sql, params + [limit + 1]).fetchall()
+        nxt = self._encode_cursor(rows[limit - 1]['created_at'], rows[limit - 1]['id']) if len(rows) > limit else None
+        cols = []
+        for r in rows[:limit]:
+            c = {'_id': str(r['id'])}
+            for f in fields or COLLECTION_FIELDS:
+                c[f] = r[f]
+            if 'created_at' in c:
+                c['created_at'] = datetime.fromisoformat(c['created_at']).strftime('%Y-%m-%d %H:%M:%S')
+            cols.append(c)
+        return cols, nxt
+
+    def _history_where(self, ident, field, date_from=None, date_to=None):
+        key = HISTORY_COLUMNS.get(field, 'prn_no')
+        where, params = [f'{key} = ?'], [ident if key == 'prn_no' else self._norm(ident)]
+        self._date_clause(where, params, date_from, date_to)
+        return where, params
+
+    def get_student_history(self, ident, field='prn_no', limit=DEFAULT_PAGE_SIZE, after=None, fields=None,
+                            date_from=None, date_to=None):
+        where, params = self._history_where(ident, field, date_from, date_to)
+        if after:
+            ts, rid = self._decode_cursor(after)
+            where.append('(created_at < ? OR (created_at = ? AND id > ?))')
+            params += [ts, ts, rid]
+        with self.lock:
+            rows = self.conn.execute(f"SELECT * FROM attendance WHERE {' AND '.join(where)} "
+                                     'ORDER BY created_at DESC, id ASC LIMIT ?', params + [limit + 1]).fetchall()
+        nxt = self._encode_cursor(rows[limit - 1]['created_at'], rows[limit - 1]['id']) if len(rows) > limit else None
+        hist = []
+        for r in rows[:limit]:
+            rec = dict(r, present_duration=self._fmt(r['total_present_seconds']))
+            hist.append({f: rec.get(f) or HISTORY_DEFAULTS.get(f, '') for f in fields or HISTORY_FIELDS})
+        return hist, nxt
+
+    def get_student_statistics(self, ident, field='prn_no', date_from=None, date_to=None):
+        where, params = self._history_where(ident, field, date_from, date_to)
+        with self.lock:
+            counts = {r['status']: r['n'] for r in self.conn.execute(
+                f"SELECT status, COUNT(*) AS n FROM attendance WHERE {' AND '.join(where)} GROUP BY status", params)}
+        return self._statistics(counts)
+
+    def clear_session_data(self, cn, sn):
+        with self.lock, self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            r = self.conn.execute('UPDATE sessions SET version = version + 1 WHERE collection_name = ? '
+                                  'AND session = ? RETURNING version', (cn, sn)).fetchone()
+            if not r:
+                return 0
+            cur = self.conn.execute(
+                "UPDATE attendance SET status = 'Absent', intervals = '[]', updated = ?, first_seen = NULL, "
+                'last_seen = NULL, total_present_seconds = 0, manual_override = 0, is_temp_absent = 0, '
+                'is_perm_absent = 0, version = ? WHERE collection_name = ? AND session = ?',
+                (now_epoch(), r['version'], cn, sn))
+            count = cur.rowcount
+        self._written(cn)
+        self._publish('reset', {'collection_name': cn, 'session_name': sn})
+        return count
+
+    def get_session_intervals(self, cn, sn):
+        with self.lock:
+            rows = self._session_rows(cn, sn)
+            return [self._student(r) for r in rows] if rows else None
+
+    def get_present_at(self, cn, when, sn=None):
+        with self.lock:
+            doc = self.get_day_document(cn)
+            if not doc:
+                return None
+            result = {}
+            for sess in ([sn] if sn else doc['sessions']):
+                students = [self._student(r) for r in self._session_rows(cn, sess)]
+                result[sess] = self._present_at(students, when)
+        return result
@@ -0,0 +1,28 @@
+"""
+Term bitmap counts, with and without np.bitwise_count (NumPy 2.0+).
+Run: python -m pytest -q test_bitmaps.py
+"""
+
+import numpy as np
+
+import bitmaps
+
+
+def make_term():
+    bm = bitmaps.TermBitmaps()
+    students = [(f'P{i}', f'STUDENT {i}') for i in range(5)]
+    for d in range(1, 12):
+        bm.set_session(f'2025-02-{d:02d}', 'Session 1', students, [(i + d) % 3 != 0 for i in range(5)])
+    return bm
+
+
+def test_counts_follow_the_recorded_sessions():
+    present, held = make_term().counts()
+    assert held.tolist() == [11] * 5
+    assert present.tolist() == [sum((i + d) % 3 != 0 for d in range(1, 12)) for i in range(5)]
+
+
+def test_counts_without_bitwise_count(monkeypatch):
+    expected = [a.tolist() for a in make_term().counts()]
+    monkeypatch.delattr(np, 'bitwise_count', raising=False)
+    assert [a.tolist() for a in make_term().counts()] == expected
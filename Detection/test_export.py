@@ -0,0 +1,114 @@
+"""
+Round trips for every format available_formats() advertises: the streamed file is read back with its own
+library and must hold exactly the rows iter_rows produced.
+Run: python -m pytest -q test_export.py
+"""
+
+import csv
+import io
+
+import pytest
+from werkzeug.test import EnvironBuilder
+
+import export
+from jobs import Job
+from storage import SQLiteStore
+from test_storage import SESSION, make_roster
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'attendance.db')
+    db = SQLiteStore(path)
+    prns = list(make_roster()[0])
+    for date in ('2025-02-03', '2025-02-04'):
+        cn = db.create_or_get_daily_collection('CSE', '2023', date, 'A101', 'Teacher', make_roster())
+        db.update_student_attendance(cn, SESSION, prns[0], 'Present')
+        db.update_student_attendance(cn, 'Session 2', prns[1], 'Temporary Absent')
+    db.close()
+    return path
+
+
+def expected_rows(path):
+    db = SQLiteStore(path)
+    rows = list(export.iter_rows(db, export.iter_days(db)))
+    db.close()
+    assert len(rows) == 2 * 2 * 4  # two days of two written sessions of four students
+    return rows
+
+
+def exported(path, fmt):
+    return b''.join(export.stream_export(SQLiteStore(path), fmt))
+
+
+def as_text(rows):
+    return [['' if v is None else str(v) for v in row] for row in rows]
+
+
+def test_csv_round_trip(db_path):
+    rows = list(csv.reader(io.StringIO(exported(db_path, 'csv').decode('utf-8-sig'))))
+    assert rows[0] == export.EXPORT_COLUMNS
+    assert rows[1:] == as_text(expected_rows(db_path))
+
+
+def test_xlsx_round_trip(db_path):
+    openpyxl = pytest.importorskip('openpyxl')
+    assert 'xlsx' in export.available_formats()
+    wb = openpyxl.load_workbook(io.BytesIO(exported(db_path, 'xlsx')), read_only=True)
+    rows = list(wb['Attendance'].iter_rows(values_only=True))
+    assert list(rows[0]) == export.EXPORT_COLUMNS
+    assert as_text(rows[1:]) == as_text(expected_rows(db_path))
+
+
+def test_parquet_round_trip(db_path, monkeypatch):
+    pq = pytest.importorskip('pyarrow.parquet')
+    assert 'parquet' in export.available_formats()
+    monkeypatch.setattr(export, 'PARQUET_ROW_GROUP', 5)  # several row groups, each drained as its own chunk
+    data = exported(db_path, 'parquet')
+    table = pq.read_table(io.BytesIO(data))
+    assert table.column_names == export.EXPORT_COLUMNS
+    assert pq.ParquetFile(io.BytesIO(data)).num_row_groups > 1
+    assert [tuple(r.values()) for r in table.to_pylist()] == [tuple(r) for r in expected_rows(db_path)]
+
+
+def test_available_formats_follow_installed_writers(monkeypatch):
+    monkeypatch.setattr(export, 'openpyxl', None)
+    monkeypatch.setattr(export, 'pyarrow', None)
+    assert export.available_formats() == ['csv']
+
+
+def test_export_closes_the_store_when_the_client_leaves_early(db_path, monkeypatch):
+    server = pytest.importorskip('present_duration_added')
+    closed = []
+    db = SQLiteStore(db_path)
+    monkeypatch.setattr(db, 'close', lambda: closed.append(True))
+    monkeypatch.setattr(server, 'open_db', lambda: db)
+    environ = EnvironBuilder('/api/reports/export', query_string={'format': 'csv', 'from': '2025-02-03', 'to': '2025-02-04'}).get_environ()
+    status = []
+    body = server.app(environ, lambda s, headers: status.append(s))
+    assert status == ['200 OK'] and not closed
+    body.close()  # what the WSGI server does when the client is gone before the first chunk
+    assert closed
+
+
+def test_long_or_open_ended_export_is_queued_unless_asked_to_stream(db_path, monkeypatch):
+    server = pytest.importorskip('present_duration_added')
+    monkeypatch.setattr(server, 'open_db', lambda: SQLiteStore(db_path))
+    monkeypatch.setattr(server.report_jobs, 'submit', lambda kind, params, run: Job(kind, params))
+    client = server.app.test_client()
+    assert client.get('/api/reports/export?format=csv').status_code == 202
+    assert client.get('/api/reports/export?format=csv&from=2025-01-01&to=2025-03-01').status_code == 202
+    assert client.get('/api/reports/export?format=csv&from=2025-02-01&to=2025-02-28').status_code == 200
+    assert client.get('/api/reports/export?format=csv&async=0').status_code == 200
+    assert client.get('/api/reports/export?format=csv&from=2025-02-03&async=1').status_code == 202
+    assert client.get('/api/reports/export?format=csv&from=03-02-2025').status_code == 400
+
+
+def test_formats_an_endpoint_cannot_produce_are_refused():
+    server = pytest.importorskip('present_duration_added')
+    client = server.app.test_client()
+    for url in ('/api/analytics/defaulters?format=parquet', '/api/analytics/bits/below?format=parquet',
+                '/api/reports/export?format=pdf'):
+        resp = client.get(url)
+        assert resp.status_code == 406 and 'format must be one of' in resp.get_json()['error']
+    assert client.get('/api/analytics/bits/below?format=columnar').status_code == 400  # past the check: no department
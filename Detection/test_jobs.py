@@ -0,0 +1,50 @@
+"""
+JobQueue deadlines: a job past timeout_seconds reads as failed and whatever it writes later is discarded.
+Run: python -m pytest -q test_jobs.py
+"""
+
+import os
+import threading
+
+from jobs import JobQueue
+
+
+def wait_for(queue, job, state):
+    for _ in range(200):
+        if queue.get(job.id).state == state:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(f'job stayed {job.state}')
+
+
+def test_job_past_its_deadline_fails_and_its_file_is_dropped(tmp_path):
+    queue = JobQueue(str(tmp_path), workers=1, timeout_seconds=0.05)
+    release = threading.Event()
+
+    def run(path):
+        release.wait(5)
+        with open(path, 'wb') as f:
+            f.write(b'late')
+        return 'text/csv', 'late.csv'
+
+    job = queue.submit('export', {}, run)
+    wait_for(queue, job, 'failed')
+    assert job.error.startswith('timed out') and queue.stats()['failed'] == 1
+    assert [j.id for j in queue.recent()] == [job.id]
+    release.set()
+    queue.pool.shutdown(wait=True)
+    assert queue.get(job.id).state == 'failed' and job.path is None
+    assert not os.listdir(tmp_path)
+
+
+def test_job_within_its_deadline_is_done(tmp_path):
+    queue = JobQueue(str(tmp_path), workers=1)
+
+    def run(path):
+        with open(path, 'wb') as f:
+            f.write(b'rows')
+        return 'text/csv', 'rows.csv'
+
+    job = queue.submit('export', {}, run)
+    queue.pool.shutdown(wait=True)
+    assert queue.get(job.id).state == 'done' and job.bytes == 4
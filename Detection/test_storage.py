@@ -0,0 +1,262 @@
+"""
+One behavioural suite for every AttendanceStore backend: the embedded SQLiteStore and the Mongo
+DatabaseManager (against mongomock, or a live mongod when ATTENDANCE_TEST_MONGO=host:port is set).
+mongomock 4.x rejects the bulk UpdateOne of pymongo 4.9 and later, so use pymongo<4.9 with it.
+Run: python -m pytest -q test_storage.py
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import export
+from storage import STATUSES, SQLiteStore
+
+SESSION = 'Session 1'
+
+
+def make_roster(n=4):
+    """(students, counts) in the shape RosterMixin.build_roster returns"""
+    students = {}
+    for i in range(n):
+        prn = f'10322{i:05d}'
+        students[prn] = {'prn_no': prn, 'roll_no': f'R{i + 1}', 'name': f'STUDENT {i + 1}',
+                         'flags': {'manual_override': False, 'is_temp_absent': False, 'is_perm_absent': False,
+                                   'using_roll_as_prn': False},
+                         'status': 'Absent', 'intervals': [], 'updated': None}
+    return students, {'prn_count': n, 'roll_fallback_count': 0, 'skipped_count': 0}
+
+
+def sqlite_store(tmp_path, monkeypatch):
+    return SQLiteStore(str(tmp_path / 'attendance.db'))
+
+
+def mongo_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # report cache, rollups and archive directories of the server module
+    server = pytest.importorskip('present_duration_added')
+    for state in (server.known_collections, server.session_counts, server.identifier_index, server.archived_days):
+        state.clear()
+    live = os.environ.get('ATTENDANCE_TEST_MONGO')
+    if live:
+        host, port = live.split(':')
+        config = {'host': host, 'port': int(port), 'database': f'attendance_test_{os.getpid()}'}
+    else:
+        mongomock = pytest.importorskip('mongomock')
+        monkeypatch.setattr(server, 'MongoClient', mongomock.MongoClient)
+        config = {'host': 'localhost', 'port': 27017, 'database': f'attendance_test_{tmp_path.name}'}
+    db = server.DatabaseManager(config)
+    db.client.drop_database(config['database'])
+    return db
+
+
+@pytest.fixture(params=[sqlite_store, mongo_store], ids=['sqlite', 'mongo'])
+def store(request, tmp_path, monkeypatch):
+    db = request.param(tmp_path, monkeypatch)
+    yield db
+    if getattr(db, 'client', None) is not None:
+        db.client.drop_database(db.config['database'])
+    db.close()
+
+
+@pytest.fixture
+def roster():
+    return make_roster()
+
+
+def new_day(store, roster, date='2025-02-03'):
+    return store.create_or_get_daily_collection('CSE', '2023', date, 'A101', 'Teacher', roster)
+
+
+def test_create_and_get_day(store, roster):
+    cn = new_day(store, roster)
+    assert cn == 'CSE_TY_2025-02-03'
+    assert new_day(store, roster) == cn
+    doc = store.get_day_document(cn)
+    assert (doc['date'], doc['department'], doc['classroom'], doc['teacher_name']) == \
+           ('2025-02-03', 'CSE', 'A101', 'Teacher')
+    assert store.get_day_document('CSE_TY_1999-01-01') is None
+    cols, nxt = store.get_all_daily_collections()
+    assert [c['collection_name'] for c in cols] == [cn] and nxt is None
+
+
+def test_session_is_roster_until_written(store, roster):
+    cn = new_day(store, roster)
+    rows = store.get_session_attendance(cn, SESSION)
+    assert sorted(r['prn_no'] for r in rows) == sorted(roster[0])
+    assert {r['status'] for r in rows} == {'Absent'}
+    assert store.get_session_summary(cn, SESSION)['absent'] == len(roster[0])
+
+
+def test_update_student_attendance(store, roster):
+    cn = new_day(store, roster)
+    prn = next(iter(roster[0]))
+    before = store.get_session_version(cn, SESSION)
+    assert store.update_student_attendance(cn, SESSION, prn, 'Present')
+    assert store.get_session_version(cn, SESSION) > before
+    row = next(r for r in store.get_session_attendance(cn, SESSION) if r['prn_no'] == prn)
+    assert row['status'] == 'Present'
+    assert row['timestamps']['first_seen'] is not None
+    assert store.get_session_intervals(cn, SESSION)[0]['intervals']
+    assert not store.update_student_attendance(cn, SESSION, 'unknown-prn', 'Present')
+
+
+def test_summary_counts_follow_transitions(store, roster):
+    cn = new_day(store, roster)
+    prns = list(roster[0])
+    store.batch_update_attendance(cn, SESSION, {prns[0]: {'status': 'Present'}, prns[1]: {'status': 'Present'},
+                                               prns[2]: {'status': 'Temporary Absent'}})
+    store.update_student_attendance(cn, SESSION, prns[1], 'Permanently Absent', manual=True)
+    summary = store.get_session_summary(cn, SESSION)
+    assert summary == {'total': 4, 'present': 1, 'temporary_absent': 1, 'permanently_absent': 1, 'absent': 1,
+                       'attendance_percentage': 25.0}
+    assert set(store.get_day_versions(cn)) == {SESSION}
+    store.clear_session_data(cn, SESSION)
+    assert store.get_session_summary(cn, SESSION)['absent'] == 4
+
+
+def test_paginated_history_and_statistics(store, roster):
+    prn = next(iter(roster[0]))
+    dates = ['2025-02-03', '2025-02-04', '2025-02-05']
+    for i, date in enumerate(dates):
+        cn = new_day(store, roster, date)
+        store.update_student_attendance(cn, SESSION, prn, 'Present' if i else 'Temporary Absent')
+    seen, after = [], None
+    while True:
+        page, after = store.get_student_history(prn, limit=2, after=after)
+        assert len(page) <= 2
+        seen += page
+        if after is None:
+            break
+    assert sorted(r['date'] for r in seen) == dates
+    assert {r['session'] for r in seen} == {SESSION}
+    stats = store.get_student_statistics(prn)
+    assert (stats['total_sessions'], stats['present']) == (3, 2)
+    page, _ = store.get_student_history(prn, date_from='2025-02-04', date_to='2025-02-04')
+    assert [r['date'] for r in page] == ['2025-02-04']
+
+
+def test_history_keeps_each_class_on_the_same_date(store, roster):
+    prn = next(iter(roster[0]))
+    cse = new_day(store, roster)
+    ece = store.create_or_get_daily_collection('ECE', '2023', '2025-02-03', 'B204', 'Teacher', roster)
+    store.update_student_attendance(cse, SESSION, prn, 'Present')
+    store.update_student_attendance(ece, SESSION, prn, 'Temporary Absent')
+    page, _ = store.get_student_history(prn)
+    assert sorted((r['department'], r['status']) for r in page) == [('CSE', 'Present'), ('ECE', 'Temporary Absent')]
+
+def test_export_iteration(store, roster):
+    prns = list(roster[0])
+    for date in ('2025-02-04', '2025-02-03'):
+        cn = new_day(store, roster, date)
+        store.update_student_attendance(cn, SESSION, prns[0], 'Present')
+        store.update_student_attendance(cn, 'Session 2', prns[1], 'Present')
+    days = export.iter_days(store, '2025-02-01', '2025-02-28', years=['TY'])
+    assert [d['date'] for d in days] == ['2025-02-03', '2025-02-04']
+    rows = list(export.iter_rows(store, days))
+    assert len(rows) == 2 * 2 * len(prns)
+    assert all(len(r) == len(export.EXPORT_COLUMNS) for r in rows)
+    present = [(r[0], r[4], r[5]) for r in rows if r[8] == 'Present']
+    assert present == [('2025-02-03', SESSION, prns[0]), ('2025-02-03', 'Session 2', prns[1]),
+                       ('2025-02-04', SESSION, prns[0]), ('2025-02-04', 'Session 2', prns[1])]
+    assert export.iter_days(store, '2025-02-01', '2025-02-28', departments=['ECE']) == []
+
+
+def write_elsewhere(store, cn, prn, status):
+    """Mark prn as another server process would: straight to the database, bypassing this process' mirrors"""
+    if isinstance(store, SQLiteStore):
+        other = SQLiteStore(store.path)
+        other.update_student_attendance(cn, SESSION, prn, status)
+        other.close()
+        return
+    day = store.db[cn]
+    sd = day.find_one({}, {f'sessions.{SESSION}': 1})['sessions'][SESSION]
+    counts = dict.fromkeys(STATUSES, 0)
+    for p, stu in sd['students'].items():
+        counts[status if p == prn else stu['status']] += 1
+    day.update_one({}, {'$set': {f'sessions.{SESSION}.students.{prn}.status': status,
+                                 f'sessions.{SESSION}.version': sd['version'] + 1,
+                                 f'sessions.{SESSION}.counts': counts}})
+
+
+def test_versions_and_summaries_follow_other_writers(store, roster):
+    cn = new_day(store, roster)
+    prns = list(roster[0])
+    store.update_student_attendance(cn, SESSION, prns[0], 'Present')
+    version = store.get_session_version(cn, SESSION)
+    assert store.get_session_summary(cn, SESSION)['present'] == 1
+    write_elsewhere(store, cn, prns[1], 'Present')
+    assert store.get_session_version(cn, SESSION) > version
+    assert store.get_day_versions(cn)[SESSION] == store.get_session_version(cn, SESSION)
+    assert store.get_session_summary(cn, SESSION)['present'] == 2
+
+
+def test_live_session_summary_comes_from_this_process(store, roster, monkeypatch):
+    if isinstance(store, SQLiteStore):
+        pytest.skip('the embedded store reads its counters from its own file')
+    server = pytest.importorskip('present_duration_added')
+    cn = new_day(store, roster)
+    store.update_student_attendance(cn, SESSION, next(iter(roster[0])), 'Present')
+    monkeypatch.setattr(server, 'attendance_system', SimpleNamespace(current_collection=cn, current_session=SESSION))
+    monkeypatch.setattr(server, 'camera_running', True)
+    monkeypatch.setattr(store, '_day', lambda *a, **k: pytest.fail('live session summary read the database'))
+    assert store.get_session_summary(cn, SESSION)['present'] == 1
+
+def test_legacy_record_converted_with_its_present_timer_running(store, roster):
+    if isinstance(store, SQLiteStore):
+        pytest.skip('the embedded store has stored intervals from the start')
+    cn = new_day(store, roster)
+    prn = next(iter(roster[0]))
+    store.update_student_attendance(cn, SESSION, prn, 'Present')
+    opened = (datetime.now() - timedelta(minutes=10)).strftime('%Y-%m-%d %H:%M:%S')
+    path = f'sessions.{SESSION}.students.{prn}'
+    store.db[cn].update_one({}, {'$unset': {f'{path}.intervals': '', f'{path}.updated': ''},
+                                 '$set': {f'{path}.timestamps': {'first_seen': opened, 'present_timer_start': opened},
+                                          f'{path}.durations': {'total_present_seconds': 60,
+                                                                'total_absent_seconds': 0}}})
+    store.update_student_attendance(cn, SESSION, prn, 'Temporary Absent')
+    row = next(r for r in store.get_session_attendance(cn, SESSION) if r['prn_no'] == prn)
+    assert 60 + 600 <= row['durations']['total_present_seconds'] <= 60 + 605
+    assert row['timestamps']['first_seen'] == opened
+
+def test_heatmap_covers_the_timetable_slot(store, roster):
+    server = pytest.importorskip('present_duration_added')
+    cn = new_day(store, roster)
+    store.update_student_attendance(cn, SESSION, next(iter(roster[0])), 'Present')
+    body, _ = server.session_heatmap(store, cn, SESSION, 300, None, '')
+    heatmap = json.loads(body)
+    assert heatmap['bins'][0] == '09:00' and heatmap['bins'][-1] == '09:55' and len(heatmap['bins']) == 12
+
+def test_archived_day_reads_from_any_directory(store, roster, tmp_path, monkeypatch):
+    if isinstance(store, SQLiteStore):
+        pytest.skip('the embedded store keeps every day in its one file')
+    server = pytest.importorskip('present_duration_added')
+    monkeypatch.setitem(server.ARCHIVE_CONFIG, 'dir', str(tmp_path / 'archive'))
+    cn = new_day(store, roster, '2020-01-06')
+    prn = next(iter(roster[0]))
+    store.update_student_attendance(cn, SESSION, prn, 'Present')
+    assert store.archive_days(older_than_days=1)['archived'] == 1
+    assert cn not in store.db.list_collection_names()
+    meta = store.db.lecture_metadata.find_one({'collection_name': cn})
+    assert meta['archive']['path'] == f'{cn}.npz'
+    elsewhere = tmp_path / 'elsewhere'
+    elsewhere.mkdir()
+    monkeypatch.chdir(elsewhere)
+    server.archived_days.clear()
+    row = next(r for r in store.get_session_attendance(cn, SESSION) if r['prn_no'] == prn)
+    assert row['status'] == 'Present'
+
+
+def test_day_that_does_not_read_back_is_not_dropped(store, roster, tmp_path, monkeypatch):
+    if isinstance(store, SQLiteStore):
+        pytest.skip('the embedded store keeps every day in its one file')
+    server = pytest.importorskip('present_duration_added')
+    monkeypatch.setitem(server.ARCHIVE_CONFIG, 'dir', str(tmp_path / 'archive'))
+    monkeypatch.setattr(server.archive, 'load_day', lambda path, sessions=None: {'roster': {}, 'sessions': {}})
+    cn = new_day(store, roster, '2020-01-06')
+    assert store.archive_days(older_than_days=1)['archived'] == 0
+    assert cn in store.db.list_collection_names()
+    assert 'archive' not in store.db.lecture_metadata.find_one({'collection_name': cn})
+    assert not os.listdir(tmp_path / 'archive')
@@ -0,0 +1,103 @@
+"""
+Response encoding for roster-sized payloads
+Columnar layout (one array per field, dictionary-coded statuses), fast JSON and negotiated compression
+"""
+
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# ?format values a roster response is encoded in; anything else is refused rather than answered with JSON
+LAYOUTS = ('json', 'columnar')
+# Human strings are derivable from the *_seconds columns, so the columnar layout leaves them out
+DERIVED_FIELDS = ('durations.total_present_human', 'durations.total_absent_human')
+
+
+def _flatten(row, prefix=''):
+    out = {}
+    for k, v in row.items():
+        if isinstance(v, dict):
+            out.update(_flatten(v, f'{prefix}{k}.'))
+        else:
+            out[f'{prefix}{k}'] = v
+    return out
+
+
+def columnar(rows, dicts=None, drop=DERIVED_FIELDS):
+    """
+    rows -> {'format': 'columnar', 'count', 'columns': {field: [...]}, 'dicts': {field: [...]}}
+    Nested keys become dotted column names; fields named in dicts are sent as indexes into
+    a value list seeded with the given values (unseen values are appended)
+    """
+    rows = [_flatten(r) for r in rows]
+    fields = []
+    seen = set(drop)
+    for r in rows:
+        for f in r:
+            if f not in seen:
+                seen.add(f)
+                fields.append(f)
+    columns = {f: [r.get(f) for r in rows] for f in fields}
+    out_dicts = {}
+    for f, seed in (dicts or {}).items():
+        if f not in columns:
+            continue
+        values = list(seed)
+        index = {v: i for i, v in enumerate(values)}
+        codes = []
+        for v in columns[f]:
+            if v not in index:
+                index[v] = len(values)
+                values.append(v)
+            codes.append(index[v])
+        columns[f] = codes
+        out_dicts[f] = values
+    return {'format': 'columnar', 'count': len(rows), 'columns': columns, 'dicts': out_dicts}
+
+
+def dumps(obj):
+    """JSON bytes; orjson when installed, otherwise the stdlib encoder with compact separators"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=str, separators=(',', ':')).encode()
+
+
+def negotiate(accept_encoding=''):
+    """The content coding compress() would use for a large enough body: 'br', 'gzip' or None"""
+    accepted = {c.split(';')[0].strip().lower() for c in (accept_encoding or '').split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body, accept_encoding=''):
+    """(body, content_encoding or None) using the best coding the client accepts"""
+    coding = negotiate(accept_encoding) if len(body) >= COMPRESS_MIN_BYTES else None
+    if coding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+    if coding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), 'gzip'
+    return body, None
+
+
+def encode(payload, accept_encoding=''):
+    """(body, headers) ready for a response object"""
+    body, coding = compress(dumps(payload), accept_encoding)
+    headers = {'Content-Type': 'application/json', 'Vary': 'Accept-Encoding'}
+    if coding:
+        headers['Content-Encoding'] = coding
+    return body, headers
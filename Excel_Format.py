@@ -2,13 +2,23 @@ from openpyxl.styles import Font, PatternFill, Border, Alignment
 from datetime import datetime, timedelta
 from openpyxl.utils import get_column_letter
 from openpyxl import load_workbook, Workbook
+import atexit
+import bisect
+import copy
+import os
+import threading
+import time
+import weakref
 
+from timetable import get_current_session
 
-# Load the workbook
 file_path = 'Book1.xlsx'  # Path to your attendance workbook
-workbook = load_workbook(file_path)
 
-def copy_cell_format(source_cell, target_cell):
+def copy_cell_format(source_cell, target_cell, share_styles=True):
+    if share_styles and source_cell.parent.parent is target_cell.parent.parent:
+        # Same workbook: share the source's style ids instead of registering new style objects
+        target_cell._style = copy.copy(source_cell._style)
+        return
     target_cell.font = Font(name=source_cell.font.name,
                             size=source_cell.font.size,
                             bold=source_cell.font.bold,
@@ -34,12 +44,53 @@ def copy_cell_format(source_cell, target_cell):
                                       shrink_to_fit=source_cell.alignment.shrink_to_fit,
                                       indent=source_cell.alignment.indent)
 
-def copy_merged_cells(source_sheet, target_sheet):
+class MergedCellMap:
+    """
+    (row, column) -> (min_row, min_col) of the merged range covering it, for every merged cell of a
+    sheet, so resolving a cell to its anchor is one dict lookup instead of a walk over every range.
+    Built once per sheet; rebuilt when the set of merged ranges differs from the one it was built from
+    (an unmerge followed by a merge included), and dropped by the helpers here that merge cells.
+    """
+
+    def __init__(self, sheet):
+        self.signature = _merged_signature(sheet)
+        self.anchors = {}
+        for merged_range in sheet.merged_cells.ranges:
+            anchor = (merged_range.min_row, merged_range.min_col)
+            for row in range(merged_range.min_row, merged_range.max_row + 1):
+                for col in range(merged_range.min_col, merged_range.max_col + 1):
+                    self.anchors[(row, col)] = anchor
+
+    def anchor(self, row, column):
+        return self.anchors.get((row, column), (row, column))
+
+
+def _merged_signature(sheet):
+    return frozenset((r.min_row, r.min_col, r.max_row, r.max_col) for r in sheet.merged_cells.ranges)
+
+
+_merged_maps = weakref.WeakKeyDictionary()  # sheet -> MergedCellMap, dropped with the sheet
+
+
+def get_merged_map(sheet):
+    merged = _merged_maps.get(sheet)
+    if merged is None or merged.signature != _merged_signature(sheet):
+        merged = _merged_maps[sheet] = MergedCellMap(sheet)
+    return merged
+
+
+def anchor_cell(sheet, row, column):
+    """The cell that holds the value and style of (row, column): itself, or its merged range's top-left"""
+    return sheet.cell(*get_merged_map(sheet).anchor(row, column))
+
+
+def copy_merged_cells(source_sheet, target_sheet, share_styles=True):
     for merged_range in source_sheet.merged_cells.ranges:
         target_sheet.merge_cells(str(merged_range))
-        first_cell = merged_range.start_cell
-        target_cell = target_sheet.cell(row=first_cell.row, column=first_cell.column)
-        copy_cell_format(source_sheet[first_cell.coordinate], target_cell)
+        target_cell = target_sheet.cell(row=merged_range.min_row, column=merged_range.min_col)
+        copy_cell_format(source_sheet.cell(row=merged_range.min_row, column=merged_range.min_col), target_cell,
+                         share_styles)
+    _merged_maps.pop(target_sheet, None)
 
 
 def get_or_create_today_sheet(workbook, source_sheet_name='Sheet 1'):
@@ -49,52 +100,187 @@ def get_or_create_today_sheet(workbook, source_sheet_name='Sheet 1'):
         print(f"Using existing sheet for today's date: {today_date}")
     else:
         source_sheet = workbook[source_sheet_name]
-        target_sheet = workbook.create_sheet(title=today_date)
+        target_sheet = clone_sheet(workbook, source_sheet, today_date)
         print(f"Creating new sheet for today's date: {today_date}")
+    
+    return target_sheet
 
-        # Copy headers and formats from source sheet
-        for column in source_sheet.columns:
-            col_letter = get_column_letter(column[0].column)
-            target_sheet.column_dimensions[col_letter].width = source_sheet.column_dimensions[col_letter].width
-            for source_cell in column:
-                target_cell = target_sheet.cell(row=source_cell.row, column=source_cell.column)
-                target_cell.value = source_cell.value
-                copy_cell_format(source_cell, target_cell)
 
-        copy_merged_cells(source_sheet, target_sheet)
-    
+def clone_sheet(workbook, source_sheet, title):
+    """
+    Copy of source_sheet named title, made by openpyxl's copy_worksheet: values, dimensions and merges
+    are copied in one pass and every cell keeps the source's style ids, so the style table does not grow.
+    """
+    target_sheet = workbook.copy_worksheet(source_sheet)
+    target_sheet.title = title
+    return target_sheet
+
+
+def copy_sheet_by_cell(workbook, source_sheet, title, share_styles=True):
+    """
+    Cell-by-cell copy, for sources in another workbook; share_styles=False rebuilds Font/Fill/Border/
+    Alignment objects for every cell as this module used to, for comparison with clone_sheet
+    """
+    target_sheet = workbook.create_sheet(title=title)
+    for column in source_sheet.columns:
+        col_letter = get_column_letter(column[0].column)
+        target_sheet.column_dimensions[col_letter].width = source_sheet.column_dimensions[col_letter].width
+        for source_cell in column:
+            target_cell = target_sheet.cell(row=source_cell.row, column=source_cell.column)
+            target_cell.value = source_cell.value
+            copy_cell_format(source_cell, target_cell, share_styles)
+    copy_merged_cells(source_sheet, target_sheet, share_styles)
     return target_sheet
 
 
 
-# Get or create today's sheet
-target_sheet = get_or_create_today_sheet(workbook)
+class AttendanceWorkbook:
+    """
+    The attendance workbook, loaded on first use rather than at import.
+    today_sheet() gets or creates the sheet for today's date (cloned from the template sheet).
+    """
+
+    def __init__(self, path=file_path, source_sheet_name='Sheet 1'):
+        self.path = path
+        self.source_sheet_name = source_sheet_name
+        self._workbook = None
+        self.lock = threading.Lock()
+
+    @property
+    def workbook(self):
+        with self.lock:
+            if self._workbook is None:
+                self._workbook = load_workbook(self.path)
+            return self._workbook
+
+    def today_sheet(self):
+        return get_or_create_today_sheet(self.workbook, self.source_sheet_name)
+
+    def writer(self, path="Attendance_updated.xlsx"):
+        return get_writer(self.workbook, path)
+
+
+attendance_workbook = AttendanceWorkbook()
+
+
+def __getattr__(name):
+    # `workbook` and `target_sheet` used to be loaded at import; they are now created when first used
+    if name == 'workbook':
+        return attendance_workbook.workbook
+    if name == 'target_sheet':
+        return attendance_workbook.today_sheet()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class SheetIndex:
+    """
+    One pass over a sheet, kept so lookups never rescan it:
+    - text: (row, column) -> upper-cased string value, for keyword searches
+    - column_a: row -> column-A value, for session end rows (the row before the next session or empty row)
+    - students: stripped column-4 name -> rows (matched exactly, as the cell-by-cell scan did)
+    Helpers that write cells report them through cells_written, which updates only what those cells touch.
+    """
+
+    NAME_COLUMN = 4
+
+    def __init__(self, sheet):
+        self.text = {}
+        self.column_a = {}
+        self.students = {}
+        self.names = {}
+        self.max_row = sheet.max_row
+        for row_num, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+            for col_num, value in enumerate(row, start=1):
+                if isinstance(value, str):
+                    self.text[(row_num, col_num)] = value.upper()
+            self.column_a[row_num] = row[0] if row else None
+            self._set_name(row_num, row[self.NAME_COLUMN - 1] if len(row) >= self.NAME_COLUMN else None)
+        self._ends = {}
+        self._keywords = {}
+
+    def keyword_rows(self, keyword):
+        """Rows with a cell containing keyword, once per matching cell, in sheet order"""
+        keyword = keyword.upper()
+        if keyword not in self._keywords:
+            self._keywords[keyword] = [r for (r, _), text in sorted(self.text.items()) if keyword in text]
+        return list(self._keywords[keyword])
+
+    def end_limit(self, start_row):
+        if start_row not in self._ends:
+            end = self.max_row
+            for row_num in range(start_row + 1, self.max_row + 1):
+                value = self.column_a.get(row_num)
+                if value is None or (isinstance(value, str) and "SESSION" in value.upper()):
+                    end = row_num - 1
+                    break
+            self._ends[start_row] = end
+        return self._ends[start_row]
+
+    def session_range(self, session_name):
+        """(start_row, end_row) of the first session whose column-A label contains session_name, or None"""
+        rows = [r for r in self.keyword_rows(session_name) if isinstance(self.column_a.get(r), str)
+                and session_name.upper() in self.column_a[r].upper()]
+        return (rows[0], self.end_limit(rows[0])) if rows else None
+
+    def student_rows(self, student_name, start_row=1, end_row=None):
+        end_row = self.max_row if end_row is None else end_row
+        return [r for r in self.students.get(str(student_name).strip(), []) if start_row <= r <= end_row]
+
+    def student_row(self, session_name, student_name):
+        """Row of student_name inside session_name's range, or None"""
+        bounds = self.session_range(session_name)
+        rows = self.student_rows(student_name, *bounds) if bounds else []
+        return rows[0] if rows else None
+
+    def _set_name(self, row, value):
+        old = self.names.pop(row, None)
+        if old is not None:
+            self.students[old].remove(row)
+            if not self.students[old]:
+                del self.students[old]
+        if isinstance(value, str) and value.strip():
+            self.names[row] = value.strip()
+            bisect.insort(self.students.setdefault(value.strip(), []), row)
+
+    def cells_written(self, *cells):
+        """
+        Bring the index up to date with cells just written: only keyword results those cells match (before or
+        after), their row's name entry, and (for column A or new rows) session ends are recomputed
+        """
+        for cell in cells:
+            key = (cell.row, cell.column)
+            old = self.text.get(key)
+            new = cell.value.upper() if isinstance(cell.value, str) else None
+            if new is None:
+                self.text.pop(key, None)
+            else:
+                self.text[key] = new
+            if old != new:
+                for keyword in [k for k in self._keywords if (old and k in old) or (new and k in new)]:
+                    del self._keywords[keyword]
+            if cell.row > self.max_row:
+                self.max_row = cell.row
+                self._ends.clear()
+            if cell.column == 1 and self.column_a.get(cell.row) != cell.value:
+                self.column_a[cell.row] = cell.value
+                self._ends.clear()
+            elif cell.column == self.NAME_COLUMN:
+                self._set_name(cell.row, cell.value)
+
+
+_indexes = weakref.WeakKeyDictionary()  # sheet -> SheetIndex, dropped with the sheet
+
+
+def get_index(sheet):
+    """The sheet's index, built on first use"""
+    index = _indexes.get(sheet)
+    if index is None:
+        index = _indexes[sheet] = SheetIndex(sheet)
+    return index
 
-def get_current_session():
-    now = datetime.now().time()
-    sessions = {
-        'Session 1': (datetime.strptime('09:00:00', '%H:%M:%S').time(), datetime.strptime('10:00:00', '%H:%M:%S').time()),
-        'Session 2': (datetime.strptime('10:00:01', '%H:%M:%S').time(), datetime.strptime('11:00:00', '%H:%M:%S').time()),
-        'Session 3': (datetime.strptime('11:00:01', '%H:%M:%S').time(), datetime.strptime('11:45:00', '%H:%M:%S').time()),
-        'Session 4': (datetime.strptime('11:45:01', '%H:%M:%S').time(), datetime.strptime('12:40:00', '%H:%M:%S').time()),
-        'Session 5': (datetime.strptime('12:40:01', '%H:%M:%S').time(), datetime.strptime('12:50:00', '%H:%M:%S').time()),
-        'Session 6': (datetime.strptime('12:50:01', '%H:%M:%S').time(), datetime.strptime('14:45:00', '%H:%M:%S').time()),
-        'Session 7': (datetime.strptime('14:45:01', '%H:%M:%S').time(), datetime.strptime('23:45:00', '%H:%M:%S').time()),
-    }
-    for session, (start, end) in sessions.items():
-        if start <= now <= end:
-            return session
-    return None
 
 def search_keyword_ranges(sheet, keyword):
-    keyword = keyword.upper()
-    keyword_rows = []
-    
-    for row_num, row in enumerate(sheet.iter_rows(values_only=True), start=1):
-        for cell_value in row:
-            if isinstance(cell_value, str) and keyword in cell_value.upper():
-                keyword_rows.append(row_num)
-    return keyword_rows
+    return get_index(sheet).keyword_rows(keyword)
 # def search_keyword_ranges(sheet, keyword):
 #     if not keyword:
 #         print("Keyword is None or empty. Please provide a valid keyword.")
@@ -122,6 +308,8 @@ def find_end_limit(sheet, keyword_start_row, keyword_column=1):
     Returns:
     - The row number where the session ends.
     """
+    if keyword_column == 1:
+        return get_index(sheet).end_limit(keyword_start_row)
     for row_num in range(keyword_start_row + 1, sheet.max_row + 1):
         cell_value = sheet.cell(row=row_num, column=keyword_column).value
         # Stop if the next keyword is found or if the row is empty
@@ -133,10 +321,8 @@ def find_end_limit(sheet, keyword_start_row, keyword_column=1):
 
 def get_top_left_cell(sheet, cell):
     """Get the top-left cell of the merged cell range for the given cell."""
-    for merged_range in sheet.merged_cells.ranges:
-        if cell.coordinate in merged_range:
-            return sheet.cell(merged_range.min_row, merged_range.min_col)
-    return cell
+    row, col = get_merged_map(sheet).anchor(cell.row, cell.column)
+    return cell if (row, col) == (cell.row, cell.column) else sheet.cell(row, col)
 
 # def update_student_info(sheet, student_name, last_seen_time, current_time, start_row, end_row,
 #                         status_column_offset, last_seen_column_offset, absence_timer_start_column_offset,
@@ -175,7 +361,95 @@ def get_top_left_cell(sheet, cell):
 #             break
 from openpyxl.styles import Font
 
-def update_student_info(sheet, student_name, last_seen_time, current_time, start_row, end_row,
+class BufferedWorkbookWriter:
+    """
+    Collects cell updates in the in-memory workbook and saves it only every flush_interval seconds,
+    every batch_size updates, or when the session changes or ends, instead of on every face event.
+    Saves go to a temp file in the same directory that is then renamed over the target, so a crash
+    mid-save leaves the previous workbook intact.
+    """
+
+    def __init__(self, workbook, path="Attendance_updated.xlsx", flush_interval=5.0, batch_size=50):
+        self.workbook = workbook
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = 0
+        self.first_pending = None
+        self.session = None
+        self.lock = threading.RLock()
+        self.stopped = threading.Event()
+        self.flusher = threading.Thread(target=self._run, daemon=True)
+        self.flusher.start()
+
+    def update(self, apply):
+        """Run apply() (which edits cells of the workbook) under the writer's lock and count it"""
+        with self.lock:
+            session = get_current_session()
+            if self.pending and session != self.session:
+                self.flush()
+            self.session = session
+            result = apply()
+            self.pending += 1
+            if self.first_pending is None:
+                self.first_pending = time.monotonic()
+            if self.pending >= self.batch_size:
+                self.flush()
+            return result
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return False
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, 'wb') as f:
+                    self.workbook.save(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                print(f"Workbook saved successfully ({self.pending} updates).")
+                self.pending, self.first_pending = 0, None
+                return True
+            except Exception as e:
+                print(f"Error saving workbook: {e}")
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                return False
+
+    def _run(self):
+        while not self.stopped.wait(min(1.0, self.flush_interval)):
+            with self.lock:
+                due = self.first_pending is not None and time.monotonic() - self.first_pending >= self.flush_interval
+            if due:
+                self.flush()
+
+    def close(self):
+        """End of session: write anything still pending and stop the flusher"""
+        self.stopped.set()
+        self.flush()
+
+
+# workbook -> BufferedWorkbookWriter. A writer keeps its workbook (and so its entry) until end_session
+# closes it, so pending updates are never lost; weak keys only stop a new workbook from reusing a stale entry.
+_writers = weakref.WeakKeyDictionary()
+
+
+def get_writer(workbook, path="Attendance_updated.xlsx"):
+    if workbook not in _writers:
+        _writers[workbook] = BufferedWorkbookWriter(workbook, path)
+    return _writers[workbook]
+
+
+@atexit.register
+def end_session():
+    """Flush every buffered workbook (also run at interpreter exit)"""
+    for writer in list(_writers.values()):
+        writer.close()
+    _writers.clear()
+
+
+def _apply_student_info(sheet, student_name, last_seen_time, current_time, start_row, end_row,
                         status_column_offset, last_seen_column_offset, absence_timer_start_column_offset,
                         status=None, update_absence_timer=True, time_in_seconds=None):
     """
@@ -184,74 +458,81 @@ def update_student_info(sheet, student_name, last_seen_time, current_time, start
     """
     print(f"Updating student info for {student_name}...")
 
-    # Locate the row for the student
+    # Locate the row for the student from the sheet index rather than scanning column 4
+    index = get_index(sheet)
     student_found = False
-    for row in range(start_row, end_row + 1):
-        student_cell_value = sheet.cell(row=row, column=4).value
-        print(f"Checking row {row}, student: {student_cell_value}")  # Debugging line
-
-        # Strip any leading/trailing spaces and compare
-        if student_cell_value and student_cell_value.strip() == student_name.strip():
-            student_found = True
-            # Update status
-            status_cell = sheet.cell(row=row, column=4 + status_column_offset)
-            if status:
-                # status_cell.value = status
-                print(status_cell.value)
-                if status == "Temporary Absent":
-                    status_cell.font = Font(color="FFA500")  # Orange
-                    status_cell.value = status
-                elif status == "Permanently Absent":
-                    status_cell.font = Font(color="FF0000")  # Red
-                    status_cell.value = status
-                elif status == "Present":
-                    status_cell.font = Font(color="00FF00")  # Green
-                    status_cell.value = status
-                else:
-                    status_cell.font = Font(color="000000")  # Default color for other statuses
-
-            # Update last seen time
-            last_seen_cell = sheet.cell(row=row, column=3 + last_seen_column_offset)
-            last_seen_cell.value = last_seen_time.strftime("%H:%M:%S") if last_seen_time else "N/A"
+    for row in index.student_rows(student_name, start_row, end_row):
+        student_found = True
+        # Update status
+        status_cell = anchor_cell(sheet, row, 4 + status_column_offset)
+        if status:
+            # status_cell.value = status
+            print(status_cell.value)
+            if status == "Temporary Absent":
+                status_cell.font = Font(color="FFA500")  # Orange
+                status_cell.value = status
+            elif status == "Permanently Absent":
+                status_cell.font = Font(color="FF0000")  # Red
+                status_cell.value = status
+            elif status == "Present":
+                status_cell.font = Font(color="00FF00")  # Green
+                status_cell.value = status
+            else:
+                status_cell.font = Font(color="000000")  # Default color for other statuses
+
+        # Update last seen time
+        last_seen_cell = anchor_cell(sheet, row, 3 + last_seen_column_offset)
+        last_seen_cell.value = last_seen_time.strftime("%H:%M:%S") if last_seen_time else "N/A"
+        if status == "Present":
+            last_seen_cell.font = Font(color="00FF00")  # Green
+        elif status == "Temporary Absent":
+            last_seen_cell.font = Font(color="FFA500")  # Orange
+        elif status == "Permanently Absent":
+            last_seen_cell.font = Font(color="FF0000")  # Red
+        else:
+            last_seen_cell.font = Font(color="000000")  # Default color
+
+        # Update absence timer start time
+        absence_timer_start_cell = anchor_cell(sheet, row, 3 + absence_timer_start_column_offset)
+        if update_absence_timer:
+            absence_timer_start_cell.value = current_time.strftime("%H:%M:%S")
+        else:
+            # Only update the timer if it's not being reset
+            absence_timer_start_cell.value = absence_timer_start_cell.value
+
+        # Update absence timer duration if provided
+        if time_in_seconds is not None:
+            timer_duration_cell = anchor_cell(sheet, row, 3 + absence_timer_start_column_offset + 1)  # Assuming next column
+            timer_duration_cell.value = f"{time_in_seconds} seconds"
+            # Change font color based on status
             if status == "Present":
-                last_seen_cell.font = Font(color="00FF00")  # Green
+                timer_duration_cell.font = Font(color="00FF00")  # Green
             elif status == "Temporary Absent":
-                last_seen_cell.font = Font(color="FFA500")  # Orange
+                timer_duration_cell.font = Font(color="FFA500")  # Orange
             elif status == "Permanently Absent":
-                last_seen_cell.font = Font(color="FF0000")  # Red
+                timer_duration_cell.font = Font(color="FF0000")  # Red
             else:
-                last_seen_cell.font = Font(color="000000")  # Default color
+                timer_duration_cell.font = Font(color="000000")  # Default color
 
-            # Update absence timer start time
-            absence_timer_start_cell = sheet.cell(row=row, column=3 + absence_timer_start_column_offset)
-            if update_absence_timer:
-                absence_timer_start_cell.value = current_time.strftime("%H:%M:%S")
-            else:
-                # Only update the timer if it's not being reset
-                absence_timer_start_cell.value = absence_timer_start_cell.value
-
-            # Update absence timer duration if provided
-            if time_in_seconds is not None:
-                timer_duration_cell = sheet.cell(row=row, column=3 + absence_timer_start_column_offset + 1)  # Assuming next column
-                timer_duration_cell.value = f"{time_in_seconds} seconds"
-                # Change font color based on status
-                if status == "Present":
-                    timer_duration_cell.font = Font(color="00FF00")  # Green
-                elif status == "Temporary Absent":
-                    timer_duration_cell.font = Font(color="FFA500")  # Orange
-                elif status == "Permanently Absent":
-                    timer_duration_cell.font = Font(color="FF0000")  # Red
-                else:
-                    timer_duration_cell.font = Font(color="000000")  # Default color
-
-            break
+        index.cells_written(status_cell, last_seen_cell, absence_timer_start_cell,
+                            *([timer_duration_cell] if time_in_seconds is not None else []))
+        break
 
     if not student_found:
         print(f"Student {student_name} not found in the specified range.")
 
-    # Save the workbook
-    try:
-        sheet.parent.save("Attendance_updated.xlsx")  # Replace with the actual file name
-        print("Workbook saved successfully.")
-    except Exception as e:
-        print(f"Error saving workbook: {e}")
+    return student_found
+
+
+def update_student_info(sheet, student_name, last_seen_time, current_time, start_row, end_row,
+                        status_column_offset, last_seen_column_offset, absence_timer_start_column_offset,
+                        status=None, update_absence_timer=True, time_in_seconds=None, writer=None):
+    """
+    Updates the student's row in memory; the workbook is saved by its BufferedWorkbookWriter
+    (the default one for sheet.parent unless writer is given), not on every call.
+    """
+    writer = writer or get_writer(sheet.parent)
+    return writer.update(lambda: _apply_student_info(
+        sheet, student_name, last_seen_time, current_time, start_row, end_row, status_column_offset,
+        last_seen_column_offset, absence_timer_start_column_offset, status, update_absence_timer,
+        time_in_seconds))
@@ -0,0 +1,79 @@
+"""
+SheetIndex and MergedCellMap stay equal to a fresh scan of the sheet as the update helpers write to it.
+Run: python -m pytest -q test_excel_format.py
+"""
+
+import gc
+import weakref
+from datetime import datetime
+
+import pytest
+
+openpyxl = pytest.importorskip('openpyxl')
+
+import Excel_Format  # noqa: E402
+
+
+def make_sheet():
+    ws = openpyxl.Workbook().active
+    for r, label in ((1, 'Session 1'), (6, 'Session 2')):
+        ws.cell(r, 1, label)
+        for i, name in enumerate(('ASHA PATIL', 'RAVI KUMAR ', 'asha patil'), start=1):
+            ws.cell(r + i, 1, i)
+            ws.cell(r + i, 4, name)
+    return ws
+
+
+def snapshot(index):
+    column_a = {r: v for r, v in index.column_a.items() if v is not None}  # blank rows read back as None either way
+    return (index.text, column_a, index.students, index.max_row,
+            [index.end_limit(r) for r in (1, 6)], index.keyword_rows('session'), index.keyword_rows('present'))
+
+
+def write(ws, name, status, offset, session_rows=(1, 5)):
+    now = datetime(2025, 2, 3, 10, 15)
+    return Excel_Format._apply_student_info(ws, name, now, now, *session_rows, offset, 2, 3, status,
+                                            time_in_seconds=12)
+
+
+@pytest.mark.parametrize('status_offset', [0, 5])
+def test_index_matches_a_rebuild_after_writes(status_offset):
+    ws = make_sheet()
+    index = Excel_Format.get_index(ws)
+    assert index.keyword_rows('present') == []
+    assert write(ws, 'RAVI KUMAR', 'Present', status_offset)
+    assert write(ws, 'ASHA PATIL', 'Temporary Absent', status_offset, (6, 10))
+    ws.cell(12, 1, 'Session 3')
+    index.cells_written(ws.cell(12, 1))
+    assert Excel_Format.get_index(ws) is index
+    assert snapshot(index) == snapshot(Excel_Format.SheetIndex(ws))
+
+
+def test_names_match_after_strip_only():
+    ws = make_sheet()
+    index = Excel_Format.get_index(ws)
+    assert index.student_rows(' RAVI KUMAR') == [3, 8]
+    assert index.student_rows('ASHA PATIL') == [2, 7]
+    assert index.student_rows('Asha Patil') == []
+    assert index.student_rows('RAVI  KUMAR') == []
+
+
+def test_caches_are_dropped_with_the_sheet():
+    ws = make_sheet()
+    Excel_Format.get_index(ws)
+    Excel_Format.get_merged_map(ws)
+    assert ws in Excel_Format._indexes and ws in Excel_Format._merged_maps
+    sheet = weakref.ref(ws)
+    del ws
+    gc.collect()
+    assert sheet() is None
+
+
+def test_merged_map_follows_unmerge_then_merge():
+    ws = make_sheet()
+    ws.merge_cells('B2:C2')
+    assert Excel_Format.anchor_cell(ws, 2, 3).coordinate == 'B2'
+    ws.unmerge_cells('B2:C2')
+    ws.merge_cells('E3:F3')  # same number of ranges as before
+    assert Excel_Format.anchor_cell(ws, 2, 3).coordinate == 'C2'
+    assert Excel_Format.anchor_cell(ws, 3, 6).coordinate == 'E3'
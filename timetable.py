@@ -0,0 +1,36 @@
+"""
+Lecture timetable: which session a time of day falls in
+Plain data and stdlib only, so importing it never touches a workbook.
+"""
+
+from datetime import datetime, time, timedelta
+
+# Start of each session; a session runs until the next one starts (start <= now < next start).
+# Hourly from 09:00, as the servers have always recorded: anything before 09:00 counts as Session 1,
+# and Session 8 runs from 16:00 to the end of the day.
+SESSIONS = {f'Session {i}': time(8 + i) for i in range(1, 9)}
+
+
+def get_current_session(now=None):
+    """Name of the session running at now (a datetime or time, default the current time); never None"""
+    now = now or datetime.now()
+    if isinstance(now, datetime):
+        now = now.time()
+    current = next(iter(SESSIONS))
+    for session, start in SESSIONS.items():
+        if now < start:
+            break
+        current = session
+    return current
+
+
+def session_bounds(session, date):
+    """[start, end) datetimes of session on date ('YYYY-MM-DD'), or None for an unknown session"""
+    if session not in SESSIONS:
+        return None
+    day = datetime.strptime(date, '%Y-%m-%d')
+    names = list(SESSIONS)
+    start = datetime.combine(day, SESSIONS[session])
+    i = names.index(session) + 1
+    end = datetime.combine(day, SESSIONS[names[i]]) if i < len(names) else day + timedelta(days=1)
+    return start, end